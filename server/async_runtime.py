@@ -0,0 +1,131 @@
+"""
+常驻异步运行时: Web 服务的所有部署协程在同一个后台事件循环中执行
+
+Playwright 对象、浏览器池、构建合并(singleflight)等异步资源都绑定创建它们的事件循环,
+因此 Web 服务只创建一个事件循环,在服务生命周期内一直运行:
+
+- Flask 请求处理线程通过 submit() 线程安全地提交协程,立即返回 concurrent.futures.Future
+- call() 提交协程并等待结果(不能在事件循环线程中调用)
+- 长期存在的资源通过 add_shutdown_hook() 注册关闭协程; shutdown() 先取消仍在运行的协程
+  (如进行中的部署),再按注册的相反顺序执行关闭协程,最后停止事件循环
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+from utils import log
+
+
+class AsyncRuntime:
+    """在后台线程中运行的常驻事件循环(线程安全)"""
+
+    def __init__(self, name: str = 'async-runtime'):
+        """
+        Args:
+            name: 事件循环线程名
+        """
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._hooks: List[Callable[[], Awaitable[Any]]] = []
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """事件循环(首次访问时启动)"""
+        return self.start()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """启动事件循环线程(重复调用无副作用)"""
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} 已关闭")
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_exception_handler(self._handle_exception)
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(loop, ready), name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def _run(self, loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    @staticmethod
+    def _handle_exception(loop: asyncio.AbstractEventLoop, context: dict):
+        """未被等待的协程抛出的异常记录到日志,不让它们静默消失"""
+        error = context.get('exception')
+        log(f"后台协程异常: {context.get('message')} {str(error) if error else ''}".strip(), "ERROR")
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """提交协程(立即返回 Future)"""
+        try:
+            loop = self.start()
+        except RuntimeError:
+            coro.close()
+            raise
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def call(self, coro: Awaitable[Any], timeout: float = None) -> Any:
+        """
+        提交协程并等待结果
+
+        Raises:
+            RuntimeError: 在事件循环线程中调用(会导致死锁)
+            concurrent.futures.TimeoutError: 超时(协程会被取消)
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("不能在事件循环线程中同步等待协程")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]):
+        """注册关闭时执行的协程函数(如 browser_pool.close)"""
+        with self._lock:
+            if hook not in self._hooks:
+                self._hooks.append(hook)
+
+    def shutdown(self, timeout: float = 10):
+        """取消仍在运行的协程,执行关闭协程并停止事件循环"""
+        with self._lock:
+            if self._stopped or self._loop is None:
+                self._stopped = True
+                return
+            self._stopped = True
+            loop, hooks = self._loop, list(reversed(self._hooks))
+
+        async def stop():
+            # 先取消进行中的部署,避免它们在资源关闭后继续使用浏览器
+            current = asyncio.current_task()
+            pending = [task for task in asyncio.all_tasks() if task is not current]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for hook in hooks:
+                try:
+                    await asyncio.wait_for(hook(), timeout)
+                except Exception as e:
+                    log(f"关闭异步资源失败: {str(e)}", "WARNING")
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout * 2)
+        except Exception as e:
+            log(f"关闭事件循环超时: {str(e)}", "WARNING")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            loop.close()
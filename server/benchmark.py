@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+离线端到端基准测试: 不访问真实控制台,测量自动化流程各步骤的耗时
+
+启动本地模拟的云效流水线页面 (mock_yunxiao) 和 Kuboard Deployment 页面 (mock_k8s),
+按可配置的人工延迟驱动 TaskScheduler.execute_all 多次,根据 tracing 记录的 span
+输出每个步骤的耗时(中位数/最小/最大),并可与保存的基线比较,发现性能回归。
+
+使用方法:
+    # 运行 5 次并输出各步骤耗时
+    python benchmark.py --runs 5
+
+    # 保存为基线
+    python benchmark.py --runs 5 --save-baseline
+
+    # 与基线比较(有步骤变慢超过阈值时退出码为 1,可用于 CI)
+    python benchmark.py --runs 5 --compare
+
+    # 测量 http 模式 / API 模式
+    python benchmark.py --yunxiao-mode http --k8s-mode api
+
+    # 检查版本号缓存: 第一次运行之后的"最近构建"部署不应再访问云效(否则退出码为 2)
+    python benchmark.py --skip-build --tag-cache
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+import config
+import mock_k8s
+import mock_yunxiao
+from task_scheduler import TaskScheduler, DEPLOY_TASKS, create_deploy_tasks
+
+# 各项目在模拟服务中的流水线 ID / Deployment 名称(与默认 tag_pattern 中的镜像名一致)
+BENCH_PROJECTS = {
+    'frontend': 'jpms-web',
+    'backend': 'spms-server',
+}
+
+BENCH_NAMESPACE = 'bench'
+BENCH_REGISTRY_PREFIX = f"{config.IMAGE_REGISTRY}/{config.IMAGE_NAMESPACE}"
+
+# 端到端耗时在结果中的名称
+TOTAL_STEP = 'total'
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_mocks(args) -> Tuple[str, str, list, mock_yunxiao.MockPipelineState]:
+    """
+    启动模拟服务
+
+    Returns:
+        (云效地址, K8s 地址, 服务列表, 模拟流水线状态)
+    """
+    pipeline_state = mock_yunxiao.MockPipelineState(
+        build_seconds=args.build_seconds,
+        page_delay_ms=args.page_delay_ms,
+        dialog_delay_ms=args.dialog_delay_ms,
+        log_delay_ms=args.log_delay_ms,
+        pipeline_projects={name: name for name in BENCH_PROJECTS.values()},
+    )
+    # 预置一次已完成的构建,供"使用最近构建"模式读取
+    for name in BENCH_PROJECTS.values():
+        pipeline_state.start_run(name)['startTime'] -= args.build_seconds
+    yunxiao_server, _ = mock_yunxiao.start_server(port=_free_port(), state=pipeline_state)
+
+    cluster_state = mock_k8s.MockClusterState(
+        latency_ms=args.k8s_latency_ms,
+        page_delay_ms=args.page_delay_ms,
+        dialog_delay_ms=args.dialog_delay_ms,
+    )
+    for name in BENCH_PROJECTS.values():
+        cluster_state.add(BENCH_NAMESPACE, name, f"{BENCH_REGISTRY_PREFIX}/{name}:dev-2000-01-01-00-00-00")
+    k8s_server, _ = mock_k8s.start_server(port=_free_port(), state=cluster_state)
+
+    yunxiao_base = 'http://127.0.0.1:%d' % yunxiao_server.server_address[1]
+    k8s_base = 'http://127.0.0.1:%d' % k8s_server.server_address[1]
+    return yunxiao_base, k8s_base, [yunxiao_server, k8s_server], pipeline_state
+
+
+def configure(args, yunxiao_base: str, k8s_base: str, workdir: str):
+    """把 config 指向模拟服务(只修改当前进程内的配置)"""
+    config.HEADLESS = not args.headed
+    config.YUNXIAO_MODE = args.yunxiao_mode
+    config.YUNXIAO_API_BASE = yunxiao_base
+    config.YUNXIAO_API_POLL_INTERVAL = 0.5
+    config.K8S_MODE = args.k8s_mode
+    config.TAG_CACHE_ENABLED = args.tag_cache
+    config.TAG_CACHE_FILE = os.path.join(workdir, 'tag_cache.json')
+    config.TRACE_ENABLED = False
+    config.SCREENSHOT_DIR = os.path.join(workdir, 'screenshots')
+    config.LOG_DIR = os.path.join(workdir, 'logs')
+    config.AUTH_FILE = os.path.join(workdir, 'auth.json')
+
+    for project, image_name in BENCH_PROJECTS.items():
+        envs = config.FRONTEND_CONFIG if project == 'frontend' else config.BACKEND_CONFIG
+        for env, env_config in envs.items():
+            env_config['yunxiao_url'] = f"{yunxiao_base}/pipelines/{image_name}"
+            if env == 'build':
+                continue
+            k8s_url = f"{k8s_base}/kuboard/k/namespace/{BENCH_NAMESPACE}/workload/view/Deployment/{image_name}"
+            env_config.update(
+                k8s_url=k8s_url,
+                k8s_targets=[k8s_url],
+                k8s_username='admin',
+                k8s_password='admin',
+                k8s_api_server=k8s_base,
+                k8s_api_token=mock_k8s.DEFAULT_TOKEN,
+                k8s_kubeconfig='',
+            )
+
+
+def reset_auth(workdir: str):
+    """每次运行前恢复初始登录状态: 已登录云效,未登录 Kuboard(每次运行都包含 Kuboard 登录步骤)"""
+    mock_yunxiao.write_auth_file(config.AUTH_FILE)
+    shutil.rmtree(config.SCREENSHOT_DIR, ignore_errors=True)
+
+
+async def run_once(task_ids: List[str], run_build: bool, verbose: bool) -> Dict[str, float]:
+    """
+    执行一次部署
+
+    Returns:
+        步骤名 -> 本次运行中该步骤的累计耗时(秒),包含端到端耗时 TOTAL_STEP
+
+    Raises:
+        Exception: 有任务未成功时抛出
+    """
+    log_callback = (lambda message, level="INFO": print(f"[{level}] {message}")) if verbose else (lambda *a: None)
+    scheduler = TaskScheduler(log_callback=log_callback, browser_pool=None)
+    # 与 Web 服务相同的方式创建任务(含构建任务与部署任务之间的依赖)
+    for task in create_deploy_tasks([{'task_id': task_id, 'run_build': run_build} for task_id in task_ids]):
+        scheduler.add_task(task)
+
+    output = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+        await scheduler.execute_all()
+    elapsed = time.perf_counter() - started
+
+    failed = [task for task in scheduler.tasks if task.status != 'success']
+    if failed:
+        details = '; '.join(f"{task.task_id}: {task.error_message}" for task in failed)
+        raise Exception(f"基准测试运行失败: {details}")
+
+    steps: Dict[str, float] = {TOTAL_STEP: elapsed}
+    for s in scheduler.tracer.spans:
+        steps[s.name] = steps.get(s.name, 0) + (s.duration or 0)
+    return steps
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """各步骤的中位数/最小/最大耗时"""
+    names = sorted({name for sample in samples for name in sample})
+    result = {}
+    for name in names:
+        values = [sample[name] for sample in samples if name in sample]
+        result[name] = {
+            'median': statistics.median(values),
+            'min': min(values),
+            'max': max(values),
+            'runs': len(values),
+        }
+    return result
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float, min_delta: float) -> List[str]:
+    """
+    比较中位数耗时
+
+    Returns:
+        回归的步骤名(比基线慢超过 threshold 比例且超过 min_delta 秒)
+    """
+    regressions = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        delta = stats['median'] - base['median']
+        if delta > min_delta and delta > base['median'] * threshold:
+            regressions.append(name)
+    return regressions
+
+
+def print_report(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]] = None,
+                 regressions: List[str] = ()):
+    """输出步骤耗时表(按中位数从大到小,端到端耗时在最后)"""
+    baseline = baseline or {}
+    rows = sorted((name for name in current if name != TOTAL_STEP), key=lambda n: -current[n]['median'])
+    rows.append(TOTAL_STEP)
+
+    header = f"{'step':<30}{'median':>10}{'min':>10}{'max':>10}"
+    if baseline:
+        header += f"{'baseline':>10}{'change':>10}"
+    print(header)
+    print('-' * len(header))
+    for name in rows:
+        stats = current[name]
+        line = f"{name:<30}{stats['median']:>10.3f}{stats['min']:>10.3f}{stats['max']:>10.3f}"
+        base = baseline.get(name)
+        if base:
+            change = (stats['median'] - base['median']) / base['median'] * 100 if base['median'] else 0
+            line += f"{base['median']:>10.3f}{change:>+9.1f}%"
+            if name in regressions:
+                line += '  ⚠️ 回归'
+        elif baseline:
+            line += f"{'-':>10}{'new':>10}"
+        print(line)
+
+
+def _settings(args) -> Dict:
+    """影响耗时的参数(与基线不一致时比较结果没有意义)"""
+    return {
+        'tasks': args.tasks,
+        'run_build': not args.skip_build,
+        'tag_cache': args.tag_cache,
+        'yunxiao_mode': args.yunxiao_mode,
+        'k8s_mode': args.k8s_mode,
+        'build_seconds': args.build_seconds,
+        'page_delay_ms': args.page_delay_ms,
+        'dialog_delay_ms': args.dialog_delay_ms,
+        'log_delay_ms': args.log_delay_ms,
+        'k8s_latency_ms': args.k8s_latency_ms,
+    }
+
+
+async def run_benchmark(args) -> Dict[str, Dict[str, float]]:
+    yunxiao_base, k8s_base, servers, pipeline_state = start_mocks(args)
+    workdir = tempfile.mkdtemp(prefix='deploy-bench-')
+    configure(args, yunxiao_base, k8s_base, workdir)
+    print(f"模拟云效: {yunxiao_base}  模拟 Kuboard: {k8s_base}")
+    print(f"任务: {', '.join(args.tasks)}  运行 {args.runs} 次 (另有 {args.warmup} 次预热)")
+
+    samples = []
+    try:
+        for i in range(args.warmup + args.runs):
+            reset_auth(workdir)
+            requests_before = pipeline_state.requests
+            steps = await run_once(args.tasks, not args.skip_build, args.verbose)
+            yunxiao_requests = pipeline_state.requests - requests_before
+            # 第一次运行写入版本号缓存,之后的"最近构建"部署应直接复用
+            if args.tag_cache and args.skip_build and i > 0 and yunxiao_requests:
+                raise Exception(f"版本号缓存未生效: 第 {i + 1} 次运行仍向云效发送了 {yunxiao_requests} 个请求")
+            if i < args.warmup:
+                print(f"预热 {i + 1}: {steps[TOTAL_STEP]:.2f}秒 (云效请求 {yunxiao_requests} 个)")
+                continue
+            samples.append(steps)
+            print(f"第 {len(samples)} 次: {steps[TOTAL_STEP]:.2f}秒 (云效请求 {yunxiao_requests} 个)")
+    finally:
+        for server in servers:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线端到端基准测试(模拟云效与 Kuboard 页面)')
+    parser.add_argument('--runs', type=int, default=3, help='计入统计的运行次数')
+    parser.add_argument('--warmup', type=int, default=1, help='不计入统计的预热次数')
+    parser.add_argument('--tasks', nargs='+', default=['frontend-test'], choices=sorted(DEPLOY_TASKS))
+    parser.add_argument('--skip-build', action='store_true', help='不触发构建,使用最近一次构建')
+    parser.add_argument('--tag-cache', action='store_true',
+                        help='启用版本号缓存; 与 --skip-build 一起使用时检查第一次之后的运行不访问云效')
+    parser.add_argument('--yunxiao-mode', choices=['browser', 'http'], default='browser')
+    parser.add_argument('--k8s-mode', choices=['ui', 'api'], default='ui')
+    parser.add_argument('--build-seconds', type=float, default=2, help='模拟构建耗时(秒)')
+    parser.add_argument('--page-delay-ms', type=float, default=200, help='页面及页面数据接口的响应延迟(毫秒)')
+    parser.add_argument('--dialog-delay-ms', type=float, default=100, help='弹窗打开前的延迟(毫秒)')
+    parser.add_argument('--log-delay-ms', type=float, default=200, help='构建日志接口的响应延迟(毫秒)')
+    parser.add_argument('--k8s-latency-ms', type=float, default=50, help='Kubernetes 接口的响应延迟(毫秒)')
+    parser.add_argument('--baseline', default='bench_baseline.json', help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--compare', action='store_true', help='与基线比较,有回归时退出码为 1')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定回归的变慢比例 (默认 0.2 即 20%%)')
+    parser.add_argument('--min-delta', type=float, default=0.1, help='判定回归的最小变慢秒数,过滤抖动')
+    parser.add_argument('--headed', action='store_true', help='显示浏览器窗口')
+    parser.add_argument('--verbose', action='store_true', help='输出自动化过程日志')
+    args = parser.parse_args()
+
+    if args.runs < 1:
+        parser.error('--runs 至少为 1')
+
+    try:
+        current = asyncio.run(run_benchmark(args))
+    except Exception as e:
+        print(f"❌ {str(e)}")
+        sys.exit(2)
+
+    settings = _settings(args)
+    baseline, regressions = None, []
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"❌ 基线文件不存在: {args.baseline} (先使用 --save-baseline 生成)")
+            sys.exit(2)
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('settings') != settings:
+            print(f"⚠️ 基线的测试参数与本次不同,比较结果仅供参考: {saved.get('settings')}")
+        baseline = saved.get('steps', {})
+        regressions = compare(current, baseline, args.threshold, args.min_delta)
+
+    print()
+    print_report(current, baseline, regressions)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'settings': settings,
+                'steps': current,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n已保存基线: {args.baseline}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} 个步骤比基线慢: {', '.join(regressions)}")
+        sys.exit(1)
+    if args.compare:
+        print("\n✅ 未发现性能回归")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+浏览器池: 在 Web 服务生命周期内复用预热好的浏览器和上下文
+
+- 浏览器启动、加载 auth.json、云效 SPA 首次加载的开销只在创建时付出一次
+- 每个任务从池中租用一个独立的浏览器上下文(及其页面),用完归还
+- 槽位被使用 N 次或页面 JS 堆内存超过阈值后,在后台关闭并重建浏览器和上下文
+
+注意: Playwright 对象绑定创建它的事件循环,池必须在同一个常驻事件循环中创建和使用。
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+import config
+import har
+from metrics import BROWSER_LAUNCHES
+from resource_blocker import ResourceBlocker, BlockStats
+from utils import log
+
+
+async def launch_browser(playwright: Playwright) -> Browser:
+    """按配置启动 Chromium"""
+    browser = await playwright.chromium.launch(
+        headless=config.HEADLESS,
+        args=['--headless=new'] if config.HEADLESS else []
+    )
+    BROWSER_LAUNCHES.inc()
+    return browser
+
+
+async def new_automation_context(
+    browser: Browser,
+    blocker: Optional[ResourceBlocker] = None,
+    har_suffix: Optional[str] = None,
+) -> BrowserContext:
+    """
+    创建自动化使用的浏览器上下文
+
+    如果存在 config.AUTH_FILE,则加载其中保存的登录状态;
+    启用 HAR_MODE 时注册 HAR 录制/回放路由(har_suffix 区分录制文件);
+    提供 blocker 时在上下文上注册资源拦截路由
+    """
+    context_options = {}
+    if os.path.exists(config.AUTH_FILE):
+        context_options['storage_state'] = config.AUTH_FILE
+
+    context = await browser.new_context(**context_options)
+    context.set_default_timeout(config.OPERATION_TIMEOUT)
+    await har.install(context, har_suffix)
+    if blocker:
+        await blocker.install(context)
+    return context
+
+
+# 并行任务共用同一个登录状态文件,保存时串行写入
+_auth_file_lock = threading.Lock()
+
+
+async def save_auth_state(context: BrowserContext, path: str = None):
+    """
+    保存上下文的登录状态到 config.AUTH_FILE
+
+    先写临时文件再原子替换: 并行任务(或其他进程)同时保存时,
+    读取方看到的总是某一次完整的登录状态,文件不会被交错写坏
+    """
+    path = path or config.AUTH_FILE
+    state = await context.storage_state()
+    directory = os.path.dirname(os.path.abspath(path))
+    with _auth_file_lock:
+        fd, tmp_path = tempfile.mkstemp(prefix='.auth_', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class PooledBrowser:
+    """池中的一个槽位: 一个浏览器 + 一个上下文 + 一个常驻页面"""
+
+    def __init__(self, slot_id: int):
+        self.slot_id = slot_id
+        self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
+        self.page: Optional[Page] = None
+        self.blocker: Optional[ResourceBlocker] = None
+        self.block_mark = BlockStats()  # 本次租用开始时的拦截统计快照
+        self.uses = 0
+        self.har_suffixes: List[str] = []  # HAR 录制文件后缀,每次重建上下文写入新文件
+
+    @property
+    def is_alive(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+    async def close(self):
+        """关闭该槽位的浏览器(忽略已崩溃的浏览器)"""
+        if self.context:
+            # 先关闭上下文: HAR 录制在上下文关闭时写出
+            try:
+                await self.context.close()
+            except Exception:
+                pass
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+        self.browser = self.context = self.page = self.blocker = None
+
+
+class BrowserPool:
+    """常驻浏览器池"""
+
+    def __init__(
+        self,
+        size: int = None,
+        max_uses: int = None,
+        max_heap_mb: int = None,
+        warm_urls: List[str] = None,
+        log_callback: Callable[[str, str], None] = None,
+    ):
+        """
+        Args:
+            size: 池中浏览器数量 (默认 config.BROWSER_POOL_SIZE)
+            max_uses: 每个上下文最多使用次数,达到后回收重建 (默认 config.BROWSER_POOL_MAX_USES)
+            max_heap_mb: 页面 JS 堆内存阈值(MB),超过后回收重建,0 表示不检查 (默认 config.BROWSER_POOL_MAX_HEAP_MB)
+            warm_urls: 创建槽位后预先打开的页面,用于预热 SPA 缓存
+            log_callback: 日志回调函数 (message, level)
+        """
+        self.size = max(1, size or config.BROWSER_POOL_SIZE)
+        self.max_uses = max_uses or config.BROWSER_POOL_MAX_USES
+        self.max_heap_mb = config.BROWSER_POOL_MAX_HEAP_MB if max_heap_mb is None else max_heap_mb
+        self.warm_urls = [url for url in (warm_urls or []) if url]
+        self.log_callback = log_callback or log
+
+        self.playwright: Optional[Playwright] = None
+        self.launch_count = 0
+        self.waiting = 0  # 正在等待空闲槽位的任务数
+        self.block_stats = BlockStats()  # 池生命周期内累计的资源拦截统计
+        self._idle: Optional[asyncio.Queue] = None
+        self._slots: List[PooledBrowser] = []
+        self._recycle_tasks = set()
+        self._start_lock = asyncio.Lock()
+        self._started = False
+
+    def _log(self, message: str, level: str = "INFO"):
+        self.log_callback(message, level)
+
+    async def start(self):
+        """启动 Playwright 并创建所有槽位(重复调用无副作用)"""
+        async with self._start_lock:
+            if self._started:
+                return
+
+            self._log(f"初始化浏览器池 (大小: {self.size}, 最多复用 {self.max_uses} 次)...", "INFO")
+            self.playwright = await async_playwright().start()
+            self._idle = asyncio.Queue()
+
+            slots = [PooledBrowser(i) for i in range(1, self.size + 1)]
+            try:
+                await asyncio.gather(*(self._prepare(slot) for slot in slots))
+            except Exception as e:
+                self._log(f"浏览器池初始化失败: {str(e)}", "ERROR")
+                for slot in slots:
+                    await slot.close()
+                await self.playwright.stop()
+                self.playwright = None
+                raise
+
+            for slot in slots:
+                self._slots.append(slot)
+                self._idle.put_nowait(slot)
+
+            self._started = True
+            self._log("浏览器池初始化完成", "SUCCESS")
+
+    async def _prepare(self, slot: PooledBrowser):
+        """为槽位启动浏览器、创建上下文和页面,并预热页面"""
+        if not slot.is_alive:
+            await slot.close()
+            slot.browser = await launch_browser(self.playwright)
+            self.launch_count += 1
+        slot.blocker = ResourceBlocker.from_config()
+        # 重建的上下文写入新的 HAR 文件,不覆盖之前录制的内容
+        suffix = f"slot{slot.slot_id}" + (f"-{len(slot.har_suffixes) + 1}" if slot.har_suffixes else '')
+        slot.har_suffixes.append(suffix)
+        slot.context = await new_automation_context(slot.browser, slot.blocker, har_suffix=suffix)
+        slot.page = await slot.context.new_page()
+        slot.uses = 0
+
+        for url in self.warm_urls:
+            try:
+                await slot.page.goto(url, timeout=config.PAGE_LOAD_TIMEOUT)
+                await slot.page.wait_for_load_state('networkidle')
+            except Exception as e:
+                self._log(f"浏览器 #{slot.slot_id} 预热 {url} 失败(忽略): {str(e)}", "WARNING")
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        租用一个槽位,退出时自动归还
+
+        用法:
+            async with pool.lease() as slot:
+                await slot.page.goto(...)
+        """
+        await self.start()
+        self.waiting += 1
+        try:
+            slot = await self._idle.get()
+        finally:
+            self.waiting -= 1
+
+        try:
+            if not slot.is_alive:
+                self._log(f"浏览器 #{slot.slot_id} 已断开,重新启动", "WARNING")
+                await self._prepare(slot)
+        except Exception:
+            self._idle.put_nowait(slot)
+            raise
+
+        slot.uses += 1
+        slot.block_mark = slot.blocker.stats.snapshot() if slot.blocker else BlockStats()
+        try:
+            yield slot
+        finally:
+            await self._release(slot)
+
+    async def _release(self, slot: PooledBrowser):
+        """归还槽位,必要时在后台回收重建"""
+        if slot.blocker:
+            self.block_stats.merge(slot.blocker.stats.since(slot.block_mark))
+        reason = await self._recycle_reason(slot)
+        if not reason:
+            self._idle.put_nowait(slot)
+            return
+
+        self._log(f"回收浏览器 #{slot.slot_id} ({reason})", "INFO")
+        task = asyncio.create_task(self._recycle(slot))
+        self._recycle_tasks.add(task)
+        task.add_done_callback(self._recycle_tasks.discard)
+
+    async def _recycle_reason(self, slot: PooledBrowser) -> Optional[str]:
+        """判断槽位是否需要回收,返回原因,不需要时返回 None"""
+        if not slot.is_alive:
+            return "浏览器已断开"
+        if slot.uses >= self.max_uses:
+            return f"已使用 {slot.uses} 次"
+        if self.max_heap_mb:
+            try:
+                heap = await slot.page.evaluate(
+                    "() => performance.memory ? performance.memory.usedJSHeapSize : 0"
+                )
+                heap_mb = heap / 1024 / 1024
+                if heap_mb > self.max_heap_mb:
+                    return f"JS 堆内存 {heap_mb:.0f}MB 超过阈值 {self.max_heap_mb}MB"
+            except Exception:
+                return "页面不可用"
+        return None
+
+    async def _recycle(self, slot: PooledBrowser):
+        """关闭旧上下文和浏览器并重建,完成后放回空闲队列"""
+        try:
+            await slot.close()
+            await self._prepare(slot)
+        except Exception as e:
+            # 重建失败时仍放回队列,下次租用时会再次尝试启动
+            self._log(f"重建浏览器 #{slot.slot_id} 失败: {str(e)}", "ERROR")
+        self._idle.put_nowait(slot)
+
+    async def close(self):
+        """关闭池中所有浏览器"""
+        for task in list(self._recycle_tasks):
+            task.cancel()
+        for slot in self._slots:
+            await slot.close()
+        if config.HAR_MODE == 'record' and self._slots:
+            # 各槽位的 HAR 在上下文关闭时写出,合并后回放只需读取 HAR_FILE
+            paths = [har.har_path(suffix) for slot in self._slots for suffix in slot.har_suffixes]
+            try:
+                await asyncio.to_thread(har.merge, paths)
+            except (OSError, ValueError, KeyError) as e:
+                self._log(f"合并 HAR 文件失败: {str(e)}", "ERROR")
+        self._slots.clear()
+
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+        self._started = False
@@ -4,6 +4,8 @@
 """
 
 import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 # 加载 .env 文件
@@ -16,6 +18,19 @@ IMAGE_NAMESPACE = os.getenv('IMAGE_NAMESPACE', 'javaly')
 
 # ==================== 云效界面配置 ====================
 YUNXIAO_LOG_EXPAND_TEXT = os.getenv('YUNXIAO_LOG_EXPAND_TEXT', '镜像构建并推送')
+# 版本号来源: dom=打开日志弹窗读取; network=从页面 XHR/fetch 响应中提取(未找到时回退到日志弹窗)
+YUNXIAO_TAG_SOURCE = os.getenv('YUNXIAO_TAG_SOURCE', 'dom').lower()
+
+# 云效执行方式: browser=浏览器自动化; http=复用 auth.json 中的 Cookie 直接调用流水线接口(登录失效时回退到浏览器)
+YUNXIAO_MODE = os.getenv('YUNXIAO_MODE', 'browser').lower()
+# 流水线接口地址与路径(http 模式使用; 路径支持 {pipeline_id}、{run_id}、{job} 占位符)
+YUNXIAO_API_BASE = os.getenv('YUNXIAO_API_BASE', 'https://flow.aliyun.com')
+YUNXIAO_API_RUN_PATH = os.getenv('YUNXIAO_API_RUN_PATH', '/api/pipelines/{pipeline_id}/runs')
+YUNXIAO_API_LATEST_PATH = os.getenv('YUNXIAO_API_LATEST_PATH', '/api/pipelines/{pipeline_id}/runs/latest')
+YUNXIAO_API_STATUS_PATH = os.getenv('YUNXIAO_API_STATUS_PATH', '/api/pipelines/{pipeline_id}/runs/{run_id}')
+YUNXIAO_API_LOG_PATH = os.getenv('YUNXIAO_API_LOG_PATH', '/api/pipelines/{pipeline_id}/runs/{run_id}/log?job={job}')
+# 轮询运行状态的间隔(秒)
+YUNXIAO_API_POLL_INTERVAL = float(os.getenv('YUNXIAO_API_POLL_INTERVAL', '5'))
 
 
 # ==================== K8s 登录凭证 ====================
@@ -23,13 +38,40 @@ K8S_ENV_CREDENTIALS = {
     'test': {
         'username': os.getenv('K8S_DEV_USERNAME', ''),
         'password': os.getenv('K8S_DEV_PASSWORD', ''),
+        # Kubernetes API 凭证(K8S_MODE=api 时使用): API Server 地址 + Token,或 kubeconfig 文件
+        'api_server': os.getenv('K8S_DEV_API_SERVER', ''),
+        'api_token': os.getenv('K8S_DEV_API_TOKEN', ''),
+        'kubeconfig': os.getenv('K8S_DEV_KUBECONFIG', ''),
     },
     'prod': {
         'username': os.getenv('K8S_PROD_USERNAME', ''),
         'password': os.getenv('K8S_PROD_PASSWORD', ''),
+        'api_server': os.getenv('K8S_PROD_API_SERVER', ''),
+        'api_token': os.getenv('K8S_PROD_API_TOKEN', ''),
+        'kubeconfig': os.getenv('K8S_PROD_KUBECONFIG', ''),
     },
 }
 
+# K8s 更新方式: ui=操作 Kuboard 页面; api=直接通过 Kubernetes API 对 Deployment 发送 strategic-merge PATCH
+K8S_MODE = os.getenv('K8S_MODE', 'ui').lower()
+# Kubernetes API 的 CA 证书文件(为空时使用系统证书); 设为 true 时跳过证书校验(仅限测试环境)
+K8S_API_CA_FILE = os.getenv('K8S_API_CA_FILE', '')
+K8S_API_INSECURE = os.getenv('K8S_API_INSECURE', 'false').lower() == 'true'
+
+
+# 同一镜像需要更新多个 Deployment 时同时更新的目标数上限
+K8S_FANOUT_PARALLEL = int(os.getenv('K8S_FANOUT_PARALLEL', '4'))
+
+
+def _k8s_targets(prefix: str) -> List[str]:
+    """
+    环境的 K8s 更新目标列表: {prefix}_K8S_URL 加上 {prefix}_K8S_EXTRA_URLS(逗号分隔)中的地址
+
+    同一条云效流水线构建的镜像会部署到列表中的所有 Deployment
+    """
+    urls = [os.getenv(f'{prefix}_K8S_URL', '')] + os.getenv(f'{prefix}_K8S_EXTRA_URLS', '').split(',')
+    return list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+
 
 # ==================== 前端配置 ====================
 FRONTEND_CONFIG = {
@@ -45,17 +87,25 @@ FRONTEND_CONFIG = {
     'test': {
         'yunxiao_url': os.getenv('FRONTEND_TEST_YUNXIAO_URL', ''),
         'k8s_url': os.getenv('FRONTEND_TEST_K8S_URL', ''),
+        'k8s_targets': _k8s_targets('FRONTEND_TEST'),
         'tag_pattern': os.getenv('FRONTEND_TEST_TAG_PATTERN', r'javaly/jpms-web:(dev-\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})'),
         'k8s_username': K8S_ENV_CREDENTIALS['test']['username'],
         'k8s_password': K8S_ENV_CREDENTIALS['test']['password'],
+        'k8s_api_server': K8S_ENV_CREDENTIALS['test']['api_server'],
+        'k8s_api_token': K8S_ENV_CREDENTIALS['test']['api_token'],
+        'k8s_kubeconfig': K8S_ENV_CREDENTIALS['test']['kubeconfig'],
     },
     # 生产环境
     'prod': {
         'yunxiao_url': os.getenv('FRONTEND_PROD_YUNXIAO_URL', ''),
         'k8s_url': os.getenv('FRONTEND_PROD_K8S_URL', ''),
+        'k8s_targets': _k8s_targets('FRONTEND_PROD'),
         'tag_pattern': os.getenv('FRONTEND_PROD_TAG_PATTERN', r'javaly/jpms-web:(prod-\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})'),
         'k8s_username': K8S_ENV_CREDENTIALS['prod']['username'],
         'k8s_password': K8S_ENV_CREDENTIALS['prod']['password'],
+        'k8s_api_server': K8S_ENV_CREDENTIALS['prod']['api_server'],
+        'k8s_api_token': K8S_ENV_CREDENTIALS['prod']['api_token'],
+        'k8s_kubeconfig': K8S_ENV_CREDENTIALS['prod']['kubeconfig'],
     }
 }
 
@@ -79,6 +129,7 @@ BACKEND_CONFIG = {
     'test': {
         'yunxiao_url': os.getenv('BACKEND_TEST_YUNXIAO_URL', ''),
         'k8s_url': os.getenv('BACKEND_TEST_K8S_URL', ''),
+        'k8s_targets': _k8s_targets('BACKEND_TEST'),
         'tag_pattern': os.getenv(
             'BACKEND_TEST_TAG_PATTERN',
             r'javaly/spms-server:(dev-\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})',
@@ -87,11 +138,15 @@ BACKEND_CONFIG = {
         'log_job_keyword': os.getenv('BACKEND_TEST_LOG_JOB', 'Java 构建Docker镜像并推送镜像仓库'),
         'k8s_username': K8S_ENV_CREDENTIALS['test']['username'],
         'k8s_password': K8S_ENV_CREDENTIALS['test']['password'],
+        'k8s_api_server': K8S_ENV_CREDENTIALS['test']['api_server'],
+        'k8s_api_token': K8S_ENV_CREDENTIALS['test']['api_token'],
+        'k8s_kubeconfig': K8S_ENV_CREDENTIALS['test']['kubeconfig'],
     },
     # 生产环境
     'prod': {
         'yunxiao_url': os.getenv('BACKEND_PROD_YUNXIAO_URL', ''),
         'k8s_url': os.getenv('BACKEND_PROD_K8S_URL', ''),
+        'k8s_targets': _k8s_targets('BACKEND_PROD'),
         'tag_pattern': os.getenv(
             'BACKEND_PROD_TAG_PATTERN',
             r'javaly/spms-server:(prod-\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})',
@@ -100,6 +155,9 @@ BACKEND_CONFIG = {
         'log_job_keyword': os.getenv('BACKEND_PROD_LOG_JOB', 'Java生产环境构建'),
         'k8s_username': K8S_ENV_CREDENTIALS['prod']['username'],
         'k8s_password': K8S_ENV_CREDENTIALS['prod']['password'],
+        'k8s_api_server': K8S_ENV_CREDENTIALS['prod']['api_server'],
+        'k8s_api_token': K8S_ENV_CREDENTIALS['prod']['api_token'],
+        'k8s_kubeconfig': K8S_ENV_CREDENTIALS['prod']['kubeconfig'],
     }
 }
 
@@ -121,6 +179,51 @@ OPERATION_TIMEOUT = 30000
 PAGE_LOAD_TIMEOUT = 60000
 
 
+# ==================== 调度配置 ====================
+# 任务最大并行数(1=串行执行; >1 时不同项目的任务并行执行,同一项目的任务仍按顺序执行)
+TASK_MAX_PARALLEL = int(os.getenv('TASK_MAX_PARALLEL', '1'))
+# 任务之间有依赖(如同时选择构建和部署)时按依赖图调度: 不同项目的任务并行,同一项目的任务按依赖顺序执行;
+# 并行数由依赖图推算,此项为可选上限(0=不限制)
+TASK_DAG_MAX_PARALLEL = int(os.getenv('TASK_DAG_MAX_PARALLEL', '0'))
+
+# Web 服务的部署执行方式: inprocess(在 Web 服务进程中执行,使用浏览器池) |
+# process(每个部署作业在独立的工作进程中执行,浏览器崩溃或卡死不影响 Web 服务)
+EXECUTION_MODE = os.getenv('EXECUTION_MODE', 'inprocess').lower()
+# 工作进程数(同时执行的部署作业数上限)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '2'))
+# 单个部署作业的最长执行时间(秒),超时后强制结束工作进程
+WORKER_TIMEOUT = int(os.getenv('WORKER_TIMEOUT', '3600'))
+# 每个工作进程执行的作业数上限,达到后换用新进程
+WORKER_MAX_JOBS = int(os.getenv('WORKER_MAX_JOBS', '20'))
+
+# 持久化版本号缓存: 按 (项目, 环境, 运行 ID) 记录获取到的版本号(运行 ID 来自接口或页面的网络响应);
+# "最近构建"模式下 TTL 内已记录的最新一次运行直接复用,不访问云效
+TAG_CACHE_ENABLED = os.getenv('TAG_CACHE_ENABLED', 'true').lower() == 'true'
+TAG_CACHE_FILE = os.getenv('TAG_CACHE_FILE', 'tag_cache.json')
+# 缓存有效期(秒)
+TAG_CACHE_TTL = int(os.getenv('TAG_CACHE_TTL', '1800'))
+# 最多保留的记录数,超出后淘汰最久未使用的记录
+TAG_CACHE_MAX_ENTRIES = int(os.getenv('TAG_CACHE_MAX_ENTRIES', '200'))
+
+
+def _lane_limits(value: str) -> Dict[str, int]:
+    """解析 "prod:1,test:2" 形式的每道并发上限"""
+    limits = {}
+    for item in value.split(','):
+        lane, _, limit = item.partition(':')
+        if lane.strip() and limit.strip():
+            limits[lane.strip()] = int(limit)
+    return limits
+
+
+# Web 服务的部署队列: 部署请求按环境分道(prod/test/build)排队,每道有独立的并发上限
+JOB_QUEUE_FILE = os.getenv('JOB_QUEUE_FILE', 'job_queue.json')
+# 每道同时执行的部署数(未列出的道为 1)
+JOB_LANE_LIMITS = _lane_limits(os.getenv('JOB_LANE_LIMITS', 'prod:1,test:2,build:2'))
+# 保留的已结束作业数
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', '100'))
+
+
 # ==================== 浏览器配置 ====================
 # 是否使用无头模式(True=后台运行, False=显示浏览器窗口)
 HEADLESS = False
@@ -129,14 +232,176 @@ HEADLESS = False
 SCREENSHOT_ON_ERROR = True
 
 # Cookie 存储文件路径
-AUTH_FILE = "auth.json"
+AUTH_FILE = os.getenv('AUTH_FILE', "auth.json")
+
+# 浏览器池(仅 Web 服务使用): 在服务生命周期内复用预热好的浏览器和上下文
+BROWSER_POOL_ENABLED = os.getenv('BROWSER_POOL_ENABLED', 'true').lower() == 'true'
+# 池中浏览器数量(即可同时执行的任务上限)
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '2'))
+# 每个浏览器上下文最多使用次数,达到后回收重建
+BROWSER_POOL_MAX_USES = int(os.getenv('BROWSER_POOL_MAX_USES', '20'))
+# 页面 JS 堆内存阈值(MB),超过后回收重建,0 表示不检查
+BROWSER_POOL_MAX_HEAP_MB = int(os.getenv('BROWSER_POOL_MAX_HEAP_MB', '512'))
+# 创建浏览器后是否预先打开云效流水线页面(预热 SPA 缓存)
+BROWSER_POOL_WARM = os.getenv('BROWSER_POOL_WARM', 'true').lower() == 'true'
+
+# 资源拦截: 自动化页面加载时中止图片、字体、统计埋点等与流程无关的请求
+BLOCK_RESOURCES = os.getenv('BLOCK_RESOURCES', 'true').lower() == 'true'
+# 拦截的资源类型(逗号分隔,document/xhr/fetch 不会被按类型拦截)
+BLOCKED_RESOURCE_TYPES = os.getenv('BLOCKED_RESOURCE_TYPES', 'image,font,media')
+# 拦截的 URL 关键词(逗号分隔,如统计埋点、在线客服组件)
+BLOCKED_URL_PATTERNS = os.getenv(
+    'BLOCKED_URL_PATTERNS',
+    'google-analytics.com,googletagmanager.com,hm.baidu.com,arms-retcode,retcode.alicdn.com,'
+    'log.mmstat.com,gm.mmstat.com,aplus,/tracker/,sentry,hotjar.com,intercom,zhichi,udesk,crisp.chat'
+)
+# 始终放行的 URL 关键词(逗号分隔,优先级高于拦截规则),默认放行登录页及二维码
+BLOCK_ALLOWLIST = os.getenv('BLOCK_ALLOWLIST', 'login,passport,qrcode')
 
 # 截图保存目录
 SCREENSHOT_DIR = "screenshots"
 
 # 日志保存目录
 LOG_DIR = "logs"
+# 每次部署在内存中保留的最大日志行数(超出时丢弃最旧的行)
+LOG_RUN_BUFFER = int(os.getenv('LOG_RUN_BUFFER', '2000'))
+# 内存中保留的已结束部署数,更早的部署日志写入 LOG_DIR/run-<运行ID>.json.gz
+LOG_RUNS_IN_MEMORY = int(os.getenv('LOG_RUNS_IN_MEMORY', '5'))
+# 日志文件: 后台线程把每次部署的日志写入 LOG_DIR/run-<运行ID>.log,其余服务日志写入 LOG_DIR/deploy.log,
+# 超过大小或时长后轮转为 <文件名>-<时间>.log.gz
+LOG_FILE_ENABLED = os.getenv('LOG_FILE_ENABLED', 'true').lower() == 'true'
+LOG_FILE_MAX_MB = float(os.getenv('LOG_FILE_MAX_MB', '10'))
+LOG_FILE_ROTATE_HOURS = float(os.getenv('LOG_FILE_ROTATE_HOURS', '24'))
+# deploy.log 保留的压缩日志文件数
+LOG_FILE_BACKUPS = int(os.getenv('LOG_FILE_BACKUPS', '10'))
+# 保留最近多少次部署的 run-<运行ID>.log(含其压缩文件), 0 表示不清理
+LOG_RUN_FILES = int(os.getenv('LOG_RUN_FILES', '200'))
 
-# 默认凭证(与旧逻辑兼容,运行时由 TaskScheduler 设置)
+# 步骤耗时追踪: 每次运行结束后导出 trace-<运行ID>.jsonl 和 Chrome Trace 格式的 trace-<运行ID>.json
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'true').lower() == 'true'
+TRACE_DIR = os.getenv('TRACE_DIR', 'traces')
+# 执行总结中列出的最慢步骤数
+TRACE_SUMMARY_TOP = int(os.getenv('TRACE_SUMMARY_TOP', '5'))
+
+# HAR 录制/回放: off | record(录制真实会话) | replay(从 HAR 回放,不访问网络)
+HAR_MODE = os.getenv('HAR_MODE', 'off').lower()
+# HAR 文件路径(浏览器池录制时每个槽位写入 <文件名>-slot<N>.har,关闭浏览器池时合并到该文件)
+HAR_FILE = os.getenv('HAR_FILE', 'har/session.har')
+# 回放时 HAR 中没有的请求: abort(中止,保证不访问网络) | fallback(正常访问网络)
+HAR_NOT_FOUND = os.getenv('HAR_NOT_FOUND', 'abort')
+
+# Web 服务的 /metrics 端点(Prometheus 文本格式): 部署及各步骤耗时分布、成功/失败次数等
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Web 日志批量推送: 日志先进入缓冲区,按间隔或条数合并为一个 log_batch 事件发送
+LOG_BATCH_INTERVAL_MS = int(os.getenv('LOG_BATCH_INTERVAL_MS', '200'))
+# 单批最多条数(缓冲区达到该数量时立即发送)
+LOG_BATCH_MAX = int(os.getenv('LOG_BATCH_MAX', '200'))
+# 缓冲区上限: 发送跟不上(客户端慢)时丢弃最旧的日志,部署线程不会被阻塞
+LOG_BATCH_MAX_PENDING = int(os.getenv('LOG_BATCH_MAX_PENDING', '5000'))
+# 每秒推送的日志消息总数上限(所有页面合计): 页面多时按比例拉长推送间隔,0 表示不限制
+# (默认 500: 100 个页面以内保持 LOG_BATCH_INTERVAL_MS, 500 个页面时每秒推送一次)
+LOG_BATCH_MAX_SENDS = int(os.getenv('LOG_BATCH_MAX_SENDS', '500'))
+
+
+def _origins(value: str):
+    """解析允许跨域的来源: "*" 表示全部,逗号分隔的地址列表,空表示只允许同源"""
+    value = value.strip()
+    if value == '*':
+        return '*'
+    origins = [origin.strip() for origin in value.split(',') if origin.strip()]
+    return origins or None
+
+
+# ==================== Web 服务 ====================
+# dev(Werkzeug 开发服务器,适合本机使用) |
+# production(gunicorn 多线程工作进程,支持大量同时查看日志的页面,需要安装 gunicorn)
+WEB_SERVER = os.getenv('WEB_SERVER', 'dev').lower()
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+# 默认 5001(避免与 macOS AirPlay Receiver 冲突)
+WEB_PORT = int(os.getenv('WEB_PORT', '5001'))
+# production 模式的处理线程数: 每个 WebSocket 连接占用一个线程,应大于同时打开的页面数
+WEB_THREADS = int(os.getenv('WEB_THREADS', '1000'))
+# Socket.IO 心跳: 每隔 PING_INTERVAL 秒发送一次,PING_TIMEOUT 秒内未响应视为断开
+# (反向代理的空闲超时应大于两者之和)
+SOCKETIO_PING_INTERVAL = float(os.getenv('SOCKETIO_PING_INTERVAL', '25'))
+SOCKETIO_PING_TIMEOUT = float(os.getenv('SOCKETIO_PING_TIMEOUT', '20'))
+# 允许跨域访问 Socket.IO 的来源(逗号分隔,如 http://localhost:3000),* 表示全部
+CORS_ALLOWED_ORIGINS = _origins(os.getenv('CORS_ALLOWED_ORIGINS', '*'))
+
+# 默认凭证(与旧逻辑兼容,供 default_context() 使用; TaskScheduler 通过 ExecutionContext 传递各任务凭证)
 K8S_USERNAME = FRONTEND_CONFIG['test']['k8s_username']
 K8S_PASSWORD = FRONTEND_CONFIG['test']['k8s_password']
+
+
+# ==================== 任务执行上下文 ====================
+@dataclass(frozen=True)
+class ExecutionContext:
+    """
+    单个任务的执行上下文(不可变)
+
+    由 TaskScheduler 按任务配置创建,显式传给云效/K8s 入口函数,
+    代替运行时修改本模块的全局变量,使不同环境的任务可以在同一进程内并行执行。
+    """
+    yunxiao_url: str = ''
+    k8s_url: str = ''
+    k8s_targets: Tuple[str, ...] = ()
+    tag_pattern: str = ''
+    k8s_username: str = ''
+    k8s_password: str = ''
+    k8s_api_server: str = ''
+    k8s_api_token: str = ''
+    k8s_kubeconfig: str = ''
+    log_job_keyword: Optional[str] = None
+    log_expand_text: str = YUNXIAO_LOG_EXPAND_TEXT
+    project: str = ''
+    env: str = ''
+
+    @classmethod
+    def from_config(cls, task_config: Dict[str, Any], project: str = '', env: str = '') -> 'ExecutionContext':
+        """从 FRONTEND_CONFIG / BACKEND_CONFIG 中的环境配置创建上下文"""
+        return cls(
+            project=project,
+            env=env,
+            yunxiao_url=task_config.get('yunxiao_url', ''),
+            k8s_url=task_config.get('k8s_url', ''),
+            k8s_targets=tuple(task_config.get('k8s_targets') or filter(None, [task_config.get('k8s_url', '')])),
+            tag_pattern=task_config.get('tag_pattern', ''),
+            k8s_username=task_config.get('k8s_username', ''),
+            k8s_password=task_config.get('k8s_password', ''),
+            k8s_api_server=task_config.get('k8s_api_server', ''),
+            k8s_api_token=task_config.get('k8s_api_token', ''),
+            k8s_kubeconfig=task_config.get('k8s_kubeconfig', ''),
+            log_job_keyword=task_config.get('log_job_keyword') or None,
+        )
+
+    def for_target(self, k8s_url: str) -> 'ExecutionContext':
+        """返回只更新指定 K8s 目标的上下文(其余配置不变)"""
+        return replace(self, k8s_url=k8s_url, k8s_targets=(k8s_url,))
+
+    @property
+    def deployment_name(self) -> str:
+        """从 K8s URL 提取 Deployment 名称(URL 最后一段),例如 .../Deployment/jpms-web -> jpms-web"""
+        return self.k8s_url.rstrip('/').split('/')[-1]
+
+    @property
+    def k8s_namespace(self) -> str:
+        """从 Kuboard URL 提取命名空间,例如 .../namespace/jpms/workload/... -> jpms"""
+        parts = self.k8s_url.rstrip('/').split('/')
+        if 'namespace' in parts and parts.index('namespace') + 1 < len(parts):
+            return parts[parts.index('namespace') + 1]
+        return ''
+
+
+def default_context() -> ExecutionContext:
+    """使用兼容旧代码的全局变量创建上下文(供 main.py 等单任务入口使用)"""
+    return ExecutionContext(
+        yunxiao_url=YUNXIAO_URL,
+        k8s_url=K8S_URL,
+        tag_pattern=TAG_PATTERN,
+        k8s_username=K8S_USERNAME,
+        k8s_password=K8S_PASSWORD,
+        k8s_api_server=FRONTEND_CONFIG['test']['k8s_api_server'],
+        k8s_api_token=FRONTEND_CONFIG['test']['k8s_api_token'],
+        k8s_kubeconfig=FRONTEND_CONFIG['test']['k8s_kubeconfig'],
+    )
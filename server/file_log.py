@@ -0,0 +1,275 @@
+"""
+日志文件输出: 后台线程写入 LOG_DIR,按大小/时间轮转并压缩旧文件
+
+utils.log 与 WebLogger 只把格式化好的一行放入队列(不做任何磁盘 I/O),
+由后台线程批量写入文件。每次部署的日志写入各自的 LOG_DIR/run-<运行ID>.log,
+不属于任何部署的服务日志写入 LOG_DIR/deploy.log:
+
+    [2026-01-01 10:00:00] [INFO] 开始执行部署任务
+
+- 文件超过 LOG_FILE_MAX_MB 或已写入 LOG_FILE_ROTATE_HOURS 小时后轮转为
+  <文件名>-<时间>.log.gz; deploy.log 只保留最近 LOG_FILE_BACKUPS 个压缩文件,
+  部署日志只保留最近 LOG_RUN_FILES 次部署的文件
+- 部署日志空闲 RUN_FILE_IDLE_SECONDS 秒后关闭文件句柄,之后再有日志时追加写入
+- 队列满时(磁盘很慢)丢弃新日志并计数,不阻塞调用方
+"""
+import atexit
+import gzip
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import config
+
+_STOP = object()
+
+# 部署日志空闲多久后关闭文件句柄(秒)
+RUN_FILE_IDLE_SECONDS = 60
+
+
+class _LogFile:
+    """单个日志文件: 追加写入,超过大小或时长后轮转为 <文件名>-<时间>.log.gz"""
+
+    def __init__(self, directory: str, filename: str, max_bytes: int, rotate_seconds: float):
+        self.directory = directory
+        self.filename = filename
+        self.base = os.path.splitext(filename)[0]
+        self.path = os.path.join(directory, filename)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.last_write = time.time()
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+
+    def write(self, data: bytes) -> bool:
+        """写入数据,返回是否发生了轮转"""
+        rotated = False
+        if self._file is None:
+            self._open()
+        elif self._should_rotate():
+            self._rotate()
+            rotated = True
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self.last_write = time.time()
+        return rotated
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+        # 已有文件按修改时间计算轮转时间,重启服务不会重置
+        self._opened_at = os.path.getmtime(self.path) if self._size else time.time()
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and self._size >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self.close()
+        rotated = os.path.join(self.directory, f"{self.base}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.log")
+        os.replace(self.path, rotated)
+        with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        self._open()
+
+
+class FileLogSink:
+    """异步轮转日志文件,按运行ID分文件"""
+
+    def __init__(
+        self,
+        directory: str = None,
+        filename: str = 'deploy.log',
+        max_bytes: int = None,
+        rotate_seconds: float = None,
+        backups: int = None,
+        run_files: int = None,
+        queue_size: int = 10000,
+    ):
+        """
+        Args:
+            directory: 日志目录 (默认 config.LOG_DIR)
+            filename: 服务日志文件名(不属于任何部署的日志)
+            max_bytes: 超过该大小时轮转 (默认 config.LOG_FILE_MAX_MB, 0 表示不按大小轮转)
+            rotate_seconds: 文件写入超过该时长后轮转 (默认 config.LOG_FILE_ROTATE_HOURS, 0 表示不按时间轮转)
+            backups: 服务日志保留的压缩文件数 (默认 config.LOG_FILE_BACKUPS)
+            run_files: 保留最近多少次部署的日志文件 (默认 config.LOG_RUN_FILES)
+            queue_size: 队列容量,队列满时丢弃新日志
+        """
+        self.directory = directory or config.LOG_DIR
+        self.filename = filename
+        self.max_bytes = int(config.LOG_FILE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.rotate_seconds = config.LOG_FILE_ROTATE_HOURS * 3600 if rotate_seconds is None else rotate_seconds
+        self.backups = config.LOG_FILE_BACKUPS if backups is None else backups
+        self.run_files = config.LOG_RUN_FILES if run_files is None else run_files
+        self.path = os.path.join(self.directory, filename)
+        self.dropped = 0
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self._server_file = _LogFile(self.directory, filename, self.max_bytes, self.rotate_seconds)
+        self._run_files: Dict[str, _LogFile] = {}
+        self._thread = threading.Thread(target=self._run, name='file-log', daemon=True)
+        self._thread.start()
+
+    def write(self, line: str, run_id: str = None):
+        """放入一行日志(不阻塞),run_id 为空时写入服务日志"""
+        try:
+            self._queue.put_nowait((run_id, line))
+        except queue.Full:
+            self.dropped += 1
+
+    def run_path(self, run_id: str) -> str:
+        """部署日志文件路径"""
+        return os.path.join(self.directory, f"run-{run_id}.log")
+
+    def close(self, timeout: float = 5):
+        """写完队列中的日志并关闭文件"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                items: List = [self._queue.get(timeout=RUN_FILE_IDLE_SECONDS)]
+            except queue.Empty:
+                self._close_idle()
+                continue
+            # 一次取出队列中已有的日志,合并为一次写入
+            while len(items) < 1000:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in items)
+            try:
+                self._write([item for item in items if item is not _STOP])
+                self._close_idle()
+            except Exception as e:
+                sys.stderr.write(f"写入日志文件失败: {str(e)}\n")
+            if stop:
+                self._server_file.close()
+                for log_file in self._run_files.values():
+                    log_file.close()
+                self._run_files.clear()
+                return
+
+    def _write(self, items: List[Tuple[Optional[str], str]]):
+        if not items and not self.dropped:
+            return
+        # 按文件分组,保持各文件内的顺序
+        grouped: Dict[Optional[str], List[str]] = {}
+        for run_id, line in items:
+            grouped.setdefault(run_id, []).append(line)
+        if self.dropped:
+            grouped.setdefault(None, []).insert(
+                0, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [WARNING] 日志写入跟不上,已丢弃 {self.dropped} 行")
+            self.dropped = 0
+        for run_id, lines in grouped.items():
+            data = ''.join(line + '\n' for line in lines).encode('utf-8')
+            if run_id is None:
+                if self._server_file.write(data):
+                    self._prune_archives(self._server_file.base)
+            else:
+                self._run_file(run_id).write(data)
+
+    def _run_file(self, run_id: str) -> _LogFile:
+        log_file = self._run_files.get(run_id)
+        if log_file is None:
+            log_file = _LogFile(self.directory, f"run-{run_id}.log", self.max_bytes, self.rotate_seconds)
+            self._run_files[run_id] = log_file
+            if not os.path.exists(log_file.path):
+                self._prune_runs(exclude=run_id)
+        return log_file
+
+    def _close_idle(self):
+        """关闭空闲的部署日志文件"""
+        now = time.time()
+        for run_id in [r for r, f in self._run_files.items() if now - f.last_write >= RUN_FILE_IDLE_SECONDS]:
+            self._run_files.pop(run_id).close()
+
+    def _prune_archives(self, base: str):
+        """服务日志只保留最近 backups 个压缩文件"""
+        archives = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(f"{base}-") and name.endswith('.log.gz')
+        )
+        for name in archives[:max(0, len(archives) - self.backups)]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _prune_runs(self, exclude: str):
+        """
+        只保留最近 run_files 次部署的日志(含各自轮转出的压缩文件)
+
+        只匹配 run-*.log 与 run-*.log.gz,不影响 run_log_store 的 run-<运行ID>.json.gz
+        """
+        if not self.run_files or not os.path.isdir(self.directory):
+            return
+        runs: Dict[str, List[str]] = {}
+        for name in os.listdir(self.directory):
+            if name.startswith('run-') and name.endswith('.log'):
+                runs.setdefault(name[len('run-'):-len('.log')], []).append(name)
+        for name in os.listdir(self.directory):
+            if name.startswith('run-') and name.endswith('.log.gz'):
+                # run-<运行ID>-<时间>.log.gz,时间中不含 '-'
+                runs.setdefault(name[len('run-'):-len('.log.gz')].rsplit('-', 1)[0], []).append(name)
+        runs.pop(exclude, None)
+        # 本次部署也占一个名额
+        keep = max(0, self.run_files - 1)
+
+        def newest(run_id: str) -> float:
+            return max(os.path.getmtime(os.path.join(self.directory, name)) for name in runs[run_id])
+
+        for run_id in sorted(runs, key=newest)[:max(0, len(runs) - keep)]:
+            if run_id in self._run_files:
+                continue
+            for name in runs[run_id]:
+                os.remove(os.path.join(self.directory, name))
+
+
+_sink: Optional[FileLogSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> Optional[FileLogSink]:
+    """全局日志文件(首次调用时创建,未启用时返回 None)"""
+    global _sink
+    if not config.LOG_FILE_ENABLED:
+        return None
+    with _sink_lock:
+        if _sink is None:
+            _sink = FileLogSink()
+            atexit.register(_sink.close)
+        return _sink
+
+
+def write(timestamp: str, level: str, message: str, run_id: str = None):
+    """
+    写入一行日志(不阻塞)
+
+    Args:
+        timestamp: 完整时间 (YYYY-MM-DD HH:MM:SS)
+        level: 日志级别
+        message: 日志内容(多行内容按原样写入)
+        run_id: 所属运行ID,写入 run-<运行ID>.log; 不属于任何部署时为空,写入 deploy.log
+    """
+    sink = get_sink()
+    if sink is not None:
+        sink.write(f"[{timestamp}] [{level}] {message}", run_id)
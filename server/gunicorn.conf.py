@@ -0,0 +1,51 @@
+"""
+gunicorn 配置: WEB_SERVER=production 时 web_server.py 使用本配置启动
+
+    gunicorn -c gunicorn.conf.py web_server:app
+
+- 只使用一个工作进程: 任务状态、部署队列、运行日志和 Socket.IO 房间都保存在进程内,
+  多个工作进程之间不共享,页面会只收到部分日志
+- 工作进程为 gthread(线程池): 每个 WebSocket 连接占用一个线程,
+  WEB_THREADS 决定可同时打开的页面数(HTTP 请求也需要空闲线程);
+  日志由 LogBatcher 的后台线程批量推送,页面多时按 LOG_BATCH_MAX_SENDS 拉长推送间隔
+- 不预加载应用(preload_app): web_server 导入时会启动后台线程,必须在工作进程中导入
+- 页面很多时建议同时设置 EXECUTION_MODE=process: 推送日志的线程与部署不再争用同一个进程的 GIL
+"""
+import signal
+# gunicorn 把本文件的模块级变量当作配置项读取("config" 是配置项名),导入时改名
+import config as settings
+
+bind = f"{settings.WEB_HOST}:{settings.WEB_PORT}"
+workers = 1
+worker_class = 'gthread'
+threads = settings.WEB_THREADS
+# 同时保持的连接数(含等待线程处理的 HTTP 长连接)
+worker_connections = settings.WEB_THREADS * 2
+preload_app = False
+# 工作进程无响应多久后重启(秒); 部署在后台线程中执行,不受此限制
+timeout = 120
+# 退出时等待进行中的请求(含未响应断开的 WebSocket 连接)结束的时间(秒)
+graceful_timeout = 30
+accesslog = None
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """工作进程加载应用后启动后台服务(预热浏览器池、继续执行排队中的作业)"""
+    import web_server
+    web_server.start_services()
+
+    # SIGTERM(正常停止): 先停止后台服务并断开 WebSocket 连接,工作进程才能在 graceful_timeout 内退出
+    handle_exit = worker.handle_exit
+
+    def on_exit(sig, frame):
+        handle_exit(sig, frame)
+        web_server.stop_services()
+
+    signal.signal(signal.SIGTERM, on_exit)
+
+
+def worker_int(worker):
+    """SIGINT/SIGQUIT(立即停止)"""
+    import web_server
+    web_server.stop_services()
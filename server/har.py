@@ -0,0 +1,117 @@
+"""
+HAR 录制与回放: 录制一次真实的云效/Kuboard 会话,之后用 Playwright 的 HAR 路由离线回放
+
+- HAR_MODE=record: 正常访问网络,同时把请求和响应(含响应体)写入 HAR 文件,
+  上下文关闭时写出
+- HAR_MODE=replay: 所有请求都从 HAR 文件返回,不访问网络; HAR 中没有的请求按
+  HAR_NOT_FOUND 处理(abort 中止 / fallback 访问网络)
+
+回放时 trigger_build_and_fetch_tag / update_deployment_image 的页面操作照常执行,
+不会触发真实构建,也不会修改真实的 Deployment,可用于分析选择器和等待的开销、
+按真实页面内容调整超时。
+
+注意:
+- 只有浏览器中的请求会被录制/回放,YUNXIAO_MODE=http 和 K8S_MODE=api 直接调用接口,不受影响
+- 同一地址的多个响应回放时总是返回第一个匹配的记录,轮询构建状态会一直得到录制时的
+  第一个状态,因此建议录制"使用最近构建"(不触发新构建)的会话
+- 浏览器池录制时每个槽位写入 <文件名>-slot<N>.har,关闭浏览器池时合并为 HAR_FILE,
+  回放时不区分单个浏览器还是浏览器池
+"""
+import json
+import os
+from typing import List, Optional
+from playwright.async_api import BrowserContext
+import config
+from utils import log
+
+HAR_MODES = ('off', 'record', 'replay')
+
+
+def har_path(suffix: Optional[str] = None) -> str:
+    """
+    HAR 文件路径
+
+    Args:
+        suffix: 录制时区分不同上下文的后缀(如浏览器池槽位),避免多个上下文写同一个文件
+    """
+    if not suffix:
+        return config.HAR_FILE
+    base, ext = os.path.splitext(config.HAR_FILE)
+    return f"{base}-{suffix}{ext or '.har'}"
+
+
+async def install(context: BrowserContext, suffix: Optional[str] = None) -> Optional[str]:
+    """
+    按 config.HAR_MODE 在上下文上注册 HAR 录制或回放路由
+
+    必须在其他路由(如资源拦截)之前注册: 后注册的路由优先处理请求,
+    这样被拦截的资源不会进入 HAR,回放时也同样被拦截。
+
+    Returns:
+        使用的 HAR 文件路径,未启用时返回 None
+
+    Raises:
+        FileNotFoundError: 回放模式下 HAR 文件不存在
+    """
+    mode = config.HAR_MODE
+    if mode not in HAR_MODES:
+        raise ValueError(f"未知的 HAR_MODE: {mode} (可选: {', '.join(HAR_MODES)})")
+    if mode == 'off':
+        return None
+
+    if mode == 'record':
+        path = har_path(suffix)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        await context.route_from_har(path, update=True, update_content='embed', update_mode='full')
+        log(f"HAR 录制中: {path} (关闭浏览器上下文时写入)", "INFO")
+        return path
+
+    path = config.HAR_FILE
+    if config.YUNXIAO_MODE == 'http' or config.K8S_MODE == 'api':
+        log("HAR 回放只作用于浏览器中的请求,YUNXIAO_MODE=http / K8S_MODE=api 仍会访问真实接口", "WARNING")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"HAR 回放文件不存在: {path} (先使用 HAR_MODE=record 录制)")
+    await context.route_from_har(path, not_found=config.HAR_NOT_FOUND)
+    log(f"HAR 回放: {path} (未录制的请求: {config.HAR_NOT_FOUND})", "INFO")
+    return path
+
+
+def merge(paths: List[str], target: Optional[str] = None) -> Optional[str]:
+    """
+    把多个录制的 HAR 文件合并为一个(按请求开始时间排序)
+
+    浏览器池录制时每个槽位写入各自的文件,合并后回放可直接使用 HAR_FILE。
+    不存在的文件(如未使用过的槽位)会被跳过。
+
+    Args:
+        paths: 要合并的 HAR 文件
+        target: 输出路径 (默认 config.HAR_FILE)
+
+    Returns:
+        输出路径,没有可合并的文件时返回 None
+    """
+    target = target or config.HAR_FILE
+    merged = None
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if merged is None:
+            merged = data
+            merged['log'].setdefault('pages', [])
+            merged['log'].setdefault('entries', [])
+        else:
+            merged['log']['pages'].extend(data['log'].get('pages', []))
+            merged['log']['entries'].extend(data['log'].get('entries', []))
+    if merged is None:
+        return None
+    # ISO 8601 时间可直接按字符串排序; 回放时同一地址返回最早的记录
+    merged['log']['entries'].sort(key=lambda entry: entry.get('startedDateTime', ''))
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    tmp = f"{target}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False)
+    os.replace(tmp, target)
+    log(f"已合并 {len(merged['log']['entries'])} 个 HAR 请求记录到 {target}", "INFO")
+    return target
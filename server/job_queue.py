@@ -0,0 +1,236 @@
+"""
+部署任务队列: 提交的部署按环境分道排队执行,队列保存在磁盘上
+
+- 每个部署请求成为一个作业(job),按其中最高的环境分到对应的道(lane),
+  如 prod / test / build,每道有独立的并发上限,生产部署不会排在一堆测试构建之后
+- 同一道中排队中(未开始)的相同作业(任务及构建选项都相同)合并为一个,
+  合并的请求共享同一个作业和运行ID
+- 排队中的作业可以取消; 进行中的作业不能取消
+- 队列写入 JOB_QUEUE_FILE(临时文件 + 原子替换),服务重启后继续执行排队中的作业,
+  重启前进行中的作业标记为 interrupted(可能已部分执行,需要人工确认后重新提交)
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+import config
+
+# 作业状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCESS = 'success'
+PARTIAL = 'partial'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+class JobQueue:
+    """按道限流的持久化部署队列(线程安全)"""
+
+    def __init__(
+        self,
+        dispatch: Callable[[Dict[str, Any]], None],
+        path: str = None,
+        lane_limits: Dict[str, int] = None,
+        history: int = None,
+    ):
+        """
+        Args:
+            dispatch: 开始执行作业的函数 dispatch(job),应立即返回;
+                      作业结束后由调用方调用 finish(job_id, status)
+            path: 队列文件路径 (默认 config.JOB_QUEUE_FILE, 空字符串表示不持久化)
+            lane_limits: 每道的并发上限 (默认 config.JOB_LANE_LIMITS,未列出的道为 1)
+            history: 保留的已结束作业数 (默认 config.JOB_HISTORY)
+        """
+        self.dispatch = dispatch
+        self.path = config.JOB_QUEUE_FILE if path is None else path
+        self.lane_limits = dict(config.JOB_LANE_LIMITS if lane_limits is None else lane_limits)
+        self.history = config.JOB_HISTORY if history is None else history
+        self._jobs: List[Dict[str, Any]] = []
+        self._lock = threading.RLock()
+        self._closed = False
+        self._load()
+
+    def _load(self):
+        """读取队列文件,重启前进行中的作业标记为 interrupted"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._jobs = json.load(f).get('jobs', [])
+        except (OSError, ValueError, AttributeError):
+            self._jobs = []
+        for job in self._jobs:
+            if job['status'] == RUNNING:
+                job['status'] = INTERRUPTED
+                job['finished_at'] = time.time()
+        self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.job_queue_', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'jobs': self._jobs}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _trim(self):
+        """只保留最近 history 个已结束的作业"""
+        finished = [job for job in self._jobs if job['status'] not in ACTIVE_STATUSES]
+        for job in finished[:max(0, len(finished) - self.history)]:
+            self._jobs.remove(job)
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return next((job for job in self._jobs if job['job_id'] == job_id), None)
+
+    def _position(self, job: Dict[str, Any]) -> int:
+        """排队位置(从 1 开始),非排队状态为 0"""
+        if job['status'] != QUEUED:
+            return 0
+        queued = [j for j in self._jobs if j['lane'] == job['lane'] and j['status'] == QUEUED]
+        return queued.index(job) + 1
+
+    def _view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        view = dict(job)
+        view['position'] = self._position(job)
+        return view
+
+    def enqueue(self, tasks: List[Dict[str, Any]], lane: str, run_id: str) -> Dict[str, Any]:
+        """
+        提交作业
+
+        Args:
+            tasks: 任务列表 [{'task_id': 'frontend-test', 'run_build': True}, ...]
+            lane: 作业所在的道
+            run_id: 作业的运行ID (与已排队的相同作业合并时使用已有作业的运行ID)
+
+        Returns:
+            作业信息(含 position 排队位置、coalesced 是否与已有作业合并)
+        """
+        key = json.dumps(sorted((t['task_id'], bool(t.get('run_build', True))) for t in tasks))
+        with self._lock:
+            existing = next(
+                (job for job in self._jobs if job['status'] == QUEUED and job['lane'] == lane and job['key'] == key),
+                None,
+            )
+            if existing:
+                existing['requests'] += 1
+                self._save()
+                view = self._view(existing)
+                view['coalesced'] = True
+                return view
+
+            job = {
+                'job_id': uuid.uuid4().hex[:12],
+                'key': key,
+                'lane': lane,
+                'tasks': tasks,
+                'run_id': run_id,
+                'status': QUEUED,
+                'requests': 1,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+            }
+            self._jobs.append(job)
+            self._save()
+            view = self._view(job)
+            view['coalesced'] = False
+        self.pump()
+        with self._lock:
+            view.update(status=job['status'], position=self._position(job))
+        return view
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取消排队中的作业
+
+        Returns:
+            作业信息,作业不存在时返回 None
+
+        Raises:
+            ValueError: 作业已开始或已结束
+        """
+        with self._lock:
+            job = self._get(job_id)
+            if job is None:
+                return None
+            if job['status'] != QUEUED:
+                raise ValueError(f"作业状态为 {job['status']},只能取消排队中的作业")
+            job['status'] = CANCELLED
+            job['finished_at'] = time.time()
+            self._trim()
+            self._save()
+            return self._view(job)
+
+    def finish(self, job_id: str, status: str):
+        """作业结束(由 dispatch 的调用方在部署完成后调用),并开始同一道的下一个作业"""
+        with self._lock:
+            job = self._get(job_id)
+            if job is not None:
+                job['status'] = status
+                job['finished_at'] = time.time()
+                self._trim()
+                self._save()
+        self.pump()
+
+    def close(self):
+        """停止派发新作业(服务退出时调用,排队中的作业保留到下次启动)"""
+        with self._lock:
+            self._closed = True
+
+    def pump(self):
+        """在各道并发上限内开始排队中的作业"""
+        started = []
+        with self._lock:
+            if self._closed:
+                return
+            running: Dict[str, int] = {}
+            for job in self._jobs:
+                if job['status'] == RUNNING:
+                    running[job['lane']] = running.get(job['lane'], 0) + 1
+            for job in self._jobs:
+                if job['status'] != QUEUED:
+                    continue
+                lane = job['lane']
+                if running.get(lane, 0) >= max(1, self.lane_limits.get(lane, 1)):
+                    continue
+                running[lane] = running.get(lane, 0) + 1
+                job['status'] = RUNNING
+                job['started_at'] = time.time()
+                started.append(dict(job))
+            if started:
+                self._save()
+
+        for job in started:
+            try:
+                self.dispatch(job)
+            except Exception:
+                self.finish(job['job_id'], ERROR)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._get(job_id)
+            return self._view(job) if job else None
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        """全部作业(按提交顺序)"""
+        with self._lock:
+            return [self._view(job) for job in self._jobs]
+
+    def queued_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs if job['status'] == QUEUED)
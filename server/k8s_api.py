@@ -0,0 +1,239 @@
+"""
+K8s API 模块: 通过 Kubernetes API 直接更新 Deployment 镜像版本 (K8S_MODE=api)
+
+不打开 Kuboard 页面,读取 Deployment 当前镜像后发送 strategic-merge PATCH 只替换 tag,
+API Server 接受变更后立即返回(不等待滚动更新完成)。
+
+凭证: 环境配置中的 API Server 地址 + Token,或 kubeconfig 文件。
+本地可使用 mock_k8s.py 启动模拟 API Server 进行离线测试。
+"""
+import asyncio
+import base64
+import contextvars
+import http.client
+import json
+import os
+import ssl
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+import config
+from config import ExecutionContext
+from utils import log
+
+STRATEGIC_MERGE_PATCH = 'application/strategic-merge-patch+json'
+
+
+class KubernetesApiError(Exception):
+    """Kubernetes API 返回错误"""
+
+
+@dataclass
+class ApiCredentials:
+    """Kubernetes API 连接信息"""
+    server: str
+    token: str = ''
+    ca_file: str = ''
+    ca_data: str = ''
+    client_cert_data: str = ''
+    client_key_data: str = ''
+    insecure: bool = False
+
+
+def load_kubeconfig(path: str) -> ApiCredentials:
+    """
+    读取 kubeconfig 中 current-context 对应的集群和用户凭证
+
+    kubeconfig 为 YAML 格式,解析需要安装 PyYAML (JSON 格式的 kubeconfig 无需额外依赖)
+    """
+    with open(os.path.expanduser(path), 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        try:
+            import yaml
+        except ImportError:
+            raise Exception("解析 YAML 格式的 kubeconfig 需要安装 PyYAML: pip install pyyaml")
+        data = yaml.safe_load(text)
+
+    def find(section: str, name: str) -> Dict[str, Any]:
+        for item in data.get(section, []):
+            if item.get('name') == name:
+                return item
+        raise Exception(f"kubeconfig 中找不到 {section}: {name}")
+
+    context = find('contexts', data['current-context'])['context']
+    cluster = find('clusters', context['cluster'])['cluster']
+    user = find('users', context['user']).get('user', {})
+
+    return ApiCredentials(
+        server=cluster['server'],
+        token=user.get('token', ''),
+        ca_file=cluster.get('certificate-authority', ''),
+        ca_data=cluster.get('certificate-authority-data', ''),
+        client_cert_data=user.get('client-certificate-data', ''),
+        client_key_data=user.get('client-key-data', ''),
+        insecure=bool(cluster.get('insecure-skip-tls-verify', False)),
+    )
+
+
+def resolve_credentials(ctx: ExecutionContext) -> Optional[ApiCredentials]:
+    """从执行上下文获取 API 凭证,未配置时返回 None"""
+    if ctx.k8s_kubeconfig:
+        return load_kubeconfig(ctx.k8s_kubeconfig)
+    if ctx.k8s_api_server and ctx.k8s_api_token:
+        return ApiCredentials(
+            server=ctx.k8s_api_server,
+            token=ctx.k8s_api_token,
+            ca_file=config.K8S_API_CA_FILE,
+            insecure=config.K8S_API_INSECURE,
+        )
+    return None
+
+
+def _ssl_context(credentials: ApiCredentials) -> ssl.SSLContext:
+    """按凭证创建 TLS 上下文(CA 校验 / 客户端证书)"""
+    if credentials.insecure or config.K8S_API_INSECURE:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif credentials.ca_data:
+        context = ssl.create_default_context(cadata=base64.b64decode(credentials.ca_data).decode('utf-8'))
+    else:
+        context = ssl.create_default_context(cafile=credentials.ca_file or None)
+
+    if credentials.client_cert_data and credentials.client_key_data:
+        # ssl 只能从文件加载证书,写入临时文件后立即删除
+        with tempfile.TemporaryDirectory() as tmp:
+            cert_file = os.path.join(tmp, 'client.crt')
+            key_file = os.path.join(tmp, 'client.key')
+            with open(cert_file, 'wb') as f:
+                f.write(base64.b64decode(credentials.client_cert_data))
+            with open(key_file, 'wb') as f:
+                f.write(base64.b64decode(credentials.client_key_data))
+            context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+class KubernetesApiClient:
+    """最小化的 Kubernetes API 客户端(仅包含更新镜像所需的接口)"""
+
+    def __init__(self, credentials: ApiCredentials, timeout: float = 30):
+        self.credentials = credentials
+        self.timeout = timeout
+        parts = urlsplit(credentials.server.rstrip('/'))
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path
+        self._ssl_context = _ssl_context(credentials) if self.scheme == 'https' else None
+
+    def request(self, method: str, path: str, body: Any = None, content_type: str = 'application/json') -> Any:
+        """发送请求并解析 JSON 响应,HTTP 错误时抛出 KubernetesApiError"""
+        headers = {'Accept': 'application/json'}
+        if self.credentials.token:
+            headers['Authorization'] = f"Bearer {self.credentials.token}"
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = content_type
+
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, self.base_path + path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+
+        if response.status >= 400:
+            message = data.decode('utf-8', errors='replace')
+            try:
+                message = json.loads(message).get('message', message)
+            except (ValueError, AttributeError):
+                pass
+            raise KubernetesApiError(f"{method} {path} 失败: HTTP {response.status} {message}")
+        return json.loads(data) if data else None
+
+    def get_deployment(self, namespace: str, name: str) -> Dict[str, Any]:
+        return self.request('GET', f"/apis/apps/v1/namespaces/{namespace}/deployments/{name}")
+
+    def patch_deployment(self, namespace: str, name: str, patch: Dict[str, Any]) -> Dict[str, Any]:
+        return self.request(
+            'PATCH', f"/apis/apps/v1/namespaces/{namespace}/deployments/{name}",
+            body=patch, content_type=STRATEGIC_MERGE_PATCH,
+        )
+
+
+def replace_image_tag(image: str, new_tag: str) -> str:
+    """
+    替换镜像地址中的 tag(保留仓库地址和端口,去掉 digest)
+
+    例: registry.example.com:10443/javaly/jpms-web:dev-1 -> registry.example.com:10443/javaly/jpms-web:dev-2
+    """
+    image = image.split('@', 1)[0]
+    prefix, slash, last = image.rpartition('/')
+    repository = last.split(':', 1)[0]
+    return f"{prefix}{slash}{repository}:{new_tag}"
+
+
+# 独立线程池: 多目标并发更新时不受默认线程池大小(CPU 核数 + 4)限制
+_executor = ThreadPoolExecutor(max_workers=max(4, config.K8S_FANOUT_PARALLEL), thread_name_prefix='k8s-api')
+
+
+def _update_image_blocking(ctx: ExecutionContext, credentials: ApiCredentials, new_tag: str) -> str:
+    """同步实现: 读取 Deployment,替换目标容器的镜像 tag 并 PATCH,返回新镜像地址"""
+    namespace = ctx.k8s_namespace
+    name = ctx.deployment_name
+    if not namespace or not name:
+        raise Exception(f"无法从 K8s 地址中解析命名空间和 Deployment 名称: {ctx.k8s_url}")
+
+    client = KubernetesApiClient(credentials)
+    deployment = client.get_deployment(namespace, name)
+    containers = deployment['spec']['template']['spec']['containers']
+
+    # 与页面操作一致: 优先选择与 Deployment 同名的容器,只有一个容器时直接使用
+    container = next((c for c in containers if c['name'] == name), None)
+    if container is None:
+        if len(containers) != 1:
+            names = ', '.join(c['name'] for c in containers)
+            raise Exception(f"Deployment {namespace}/{name} 中没有名为 {name} 的容器 (现有容器: {names})")
+        container = containers[0]
+
+    new_image = replace_image_tag(container['image'], new_tag)
+    log(f"容器 {container['name']}: {container['image']} -> {new_image}", "INFO")
+
+    patch = {'spec': {'template': {'spec': {'containers': [{'name': container['name'], 'image': new_image}]}}}}
+    client.patch_deployment(namespace, name, patch)
+    return new_image
+
+
+async def update_deployment_image(ctx: ExecutionContext, new_tag: str) -> None:
+    """
+    通过 Kubernetes API 更新 Deployment 镜像版本
+
+    Args:
+        ctx: 任务执行上下文(K8s 地址用于解析命名空间和 Deployment 名称,以及 API 凭证)
+        new_tag: 新的镜像版本号
+
+    Raises:
+        Exception: 未配置凭证或 API 返回错误时抛出异常
+    """
+    credentials = resolve_credentials(ctx)
+    if credentials is None:
+        raise Exception("K8S_MODE=api 但未配置 Kubernetes API 凭证 (API_SERVER + API_TOKEN 或 KUBECONFIG)")
+
+    log(f"通过 Kubernetes API 更新 {ctx.k8s_namespace}/{ctx.deployment_name}...", "PROGRESS")
+    loop = asyncio.get_running_loop()
+    # run_in_executor 不复制上下文: 显式在当前上下文中执行,线程中的日志和步骤耗时仍属于当前任务
+    await loop.run_in_executor(
+        _executor, contextvars.copy_context().run, _update_image_blocking, ctx, credentials, new_tag
+    )
+    log("API Server 已接受镜像变更", "SUCCESS")
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Web 服务负载测试: 大量页面同时查看部署日志时,部署是否变慢、日志是否完整送达
+
+连接运行中的 Web 服务(dev 或 production 模式),先在没有页面连接时执行一次部署作为基线,
+再连接 N 个 Socket.IO 客户端(模拟打开的页面)执行同样的部署,比较两次部署的耗时,并统计:
+
+- 连接成功/失败数,部署期间意外断开的连接数
+- 每个客户端收到的本次运行日志条数(与 /api/logs/<运行ID> 比较)及推送时丢弃的条数
+- 推送扩散耗时: 同一条日志第一个客户端收到后,其余客户端收到它的时间差
+- 部署期间 /api/status?since=... 的响应时间(页面轮询状态使用的接口)
+
+部署比基线慢超过阈值、有连接失败/断开或有客户端日志不完整时退出码为 1,可用于 CI。
+
+Web 服务应指向测试环境或模拟服务,并关闭版本号缓存(TAG_CACHE_ENABLED=false),
+否则后一次部署可能跳过云效步骤而比基线快。几百个客户端本身很耗 CPU,应在另一台机器上运行
+(与 Web 服务在同一台机器上时用 nice 降低优先级)。客户端需要安装:
+    pip install "python-socketio[client]"
+
+使用方法:
+    # 300 个页面查看 frontend-test 部署(使用最近构建)
+    python loadtest.py --viewers 300 --tasks frontend-test --skip-build
+
+    # 页面只订阅部署涉及的项目的日志(project:<项目> 房间)
+    python loadtest.py --url http://deploy.example.com:5001 --viewers 500 --subscribe project
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import config
+from task_scheduler import DEPLOY_TASKS
+
+
+def http_json(url: str, data: Any = None, timeout: float = 10) -> Dict[str, Any]:
+    """GET(或带 data 时 POST JSON)并解析 JSON 响应"""
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    req = urllib.request.Request(url, data=body, headers=headers)
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def percentile(values: List[float], q: float) -> float:
+    """q 分位数(0~1),没有数据时为 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Viewer:
+    """一个模拟页面: Socket.IO 客户端,记录收到的每条日志的序号和接收时间"""
+
+    def __init__(self, socketio_module):
+        # websocket-client 默认用纯 Python 逐字节校验 UTF-8,几百个客户端时测试进程本身会占满 CPU
+        self.client = socketio_module.Client(
+            reconnection=False, websocket_extra_options={'skip_utf8_validation': True})
+        self.error: Optional[str] = None
+        self.closing = False
+        self.lost = False
+        self.dropped = 0
+        # 运行ID -> [(序号, 接收时间, 重复次数)]
+        self.received: Dict[str, List[tuple]] = {}
+        self._subscribed = threading.Event()
+        self._lock = threading.Lock()
+        self.client.on('log_batch', self._on_batch)
+        self.client.on('subscribed', lambda data: self._subscribed.set())
+        self.client.on('disconnect', self._on_disconnect)
+
+    def connect(self, url: str, subscribe: Optional[Dict[str, Any]], timeout: float = 30):
+        """连接并订阅(等待服务端确认订阅,之后的日志都会收到)"""
+        try:
+            self.client.connect(url, transports=['websocket'], wait_timeout=timeout)
+            if subscribe is not None:
+                self.client.emit('subscribe', subscribe)
+                if not self._subscribed.wait(timeout):
+                    raise TimeoutError('订阅未确认')
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {str(e)}"
+
+    def close(self):
+        self.closing = True
+        if self.client.connected:
+            self.client.disconnect()
+
+    def _on_batch(self, data):
+        now = time.monotonic()
+        with self._lock:
+            self.dropped += data.get('dropped', 0)
+            for entry in data.get('entries', []):
+                if entry.get('run_id'):
+                    self.received.setdefault(entry['run_id'], []).append(
+                        (entry.get('seq'), now, entry.get('repeat', 1)))
+
+    def _on_disconnect(self, *args):
+        if not self.closing:
+            self.lost = True
+
+    def entries(self, run_id: str) -> List[tuple]:
+        with self._lock:
+            return list(self.received.get(run_id, []))
+
+
+class StatusPoller:
+    """按页面的方式轮询 /api/status?since=...,记录响应时间"""
+
+    def __init__(self, base_url: str, interval: float):
+        self.base_url = base_url
+        self.interval = interval
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        cursor = 0
+        while not self._stop.wait(self.interval):
+            started = time.perf_counter()
+            try:
+                cursor = http_json(f"{self.base_url}/api/status?since={cursor}").get('cursor', cursor)
+                self.latencies.append(time.perf_counter() - started)
+            except Exception:
+                self.errors += 1
+
+
+def run_deploy(base_url: str, tasks: List[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    """
+    提交部署并等待作业结束
+
+    Returns:
+        作业信息 (/api/jobs/<作业ID>),duration 为作业开始到结束的耗时(秒,不含排队)
+    """
+    result = http_json(f"{base_url}/api/deploy", {'tasks': tasks, 'mode': 'all'})
+    if not result.get('success'):
+        raise Exception(f"提交部署失败: {result.get('message')}")
+    job = result['job']
+    if job.get('coalesced'):
+        raise Exception("部署与排队中的相同作业合并,请等待服务空闲后再测试")
+
+    deadline = time.monotonic() + timeout
+    while job['status'] in ('queued', 'running'):
+        if time.monotonic() > deadline:
+            raise Exception(f"部署超过 {timeout:g} 秒未结束 (作业 {job['job_id']})")
+        time.sleep(0.5)
+        job = http_json(f"{base_url}/api/jobs/{job['job_id']}")
+    job['duration'] = job['finished_at'] - job['started_at']
+    return job
+
+
+def connect_viewers(args, subscribe: Optional[Dict[str, Any]]) -> List[Viewer]:
+    """并发连接 args.viewers 个页面"""
+    try:
+        import socketio
+    except ImportError:
+        raise Exception('负载测试需要安装 Socket.IO 客户端: pip install "python-socketio[client]"')
+
+    viewers = [Viewer(socketio) for _ in range(args.viewers)]
+    with ThreadPoolExecutor(max_workers=args.connect_concurrency) as executor:
+        for viewer in viewers:
+            executor.submit(viewer.connect, args.url, subscribe)
+    return viewers
+
+
+def close_viewers(args, viewers: List[Viewer]):
+    """并发断开所有页面"""
+    with ThreadPoolExecutor(max_workers=args.connect_concurrency) as executor:
+        for viewer in viewers:
+            executor.submit(viewer.close)
+
+
+def delivery_stats(viewers: List[Viewer], run_id: str, expected: int) -> Dict[str, Any]:
+    """
+    日志送达统计
+
+    Returns:
+        received_min / received_median: 每个客户端收到的日志条数
+        incomplete: 少收日志的客户端数
+        dropped: 推送时丢弃的日志条数(所有客户端中的最大值)
+        spread_p50 / spread_p95 / spread_max: 推送扩散耗时(秒)
+    """
+    connected = [viewer for viewer in viewers if viewer.error is None]
+    first_seen: Dict[Any, float] = {}
+    per_viewer = []
+    for viewer in connected:
+        entries = viewer.entries(run_id)
+        per_viewer.append(entries)
+        for seq, received_at, _ in entries:
+            if seq not in first_seen or received_at < first_seen[seq]:
+                first_seen[seq] = received_at
+
+    counts = [sum(repeat for _, _, repeat in entries) for entries in per_viewer]
+    spreads = [received_at - first_seen[seq] for entries in per_viewer for seq, received_at, _ in entries]
+    return {
+        'received_min': min(counts) if counts else 0,
+        'received_median': percentile(counts, 0.5),
+        'incomplete': sum(1 for count in counts if count < expected),
+        'dropped': max((viewer.dropped for viewer in connected), default=0),
+        'spread_p50': percentile(spreads, 0.5),
+        'spread_p95': percentile(spreads, 0.95),
+        'spread_max': max(spreads, default=0.0),
+    }
+
+
+def expected_entries(base_url: str, run_id: str, projects: Optional[List[str]]) -> int:
+    """本次运行中客户端应收到的日志条数(订阅项目时只计这些项目的日志)"""
+    run_log = http_json(f"{base_url}/api/logs/{run_id}")
+    entries = run_log['entries']
+    if projects is not None:
+        entries = [entry for entry in entries if entry.get('project') in projects]
+    elif run_log.get('truncated'):
+        # 内存中只保留了最近的日志,被截断的部分也推送过
+        return len(entries) + run_log['truncated']
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Web 服务负载测试(大量页面同时查看部署日志)')
+    parser.add_argument('--url', default=f"http://127.0.0.1:{config.WEB_PORT}", help='Web 服务地址')
+    parser.add_argument('--viewers', type=int, default=300, help='同时连接的页面数')
+    parser.add_argument('--tasks', nargs='+', default=['frontend-test'], choices=sorted(DEPLOY_TASKS))
+    parser.add_argument('--skip-build', action='store_true', help='不触发构建,使用最近一次构建')
+    parser.add_argument('--subscribe', choices=['all', 'project'], default='all',
+                        help='页面订阅的日志: all(全部日志) | project(部署涉及的项目)')
+    parser.add_argument('--warmup', type=int, default=1, help='基线之前不计入比较的部署次数(预热浏览器池)')
+    parser.add_argument('--connect-concurrency', type=int, default=50, help='同时发起的连接数')
+    parser.add_argument('--status-interval', type=float, default=1.0, help='轮询 /api/status 的间隔(秒)')
+    parser.add_argument('--settle', type=float, default=2.0, help='部署结束后等待日志送达的时间(秒)')
+    parser.add_argument('--timeout', type=float, default=1800, help='单次部署的最长等待时间(秒)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定变慢的比例 (默认 0.2 即 20%%)')
+    parser.add_argument('--min-delta', type=float, default=1.0, help='判定变慢的最小秒数,过滤抖动')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+
+    if args.viewers < 1:
+        parser.error('--viewers 至少为 1')
+
+    tasks = [{'task_id': task_id, 'run_build': not args.skip_build} for task_id in args.tasks]
+    projects = sorted({DEPLOY_TASKS[task_id][1] for task_id in args.tasks}) if args.subscribe == 'project' else None
+    subscribe = {'projects': projects} if projects is not None else None
+
+    viewers: List[Viewer] = []
+    try:
+        for i in range(args.warmup):
+            job = run_deploy(args.url, tasks, args.timeout)
+            print(f"预热 {i + 1}: {job['duration']:.2f}秒 ({job['status']})")
+
+        baseline = run_deploy(args.url, tasks, args.timeout)
+        print(f"基线(无页面连接): {baseline['duration']:.2f}秒 ({baseline['status']})")
+
+        started = time.monotonic()
+        viewers = connect_viewers(args, subscribe)
+        failed = [viewer for viewer in viewers if viewer.error is not None]
+        print(f"连接 {len(viewers) - len(failed)}/{len(viewers)} 个页面: {time.monotonic() - started:.2f}秒")
+        for error in sorted({viewer.error for viewer in failed})[:5]:
+            print(f"  连接失败: {error}")
+
+        poller = StatusPoller(args.url, args.status_interval)
+        poller.start()
+        try:
+            loaded = run_deploy(args.url, tasks, args.timeout)
+            time.sleep(args.settle)
+        finally:
+            poller.stop()
+        print(f"{len(viewers)} 个页面查看: {loaded['duration']:.2f}秒 ({loaded['status']})")
+
+        expected = expected_entries(args.url, loaded['run_id'], projects)
+        stats = delivery_stats(viewers, loaded['run_id'], expected)
+        lost = sum(1 for viewer in viewers if viewer.lost)
+    except Exception as e:
+        print(f"❌ {str(e)}")
+        sys.exit(2)
+    finally:
+        close_viewers(args, viewers)
+
+    delta = loaded['duration'] - baseline['duration']
+    change = delta / baseline['duration'] * 100 if baseline['duration'] else 0
+
+    print()
+    print(f"{'部署耗时':<16}{baseline['duration']:>10.2f}秒 -> {loaded['duration']:.2f}秒 ({change:+.1f}%)")
+    print(f"{'连接失败/断开':<16}{len(failed):>10} / {lost}")
+    print(f"{'应收日志':<16}{expected:>10}")
+    print(f"{'实收(最少/中位)':<16}{stats['received_min']:>10} / {stats['received_median']}")
+    print(f"{'日志不完整页面':<16}{stats['incomplete']:>10}  (推送丢弃 {stats['dropped']} 条)")
+    print(f"{'推送扩散(秒)':<16}{stats['spread_p50']:>10.3f} p50 / {stats['spread_p95']:.3f} p95 / {stats['spread_max']:.3f} max")
+    print(f"{'状态轮询(秒)':<16}{percentile(poller.latencies, 0.5):>10.3f} p50 / "
+          f"{percentile(poller.latencies, 0.95):.3f} p95  (失败 {poller.errors} 次)")
+
+    if baseline['status'] != 'success' or loaded['status'] != 'success':
+        print("\n⚠️ 部署未成功,耗时比较仅供参考")
+
+    problems = []
+    if delta > args.min_delta and delta > baseline['duration'] * args.threshold:
+        problems.append(f"部署比基线慢 {change:.1f}%")
+    if failed or lost:
+        problems.append(f"{len(failed)} 个页面连接失败, {lost} 个页面意外断开")
+    if stats['incomplete']:
+        problems.append(f"{stats['incomplete']} 个页面日志不完整")
+    if poller.errors:
+        problems.append(f"状态轮询失败 {poller.errors} 次")
+    if problems:
+        print(f"\n❌ {'; '.join(problems)}")
+        sys.exit(1)
+    print(f"\n✅ {len(viewers)} 个页面查看日志时部署未变慢,日志完整送达")
+
+
+if __name__ == '__main__':
+    main()
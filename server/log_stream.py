@@ -0,0 +1,174 @@
+"""
+日志批量推送: 把逐行发送的日志合并为 log_batch 事件
+
+WebLogger.log 原先每行日志都同步执行一次 socketio.emit('log') 和 print,
+调度器每个步骤输出几十行日志,连接的页面越多广播越多,而且发送在部署线程中执行。
+
+LogBatcher 只在调用线程中把日志放入缓冲区,由后台线程发送:
+- 每隔 interval 秒或缓冲区达到 max_batch 条时发送一次 log_batch 事件
+- 相邻的重复日志(如分隔线)合并为一条,记录重复次数 repeat
+- 缓冲区最多保留 max_pending 条: 日志产生速度超过发送速度时丢弃最旧的日志,
+  丢弃数量随下一批一起发送 (dropped),部署线程永远不会因日志发送而阻塞
+  (线程模式下 emit 只是把消息交给各连接,不会因某个客户端慢而阻塞,
+  断线重连的页面按 since 请求 /api/status 补齐错过的日志)
+- 提供 route 时按日志所属的 Socket.IO 房间分别发送,每个房间只收到属于它的日志
+- 提供 clients 时按连接数拉长发送间隔: 每批日志都要发给每个连接(线程模式下每个连接唤醒一个发送线程),
+  每秒发送的消息总数限制在 max_sends 以内,单批条数相应增加,页面很多时不会挤占部署线程
+"""
+import sys
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+import config
+from metrics import LOG_DROPPED
+
+
+# 这些字段都相同的相邻日志才合并(不同运行/任务的日志不合并)
+_COALESCE_KEYS = ('message', 'level', 'run_id', 'task_id')
+
+
+class LogBatcher:
+    """日志缓冲与批量发送(线程安全)"""
+
+    def __init__(
+        self,
+        emit: Callable[..., None],
+        route: Optional[Callable[[Dict[str, Any]], List[str]]] = None,
+        interval: float = None,
+        max_batch: int = None,
+        max_pending: int = None,
+        console: bool = True,
+        clients: Optional[Callable[[], int]] = None,
+        max_sends: int = None,
+    ):
+        """
+        Args:
+            emit: 发送函数 emit(event, data, to=房间),如 socketio.emit
+            route: 返回日志应发送到的房间列表; 为 None 时每批日志广播给所有客户端
+            interval: 发送间隔(秒) (默认 config.LOG_BATCH_INTERVAL_MS)
+            max_batch: 单批最多条数,缓冲区达到该数量时立即发送 (默认 config.LOG_BATCH_MAX)
+            max_pending: 缓冲区上限,超出后丢弃最旧的日志 (默认 config.LOG_BATCH_MAX_PENDING)
+            console: 是否同时输出到控制台(在后台线程中批量输出)
+            clients: 返回当前连接数的函数,为 None 时不按连接数调整间隔
+            max_sends: 每秒发送的消息总数上限(所有连接合计) (默认 config.LOG_BATCH_MAX_SENDS, 0 表示不限制)
+        """
+        self.emit = emit
+        self.route = route
+        self.interval = (config.LOG_BATCH_INTERVAL_MS / 1000) if interval is None else interval
+        self.max_batch = max(1, max_batch or config.LOG_BATCH_MAX)
+        self.max_pending = max(self.max_batch, max_pending or config.LOG_BATCH_MAX_PENDING)
+        self.console = console
+        self.clients = clients
+        self.max_sends = config.LOG_BATCH_MAX_SENDS if max_sends is None else max_sends
+
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        # 统计
+        self.batches = 0
+        self.entries = 0
+        self.coalesced = 0
+        self.dropped_total = 0
+
+    def start(self):
+        """启动后台发送线程(重复调用无副作用)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='log-batcher', daemon=True)
+        self._thread.start()
+
+    def publish(self, entry: Dict[str, Any]):
+        """放入一条日志(不阻塞)"""
+        with self._lock:
+            last = self._pending[-1] if self._pending else None
+            if last and all(last.get(key) == entry.get(key) for key in _COALESCE_KEYS):
+                last['repeat'] = last.get('repeat', 1) + 1
+                self.coalesced += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+                self.dropped_total += 1
+                LOG_DROPPED.inc()
+            self._pending.append(dict(entry))
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def cycle(self) -> float:
+        """当前的发送间隔(秒): 连接数 / max_sends,不小于 interval"""
+        if self.clients is None or not self.max_sends:
+            return self.interval
+        return max(self.interval, self.clients() / self.max_sends)
+
+    def flush(self) -> int:
+        """立即发送缓冲区中的日志,返回发送的条数"""
+        sent = 0
+        # 间隔被拉长时单批条数按比例增加,避免拆成多批抵消限制
+        limit = self.max_batch * max(1, int(self.cycle() / self.interval)) if self.interval else self.max_batch
+        while True:
+            with self._lock:
+                if not self._pending and not self._dropped:
+                    return sent
+                batch: List[Dict[str, Any]] = [
+                    self._pending.popleft() for _ in range(min(limit, len(self._pending)))
+                ]
+                dropped, self._dropped = self._dropped, 0
+
+            if self.console:
+                lines = []
+                for entry in batch:
+                    suffix = f" (x{entry['repeat']})" if entry.get('repeat', 1) > 1 else ""
+                    lines.append(f"[{entry['timestamp']}] [{entry['level']}] {entry['message']}{suffix}\n")
+                if dropped:
+                    lines.append(f"[日志] 发送跟不上,已丢弃 {dropped} 条日志\n")
+                sys.stdout.write(''.join(lines))
+                sys.stdout.flush()
+
+            self._emit(batch, dropped)
+            self.batches += 1
+            self.entries += len(batch)
+            sent += len(batch)
+
+    def _emit(self, batch: List[Dict[str, Any]], dropped: int):
+        """发送一批日志(按房间拆分时保持每个房间内的顺序)"""
+        if self.route is None:
+            groups = {None: batch}
+        else:
+            groups: Dict[str, List[Dict[str, Any]]] = {}
+            for entry in batch:
+                for room in self.route(entry):
+                    groups.setdefault(room, []).append(entry)
+            # 只有丢弃数量时广播给所有客户端
+            groups = groups or {None: []}
+        for room, entries in groups.items():
+            try:
+                if room is None:
+                    self.emit('log_batch', {'entries': entries, 'dropped': dropped})
+                else:
+                    self.emit('log_batch', {'entries': entries, 'dropped': dropped}, to=room)
+            except Exception as e:
+                sys.stderr.write(f"发送日志失败: {str(e)}\n")
+
+    def close(self, timeout: float = 2):
+        """发送剩余日志并停止后台线程"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+            # 连接数多时拉长间隔(缓冲区满也不提前发送)
+            extra = self.cycle() - self.interval
+            if extra > 0:
+                self._stopped.wait(extra)
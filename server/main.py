@@ -18,6 +18,7 @@ from datetime import datetime
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
 import config
+from browser_pool import save_auth_state
 from utils import log, take_screenshot, format_duration
 from yunxiao import trigger_build_and_fetch_tag
 from k8s import update_deployment_image
@@ -73,7 +74,7 @@ async def main():
             tag = await trigger_build_and_fetch_tag(page)
 
             # 立即保存登录状态(云效部分完成后)
-            await context.storage_state(path=config.AUTH_FILE)
+            await save_auth_state(context)
             log(f"云效登录状态已保存到: {config.AUTH_FILE}", "INFO")
 
             log("-" * 60, "INFO")
@@ -89,7 +90,7 @@ async def main():
             log("【步骤 2/2】完成!", "SUCCESS")
 
             # 再次保存登录状态(包含 K8s 登录信息)
-            await context.storage_state(path=config.AUTH_FILE)
+            await save_auth_state(context)
             log(f"登录状态已更新到: {config.AUTH_FILE}", "INFO")
 
             # 计算总耗时
@@ -110,7 +111,7 @@ async def main():
 
             # 尝试保存登录状态
             try:
-                await context.storage_state(path=config.AUTH_FILE)
+                await save_auth_state(context)
                 log(f"登录状态已保存", "INFO")
             except:
                 pass
@@ -122,7 +123,7 @@ async def main():
 
             # 尝试保存登录状态(即使失败也保存)
             try:
-                await context.storage_state(path=config.AUTH_FILE)
+                await save_auth_state(context)
                 log(f"登录状态已保存(失败时)", "INFO")
             except:
                 log("无法保存登录状态", "WARNING")
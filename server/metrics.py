@@ -0,0 +1,226 @@
+"""
+Prometheus 文本格式的运行指标(供 Web 服务的 /metrics 使用)
+
+不依赖 prometheus_client,只实现需要的 Counter / Gauge / Histogram:
+
+- deploy_duration_seconds          端到端部署耗时(每个任务),按项目/环境
+- deploy_step_duration_seconds     各步骤耗时,按步骤/项目/环境
+- deploy_total / deploy_step_total 成功与失败次数
+- browser_launches_total           Chromium 启动次数
+- deploy_jobs_queued / browser_pool_waiting 等即时值(部署队列中排队的作业数、等待空闲浏览器的任务数、
+  Socket.IO 客户端数)在抓取时通过回调读取
+
+步骤数据来自 tracing 模块的 span(调用 install_span_metrics() 后生效)。
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import config
+from tracing import Span, Tracer, add_span_listener
+
+# 部署步骤耗时从几十毫秒(页面操作)到十几分钟(等待构建)不等
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """指标基类: 按标签值分别记录"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(指标名后缀, 标签文本, 值)"""
+        return []
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        for key, value in items:
+            yield '', _format_labels(self.labelnames, key), value
+
+
+class Gauge(_Metric):
+    """即时值,抓取时调用回调读取"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float] = None):
+        super().__init__(name, documentation)
+        self._read = read
+        self._value = 0.0
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, read: Callable[[], float]):
+        self._read = read
+
+    def samples(self):
+        if self._read is not None:
+            try:
+                value = float(self._read())
+            except Exception:
+                return
+        else:
+            with self._lock:
+                value = self._value
+        yield '', '', value
+
+
+class Histogram(_Metric):
+    """累积分桶的耗时分布"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # key -> (每个桶的计数, 总和, 总数)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        bucket_labels = self.labelnames + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', _format_labels(bucket_labels, key + (_format_value(bound),)), cumulative
+            yield '_sum', _format_labels(self.labelnames, key), total
+            yield '_count', _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """指标集合"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+DEPLOY_DURATION = registry.register(Histogram(
+    'deploy_duration_seconds', '端到端部署耗时(单个任务,从开始到完成)', ('project', 'env')))
+DEPLOY_TOTAL = registry.register(Counter(
+    'deploy_total', '部署任务完成次数', ('project', 'env', 'result')))
+STEP_DURATION = registry.register(Histogram(
+    'deploy_step_duration_seconds', '部署步骤耗时', ('step', 'project', 'env')))
+STEP_TOTAL = registry.register(Counter(
+    'deploy_step_total', '部署步骤完成次数', ('step', 'project', 'env', 'result')))
+BROWSER_LAUNCHES = registry.register(Counter(
+    'browser_launches_total', 'Chromium 启动次数(浏览器池与独立运行)'))
+ACTIVE_RUNS = registry.register(Gauge(
+    'deploy_active_runs', '正在执行的部署请求数'))
+BROWSER_POOL_WAITING = registry.register(Gauge(
+    'browser_pool_waiting', '等待空闲浏览器的任务数(浏览器池; 工作进程模式不使用浏览器池,始终为 0)'))
+BUILDS_IN_FLIGHT = registry.register(Gauge(
+    'yunxiao_builds_in_flight', '进行中的云效构建数(同一流水线的并发请求共享一次构建)'))
+SOCKETIO_CLIENTS = registry.register(Gauge(
+    'socketio_clients', '已连接的 Socket.IO 客户端数'))
+JOBS_QUEUED = registry.register(Gauge(
+    'deploy_jobs_queued', '部署队列中排队等待的作业数'))
+LOG_DROPPED = registry.register(Counter(
+    'log_entries_dropped_total', '推送跟不上而丢弃的日志条数'))
+
+
+def observe_step(name: str, duration: float, ok: bool, project: str = '', env: str = ''):
+    """记录一个步骤: 任务(task)记为端到端耗时,其余记为步骤耗时"""
+    result = 'success' if ok else 'failure'
+    if name == 'task':
+        DEPLOY_DURATION.observe(duration, project=project, env=env)
+        DEPLOY_TOTAL.inc(project=project, env=env, result=result)
+    else:
+        STEP_DURATION.observe(duration, step=name, project=project, env=env)
+        STEP_TOTAL.inc(step=name, project=project, env=env, result=result)
+
+
+def _record_span(finished: Span, tracer: Tracer):
+    """span 结束回调"""
+    observe_step(
+        finished.name,
+        finished.duration,
+        finished.status == 'ok',
+        project=tracer.inherited_attr(finished, 'project') or '',
+        env=tracer.inherited_attr(finished, 'env') or '',
+    )
+
+
+def install_span_metrics():
+    """把 span 统计接入指标(重复调用无副作用)"""
+    if config.METRICS_ENABLED:
+        add_span_listener(_record_span)
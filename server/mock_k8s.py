@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Kubernetes API 及 Kuboard 页面的本地模拟服务,用于离线测试 API 模式 (K8S_MODE=api) 和页面模式
+
+模拟的接口:
+- GET   /apis/apps/v1/namespaces/<ns>/deployments/<name>   读取 Deployment
+- PATCH /apis/apps/v1/namespaces/<ns>/deployments/<name>   strategic-merge PATCH(按容器名合并)
+
+请求必须携带 Authorization: Bearer <token>,否则返回 401。
+
+模拟的页面(页面模式,与 k8s.py 使用的选择器一致):
+- GET   /.../namespace/<ns>/workload/view/Deployment/<name>   Deployment 详情页:
+        未登录时显示登录表单; 登录后显示【调整镜像版本】按钮、调整弹窗、二次确认弹窗,
+        确认后页面通过上面的 PATCH 接口更新镜像
+- POST  /kuboard-api/login                                    登录,成功后写入会话 Cookie
+
+使用方法:
+    python mock_k8s.py --port 8802 --token mock-token \\
+        --deployment jpms/jpms-web=registry.example.com/javaly/jpms-web:dev-1
+
+    # 另一个终端
+    K8S_MODE=api K8S_DEV_API_SERVER=http://127.0.0.1:8802 K8S_DEV_API_TOKEN=mock-token python web_server.py
+"""
+import argparse
+import copy
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEFAULT_TOKEN = 'mock-token'
+DEPLOYMENT_PATH = re.compile(r'/apis/apps/v1/namespaces/([^/]+)/deployments/([^/?]+)')
+KUBOARD_PAGE_PATH = re.compile(r'.*/namespace/([^/]+)/workload/view/Deployment/([^/?]+)/?')
+
+# 页面登录后写入的会话 Cookie
+SESSION_COOKIE_NAME = 'KuboardSession'
+SESSION_COOKIE_VALUE = 'mock-session'
+
+
+def make_deployment(namespace: str, name: str, image: str) -> Dict:
+    """构造只包含一个同名容器的 Deployment 对象"""
+    return {
+        'apiVersion': 'apps/v1',
+        'kind': 'Deployment',
+        'metadata': {'name': name, 'namespace': namespace, 'generation': 1},
+        'spec': {'template': {'spec': {'containers': [{'name': name, 'image': image}]}}},
+    }
+
+
+class MockClusterState:
+    """模拟集群中的 Deployment"""
+
+    def __init__(
+        self,
+        token: str = DEFAULT_TOKEN,
+        latency_ms: float = 0,
+        page_delay_ms: float = 0,
+        dialog_delay_ms: float = 0,
+        username: str = 'admin',
+        password: str = 'admin',
+    ):
+        """
+        Args:
+            token: 接口接受的 Bearer Token
+            latency_ms: 每个接口请求的模拟延迟(毫秒)
+            page_delay_ms: 页面及登录请求的响应延迟(毫秒)
+            dialog_delay_ms: 页面中弹窗打开前的延迟(毫秒)
+            username: 页面登录账号
+            password: 页面登录密码
+        """
+        self.token = token
+        self.latency_ms = latency_ms
+        self.page_delay_ms = page_delay_ms
+        self.dialog_delay_ms = dialog_delay_ms
+        self.username = username
+        self.password = password
+        self.deployments: Dict[tuple, Dict] = {}
+        self.patches: List[Dict] = []  # 收到的 PATCH 记录,便于测试断言
+        self._lock = threading.Lock()
+
+    def add(self, namespace: str, name: str, image: str) -> None:
+        self.deployments[(namespace, name)] = make_deployment(namespace, name, image)
+
+    def get(self, namespace: str, name: str) -> Optional[Dict]:
+        with self._lock:
+            deployment = self.deployments.get((namespace, name))
+            return copy.deepcopy(deployment) if deployment else None
+
+    def patch(self, namespace: str, name: str, patch: Dict) -> Optional[Dict]:
+        """按 strategic-merge 规则合并容器列表(按 name 匹配)"""
+        with self._lock:
+            deployment = self.deployments.get((namespace, name))
+            if not deployment:
+                return None
+            containers = deployment['spec']['template']['spec']['containers']
+            patch_containers = patch.get('spec', {}).get('template', {}).get('spec', {}).get('containers', [])
+            for patch_container in patch_containers:
+                target = next((c for c in containers if c['name'] == patch_container['name']), None)
+                if target is None:
+                    containers.append(dict(patch_container))
+                else:
+                    target.update(patch_container)
+            deployment['metadata']['generation'] += 1
+            self.patches.append({'namespace': namespace, 'name': name, 'patch': patch, 'time': time.time()})
+            return copy.deepcopy(deployment)
+
+    def image_of(self, namespace: str, name: str, container: str = None) -> Optional[str]:
+        deployment = self.get(namespace, name)
+        if not deployment:
+            return None
+        for c in deployment['spec']['template']['spec']['containers']:
+            if c['name'] == (container or name):
+                return c['image']
+        return None
+
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Sign in</title></head>
+<body>
+<form class="el-form" onsubmit="return false">
+  <div><input class="el-input__inner" placeholder="请输入用户名"></div>
+  <div><input class="el-input__inner" type="password" placeholder="请输入密码"></div>
+  <div id="login-error"></div>
+  <button class="el-button el-button--primary" type="button">登 录</button>
+</form>
+<script>
+document.querySelector('.el-button--primary').onclick = async () => {
+  const inputs = document.querySelectorAll('input');
+  const resp = await fetch('/kuboard-api/login', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ username: inputs[0].value, password: inputs[1].value }),
+  });
+  if (resp.ok) location.reload();
+  else document.getElementById('login-error').textContent = '用户名或密码错误';
+};
+</script>
+</body>
+</html>
+"""
+
+DEPLOYMENT_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__NAME__</title>
+<style>
+body { font-family: sans-serif; margin: 24px; }
+.el-dialog { position: fixed; top: 80px; left: 20%; width: 60%; background: #fff; border: 1px solid #ccc; padding: 16px; }
+</style>
+</head>
+<body>
+<ul class="el-menu"><li>工作负载</li></ul>
+<h2>Deployment __NAME__</h2>
+<div>当前镜像: <span id="current-image"></span></div>
+<div>应用操作: <button class="el-button" id="adjust-button"><span>调整镜像版本</span></button></div>
+<script>
+const CONFIG = __CONFIG__;
+const api = `/apis/apps/v1/namespaces/${CONFIG.namespace}/deployments/${CONFIG.name}`;
+let containers = [];
+
+async function request(method, body) {
+  const resp = await fetch(api, {
+    method,
+    headers: { 'Authorization': `Bearer ${CONFIG.token}`, 'Content-Type': 'application/strategic-merge-patch+json' },
+    body: body ? JSON.stringify(body) : undefined,
+  });
+  return resp.json();
+}
+
+async function load() {
+  const deployment = await request('GET');
+  containers = deployment.spec.template.spec.containers;
+  document.getElementById('current-image').textContent = containers.map(c => c.image).join(', ');
+}
+
+function removeDialogs() {
+  document.querySelectorAll('.el-dialog').forEach(el => el.remove());
+}
+
+function openAdjustDialog() {
+  const dialog = document.createElement('div');
+  dialog.className = 'el-dialog';
+  const rows = containers.map(c => {
+    const tag = c.image.split(':').pop();
+    return `<tr class="el-table__row"><td>${c.name}</td><td>${c.image}</td>`
+      + `<td><div class="el-input"><input class="el-input__inner" data-container="${c.name}" value="${tag}"></div></td></tr>`;
+  }).join('');
+  dialog.innerHTML = '<div class="el-dialog__header">调整镜像版本</div>'
+    + '<table><tr><th>容器</th><th>当前镜像</th><th>新版本</th></tr>' + rows + '</table>'
+    + '<div class="el-dialog__footer"><button class="el-button cancel">取 消</button>'
+    + ' <button class="el-button el-button--primary confirm">确 定</button></div>';
+  dialog.querySelector('.cancel').onclick = removeDialogs;
+  dialog.querySelector('.confirm').onclick = () => setTimeout(() => openConfirmDialog(dialog), CONFIG.dialogDelayMs);
+  document.body.append(dialog);
+}
+
+function openConfirmDialog(adjustDialog) {
+  const dialog = document.createElement('div');
+  dialog.className = 'el-dialog';
+  dialog.innerHTML = '<div class="el-dialog__header">确认调整镜像版本</div><p>确认要更新镜像吗?</p>'
+    + '<div class="el-dialog__footer"><button class="el-button el-button--primary">确 定</button></div>';
+  dialog.querySelector('button').onclick = async () => {
+    const patched = [...adjustDialog.querySelectorAll('input[data-container]')].map(input => {
+      const container = containers.find(c => c.name === input.dataset.container);
+      return { name: container.name, image: container.image.replace(/:[^:/]+$/, '') + ':' + input.value };
+    });
+    await request('PATCH', { spec: { template: { spec: { containers: patched } } } });
+    removeDialogs();
+    await load();
+  };
+  document.body.append(dialog);
+}
+
+document.getElementById('adjust-button').onclick = () => setTimeout(openAdjustDialog, CONFIG.dialogDelayMs);
+load();
+</script>
+</body>
+</html>
+"""
+
+
+class MockK8sHandler(BaseHTTPRequestHandler):
+    """模拟接口的请求处理"""
+
+    protocol_version = 'HTTP/1.1'
+    state: MockClusterState = None
+
+    def log_message(self, format, *args):
+        pass  # 保持输出安静
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_html(self, html: str) -> None:
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _logged_in(self) -> bool:
+        return f"{SESSION_COOKIE_NAME}={SESSION_COOKIE_VALUE}" in self.headers.get('Cookie', '')
+
+    def _serve_page(self, namespace: str, name: str) -> None:
+        """Deployment 详情页(未登录时为登录表单)"""
+        if self.state.page_delay_ms:
+            time.sleep(self.state.page_delay_ms / 1000)
+        if not self._logged_in():
+            return self._send_html(LOGIN_PAGE)
+        page_config = {
+            'namespace': namespace,
+            'name': name,
+            'token': self.state.token,
+            'dialogDelayMs': self.state.dialog_delay_ms,
+        }
+        self._send_html(DEPLOYMENT_PAGE.replace('__NAME__', name).replace('__CONFIG__', json.dumps(page_config)))
+
+    def _login(self, body: bytes) -> None:
+        if self.state.page_delay_ms:
+            time.sleep(self.state.page_delay_ms / 1000)
+        try:
+            credentials = json.loads(body or b'{}')
+        except ValueError:
+            credentials = {}
+        if credentials.get('username') != self.state.username or credentials.get('password') != self.state.password:
+            return self._send_json(401, {'message': 'invalid username or password'})
+        payload = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Set-Cookie', f"{SESSION_COOKIE_NAME}={SESSION_COOKIE_VALUE}; Path=/")
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _status(self, code: int, reason: str, message: str) -> None:
+        self._send_json(code, {'kind': 'Status', 'status': 'Failure', 'reason': reason, 'message': message, 'code': code})
+
+    def _prepare(self):
+        """校验 Token 并解析路径,失败时已写出响应并返回 None"""
+        if self.state.latency_ms:
+            time.sleep(self.state.latency_ms / 1000)
+        if self.headers.get('Authorization', '') != f"Bearer {self.state.token}":
+            self._status(401, 'Unauthorized', 'Unauthorized')
+            return None
+        match = DEPLOYMENT_PATH.fullmatch(self.path.split('?', 1)[0])
+        if not match:
+            self._status(404, 'NotFound', f"the server could not find the requested resource: {self.path}")
+            return None
+        return match.group(1), match.group(2)
+
+    def do_GET(self):
+        page = KUBOARD_PAGE_PATH.fullmatch(self.path.split('?', 1)[0])
+        if page:
+            return self._serve_page(page.group(1), page.group(2))
+        target = self._prepare()
+        if not target:
+            return
+        deployment = self.state.get(*target)
+        if not deployment:
+            return self._status(404, 'NotFound', f'deployments.apps "{target[1]}" not found')
+        self._send_json(200, deployment)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        if self.path.split('?', 1)[0] == '/kuboard-api/login':
+            return self._login(body)
+        self._status(404, 'NotFound', f"the server could not find the requested resource: {self.path}")
+
+    def do_PATCH(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        target = self._prepare()
+        if not target:
+            return
+        content_type = self.headers.get('Content-Type', '')
+        if content_type != 'application/strategic-merge-patch+json':
+            return self._status(415, 'UnsupportedMediaType', f"the body of the request was in an unknown format: {content_type}")
+        try:
+            patch = json.loads(body or b'{}')
+        except ValueError as e:
+            return self._status(400, 'BadRequest', str(e))
+        deployment = self.state.patch(*target, patch)
+        if not deployment:
+            return self._status(404, 'NotFound', f'deployments.apps "{target[1]}" not found')
+        self._send_json(200, deployment)
+
+
+def start_server(host: str = '127.0.0.1', port: int = 8802, state: MockClusterState = None):
+    """
+    在后台线程中启动模拟服务
+
+    Returns:
+        (server, state) 调用 server.shutdown() 停止
+    """
+    state = state or MockClusterState()
+    handler = type('Handler', (MockK8sHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mock-k8s', daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kubernetes API 模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8802)
+    parser.add_argument('--token', default=DEFAULT_TOKEN, help='接受的 Bearer Token')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每个请求的模拟延迟(毫秒)')
+    parser.add_argument('--page-delay-ms', type=float, default=0, help='页面及登录请求的响应延迟(毫秒)')
+    parser.add_argument('--dialog-delay-ms', type=float, default=0, help='页面弹窗打开前的延迟(毫秒)')
+    parser.add_argument('--username', default='admin', help='页面登录账号')
+    parser.add_argument('--password', default='admin', help='页面登录密码')
+    parser.add_argument(
+        '--deployment', action='append', default=[], metavar='NS/NAME=IMAGE',
+        help='预置的 Deployment,可重复指定',
+    )
+    args = parser.parse_args()
+
+    state = MockClusterState(
+        args.token, args.latency_ms,
+        page_delay_ms=args.page_delay_ms, dialog_delay_ms=args.dialog_delay_ms,
+        username=args.username, password=args.password,
+    )
+    for spec in args.deployment or ['jpms/jpms-web=registry.example.com/javaly/jpms-web:dev-1']:
+        target, _, image = spec.partition('=')
+        namespace, _, name = target.partition('/')
+        state.add(namespace, name, image)
+
+    server, _ = start_server(args.host, args.port, state)
+    print(f"K8s API 模拟服务已启动: http://{args.host}:{args.port} (Ctrl+C 退出)")
+    print(f"Kuboard 页面: http://{args.host}:{args.port}/k/namespace/<ns>/workload/view/Deployment/<name>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+云效流水线的本地模拟服务,用于离线测试 http 模式 (YUNXIAO_MODE=http) 和浏览器模式
+
+模拟的接口与 config 中 YUNXIAO_API_*_PATH 的默认值一致:
+- POST /api/pipelines/<pipeline_id>/runs               运行流水线
+- GET  /api/pipelines/<pipeline_id>/runs/latest        最近一次运行
+- GET  /api/pipelines/<pipeline_id>/runs/<run_id>      运行状态
+- GET  /api/pipelines/<pipeline_id>/runs/<run_id>/log  构建日志
+
+模拟的页面(浏览器模式,与 yunxiao.py 使用的选择器一致):
+- GET  /pipelines/<pipeline_id>    流水线页面: 【运行】按钮、"运行配置"弹窗、运行状态、
+                                   任务卡片的【日志】按钮及日志弹窗; 页面数据通过上述接口加载
+
+请求必须携带登录 Cookie,否则返回 302 跳转到 /login(模拟登录失效)。
+
+使用方法:
+    python mock_yunxiao.py --port 8801 --build-seconds 5 --write-auth mock_auth.json
+
+    # 另一个终端
+    YUNXIAO_MODE=http YUNXIAO_API_BASE=http://127.0.0.1:8801 AUTH_FILE=mock_auth.json python web_server.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+import config
+
+# 模拟服务接受的登录 Cookie
+SESSION_COOKIE_NAME = 'login_aliyunid_ticket'
+SESSION_COOKIE_VALUE = 'mock-session'
+
+
+# 流水线页面的任务卡片(第二个任务负责镜像构建)
+DEFAULT_JOBS = ['代码检查', 'Java 构建Docker镜像并推送镜像仓库']
+
+
+class MockPipelineState:
+    """模拟的流水线运行记录"""
+
+    def __init__(
+        self,
+        build_seconds: float = 5,
+        project: str = 'jpms-web',
+        branch: str = 'dev',
+        page_delay_ms: float = 0,
+        dialog_delay_ms: float = 0,
+        log_delay_ms: float = 0,
+        jobs: List[str] = None,
+        pipeline_projects: Dict[str, str] = None,
+    ):
+        """
+        Args:
+            build_seconds: 每次构建耗时(秒)
+            project: 日志中镜像的项目名
+            branch: tag 前缀(分支名)
+            page_delay_ms: 页面及页面数据接口的响应延迟(毫秒)
+            dialog_delay_ms: 页面中弹窗打开前的延迟(毫秒)
+            log_delay_ms: 构建日志接口的响应延迟(毫秒)
+            jobs: 流水线页面上的任务卡片名称
+            pipeline_projects: 各流水线日志中镜像的项目名(未列出的流水线使用 project)
+        """
+        self.build_seconds = build_seconds
+        self.project = project
+        self.branch = branch
+        self.page_delay_ms = page_delay_ms
+        self.dialog_delay_ms = dialog_delay_ms
+        self.log_delay_ms = log_delay_ms
+        self.jobs = list(jobs or DEFAULT_JOBS)
+        self.pipeline_projects = dict(pipeline_projects or {})
+        self.runs: Dict[str, Dict[str, Dict]] = {}
+        self.requests = 0  # 收到的请求数(页面与接口)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start_run(self, pipeline_id: str) -> Dict:
+        with self._lock:
+            run_id = str(self._next_id)
+            self._next_id += 1
+            now = time.time()
+            tag = f"{self.branch}-{datetime.fromtimestamp(now).strftime('%Y-%m-%d-%H-%M-%S')}"
+            project = self.pipeline_projects.get(pipeline_id, self.project)
+            run = {'runId': run_id, 'status': 'RUNNING', 'startTime': now, 'tag': tag, 'project': project}
+            self.runs.setdefault(pipeline_id, {})[run_id] = run
+            return run
+
+    def get_run(self, pipeline_id: str, run_id: str) -> Optional[Dict]:
+        run = self.runs.get(pipeline_id, {}).get(run_id)
+        if run and run['status'] == 'RUNNING' and time.time() - run['startTime'] >= self.build_seconds:
+            run['status'] = 'SUCCESS'
+        return run
+
+    def latest_run(self, pipeline_id: str) -> Optional[Dict]:
+        runs = self.runs.get(pipeline_id, {})
+        if not runs:
+            return None
+        return self.get_run(pipeline_id, max(runs, key=int))
+
+    def image_of(self, run: Dict) -> str:
+        return f"{config.IMAGE_REGISTRY}/{config.IMAGE_NAMESPACE}/{run['project']}:{run['tag']}"
+
+    def run_summary(self, run: Dict) -> Dict:
+        """接口返回的运行信息(构建成功后包含镜像地址,与控制台数据接口类似)"""
+        data = {'runId': run['runId'], 'status': run['status']}
+        if run['status'] == 'SUCCESS':
+            data['image'] = self.image_of(run)
+        return data
+
+    def build_log(self, run: Dict, job: str) -> str:
+        image = self.image_of(run)
+        lines = [
+            f"[{job or '镜像构建并推送'}] Step 1/5 : FROM node:18-alpine",
+            "Step 2/5 : COPY . /app",
+            "Step 3/5 : RUN npm ci && npm run build",
+            "Successfully built 3f2a1c9d8e7b",
+            f"Successfully tagged {image}",
+            f"The push refers to repository [{image.rsplit(':', 1)[0]}]",
+            f"{run['tag']}: digest: sha256:0123456789abcdef size: 1573",
+            f"推送镜像成功: {image}",
+        ]
+        return '\n'.join(lines)
+
+
+PIPELINE_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>流水线 __PIPELINE_ID__</title>
+<style>
+body { font-family: sans-serif; margin: 24px; }
+.next-dialog { position: fixed; top: 80px; left: 20%; width: 60%; background: #fff; border: 1px solid #ccc; padding: 16px; }
+.flow-job-new--hoverableWrapper--p4fKlSv { display: inline-block; border: 1px solid #ddd; padding: 8px; margin: 8px; }
+.log-panel__context { height: 120px; overflow: auto; white-space: pre; font-family: monospace; }
+</style>
+</head>
+<body>
+<h2>流水线 __PIPELINE_ID__</h2>
+<div><span id="run-status"></span> <button id="run-button">运行</button></div>
+<div id="jobs"></div>
+<script>
+const CONFIG = __CONFIG__;
+const api = `/api/pipelines/${CONFIG.pipelineId}/runs`;
+let latest = null;
+let pollTimer = null;
+
+function later(fn) { setTimeout(fn, CONFIG.dialogDelayMs); }
+
+function removeDialog(id) {
+  const el = document.getElementById(id);
+  if (el) el.remove();
+}
+
+function renderStatus() {
+  const status = document.getElementById('run-status');
+  const jobs = document.getElementById('jobs');
+  jobs.innerHTML = '';
+  if (!latest) { status.textContent = '暂无运行记录'; return; }
+  status.textContent = latest.status === 'SUCCESS' ? '运行成功' : (latest.status === 'RUNNING' ? '运行中' : '运行失败');
+  if (latest.status !== 'SUCCESS') return;
+  for (const name of CONFIG.jobs) {
+    const card = document.createElement('div');
+    card.className = 'flow-job-new--hoverableWrapper--p4fKlSv';
+    const title = document.createElement('span');
+    title.textContent = name + ' ';
+    const button = document.createElement('button');
+    button.textContent = '日志';
+    button.onclick = () => later(() => openLog(name));
+    card.append(title, button);
+    jobs.append(card);
+  }
+}
+
+async function refresh() {
+  const resp = await fetch(latest ? `${api}/${latest.runId}` : `${api}/latest`);
+  latest = (await resp.json()).data;
+  renderStatus();
+  clearTimeout(pollTimer);
+  if (latest && latest.status === 'RUNNING') pollTimer = setTimeout(refresh, CONFIG.pollMs);
+}
+
+function openRunDialog() {
+  const dialog = document.createElement('div');
+  dialog.id = 'run-dialog';
+  dialog.className = 'next-dialog';
+  dialog.innerHTML = '<h3>运行配置</h3><p>分支: ' + CONFIG.branch + '</p>'
+    + '<button class="confirm">运行</button> <button class="cancel">取消</button>';
+  dialog.querySelector('.cancel').onclick = () => removeDialog('run-dialog');
+  dialog.querySelector('.confirm').onclick = async () => {
+    const resp = await fetch(api, { method: 'POST' });
+    const data = (await resp.json()).data;
+    removeDialog('run-dialog');
+    latest = { runId: data.runId, status: 'RUNNING' };
+    renderStatus();
+    pollTimer = setTimeout(refresh, CONFIG.pollMs);
+  };
+  document.body.append(dialog);
+}
+
+function openLog(job) {
+  const dialog = document.createElement('div');
+  dialog.id = 'log-dialog';
+  dialog.className = 'next-dialog';
+  dialog.innerHTML = '<button class="next-dialog-close">关闭</button><h3>' + job + '</h3>'
+    + '<div class="log-step"></div><div class="log-container__body"></div>';
+  const step = dialog.querySelector('.log-step');
+  step.textContent = CONFIG.logExpandText;
+  step.onclick = async () => {
+    const resp = await fetch(`${api}/${latest.runId}/log?job=${encodeURIComponent(job)}`);
+    const panel = document.createElement('div');
+    panel.className = 'log-panel__context right';
+    panel.textContent = (await resp.json()).data.content;
+    dialog.querySelector('.log-container__body').append(panel);
+  };
+  dialog.querySelector('.next-dialog-close').onclick = () => removeDialog('log-dialog');
+  document.body.append(dialog);
+}
+
+document.getElementById('run-button').onclick = () => later(openRunDialog);
+refresh();
+</script>
+</body>
+</html>
+"""
+
+
+class MockYunxiaoHandler(BaseHTTPRequestHandler):
+    """模拟接口的请求处理"""
+
+    protocol_version = 'HTTP/1.1'  # 支持长连接
+    state: MockPipelineState = None
+
+    def log_message(self, format, *args):
+        pass  # 保持输出安静
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_html(self, html: str) -> None:
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _pipeline_page(self, pipeline_id: str) -> str:
+        page_config = {
+            'pipelineId': pipeline_id,
+            'branch': self.state.branch,
+            'jobs': self.state.jobs,
+            'logExpandText': config.YUNXIAO_LOG_EXPAND_TEXT,
+            'dialogDelayMs': self.state.dialog_delay_ms,
+            'pollMs': 500,
+        }
+        return (PIPELINE_PAGE
+                .replace('__PIPELINE_ID__', pipeline_id)
+                .replace('__CONFIG__', json.dumps(page_config, ensure_ascii=False)))
+
+    def _authorized(self) -> bool:
+        cookie = self.headers.get('Cookie', '')
+        if f"{SESSION_COOKIE_NAME}={SESSION_COOKIE_VALUE}" in cookie:
+            return True
+        self.send_response(302)
+        self.send_header('Location', '/login?redirect=' + self.path)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return False
+
+    def do_POST(self):
+        self.state.count_request()
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        if not self._authorized():
+            return
+        if self.state.page_delay_ms:
+            time.sleep(self.state.page_delay_ms / 1000)
+
+        match = re.fullmatch(r'/api/pipelines/([^/]+)/runs', self.path)
+        if not match:
+            return self._send_json(404, {'success': False, 'errorMessage': 'not found'})
+        run = self.state.start_run(match.group(1))
+        self._send_json(200, {'success': True, 'data': {'runId': run['runId']}})
+
+    def do_GET(self):
+        self.state.count_request()
+        if not self._authorized():
+            return
+
+        path, _, query = self.path.partition('?')
+        if path.endswith('/log'):
+            delay_ms = self.state.log_delay_ms
+        else:
+            delay_ms = self.state.page_delay_ms
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        match = re.fullmatch(r'/pipelines?/([^/]+)/?', path)
+        if match:
+            return self._send_html(self._pipeline_page(match.group(1)))
+
+        match = re.fullmatch(r'/api/pipelines/([^/]+)/runs/latest', path)
+        if match:
+            run = self.state.latest_run(match.group(1))
+            data = self.state.run_summary(run) if run else None
+            return self._send_json(200, {'success': True, 'data': data})
+
+        match = re.fullmatch(r'/api/pipelines/([^/]+)/runs/([^/]+)(/log)?', path)
+        if match:
+            run = self.state.get_run(match.group(1), match.group(2))
+            if not run:
+                return self._send_json(404, {'success': False, 'errorMessage': 'run not found'})
+            if match.group(3):
+                job = unquote(dict(p.split('=', 1) for p in query.split('&') if '=' in p).get('job', ''))
+                return self._send_json(200, {'success': True, 'data': {'content': self.state.build_log(run, job)}})
+            return self._send_json(200, {'success': True, 'data': self.state.run_summary(run)})
+
+        self._send_json(404, {'success': False, 'errorMessage': 'not found'})
+
+
+def start_server(host: str = '127.0.0.1', port: int = 8801, state: MockPipelineState = None):
+    """
+    在后台线程中启动模拟服务
+
+    Returns:
+        (server, state) 调用 server.shutdown() 停止
+    """
+    state = state or MockPipelineState()
+    handler = type('Handler', (MockYunxiaoHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mock-yunxiao', daemon=True).start()
+    return server, state
+
+
+def write_auth_file(path: str, host: str = '127.0.0.1'):
+    """生成包含模拟登录 Cookie 的 storage state 文件"""
+    state = {
+        'cookies': [{
+            'name': SESSION_COOKIE_NAME,
+            'value': SESSION_COOKIE_VALUE,
+            'domain': host,
+            'path': '/',
+            'expires': -1,
+            'httpOnly': True,
+            'secure': False,
+            'sameSite': 'Lax',
+        }],
+        'origins': [],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='云效流水线接口模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8801)
+    parser.add_argument('--build-seconds', type=float, default=5, help='每次构建耗时(秒)')
+    parser.add_argument('--project', default='jpms-web', help='日志中镜像的项目名')
+    parser.add_argument('--page-delay-ms', type=float, default=0, help='页面及数据接口的响应延迟(毫秒)')
+    parser.add_argument('--dialog-delay-ms', type=float, default=0, help='页面弹窗打开前的延迟(毫秒)')
+    parser.add_argument('--log-delay-ms', type=float, default=0, help='构建日志接口的响应延迟(毫秒)')
+    parser.add_argument('--write-auth', metavar='PATH', help='生成包含模拟登录 Cookie 的 storage state 文件')
+    args = parser.parse_args()
+
+    if args.write_auth:
+        write_auth_file(args.write_auth, args.host)
+        print(f"已生成登录状态文件: {args.write_auth}")
+
+    server, _ = start_server(args.host, args.port, MockPipelineState(
+        args.build_seconds, args.project,
+        page_delay_ms=args.page_delay_ms, dialog_delay_ms=args.dialog_delay_ms, log_delay_ms=args.log_delay_ms,
+    ))
+    print(f"云效模拟服务已启动: http://{args.host}:{args.port} (Ctrl+C 退出)")
+    print(f"流水线页面: http://{args.host}:{args.port}/pipelines/<pipeline_id>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""
+部署工作进程池: EXECUTION_MODE=process 时每个部署作业在独立的子进程中执行
+
+Playwright 崩溃或页面等待卡死只影响执行该作业的工作进程,不会拖垮 Web 服务:
+
+- 工作进程是运行本模块的独立 Python 进程(不会重新导入 web_server),各自启动浏览器
+  (不使用 Web 服务的浏览器池),多个作业可以同时占用多个 CPU 核心
+- 日志和步骤耗时通过管道实时传回 Web 服务,作业结束后传回各任务的执行结果
+- 作业超过 WORKER_TIMEOUT 秒未结束时强制结束工作进程; 工作进程异常退出时作业失败
+- 每个工作进程执行 WORKER_MAX_JOBS 个作业后退出,下一个作业使用新进程(回收泄漏的资源)
+- 构建合并由 Web 服务进程的 build_flights 协调: 工作进程触发构建前通过管道询问,
+  同一流水线的构建已在进行中(其他工作进程或线程模式的部署)时等待其版本号,不会重复触发
+
+版本号缓存(tag_cache)通过文件共享,跨进程有效。
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import config
+import file_log
+from singleflight import SingleFlight, build_flights
+
+# 工作进程发回的消息: (类型, 数据)
+#   ('log', {'message', 'level', 'task_id', 'project'})
+#   ('span', {'name', 'duration', 'ok', 'project', 'env'})
+#   ('file_log', (时间, 级别, 内容, 运行ID))  utils.log 的输出,由进程池直接写入 Web 服务的日志文件
+#   ('flight_join', {'id', 'key'})            要触发构建,询问是否已有进行中的构建
+#   ('flight_done', {'id', 'result'} 或 {'id', 'error'})  由本进程发起的构建结束
+#   ('done', [任务执行结果])
+#   ('error', 错误信息)
+# Web 服务在作业执行中发给工作进程的消息:
+#   ('flight', {'id', 'lead': True})            没有进行中的构建,由工作进程触发
+#   ('flight', {'id', 'lead': False, 'result'})  复用其他请求的构建结果
+#   ('flight', {'id', 'error'})                 共享的构建失败
+MessageCallback = Callable[[str, Any], None]
+
+
+class _ParentFlights:
+    """工作进程中的构建合并: 通过管道由 Web 服务进程的 build_flights 协调 (与 SingleFlight.do 接口相同)"""
+
+    def __init__(self, conn: Connection, send: MessageCallback):
+        self.conn = conn
+        self.send = send
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    def start(self):
+        """作业开始: 在事件循环中读取 Web 服务的回复"""
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self._on_readable)
+
+    def stop(self):
+        """作业结束: 停止读取,之后管道由 _worker_main 接收下一个作业"""
+        asyncio.get_running_loop().remove_reader(self.conn.fileno())
+        self._fail_all("作业已结束")
+
+    def _fail_all(self, reason: str):
+        for future in self._replies.values():
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+        self._replies.clear()
+
+    def _on_readable(self):
+        try:
+            kind, data = self.conn.recv()
+        except EOFError:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            self._fail_all("与 Web 服务的连接已断开")
+            return
+        future = self._replies.pop(data['id'], None) if kind == 'flight' else None
+        if future and not future.done():
+            future.set_result(data)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = future
+        self.send('flight_join', {'id': request_id, 'key': key})
+        reply = await future
+        if 'error' in reply:
+            raise Exception(reply['error'])
+        if not reply['lead']:
+            return reply['result'], True
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.send('flight_done', {'id': request_id, 'error': "共享的构建已被取消"})
+            raise
+        except BaseException as e:
+            self.send('flight_done', {'id': request_id, 'error': str(e)})
+            raise
+        self.send('flight_done', {'id': request_id, 'result': result})
+        return result, False
+
+
+def _worker_main(conn, max_jobs: int):
+    """工作进程入口: 依次执行收到的作业,执行 max_jobs 个后退出"""
+    import utils
+    from tracing import add_span_listener
+
+    # Connection 不是线程安全的: 日志和步骤耗时也会在 asyncio.to_thread 的线程中发送
+    send_lock = threading.Lock()
+
+    def send(kind: str, data: Any):
+        with send_lock:
+            conn.send((kind, data))
+
+    # 工作进程的日志通过管道交给 Web 服务写入日志文件,避免多个进程轮转同一个文件
+    config.LOG_FILE_ENABLED = False
+    utils.set_file_writer(lambda *line: send('file_log', line))
+
+    def forward_span(finished, tracer):
+        send('span', {
+            'name': finished.name,
+            'duration': finished.duration,
+            'ok': finished.status == 'ok',
+            'project': tracer.inherited_attr(finished, 'project') or '',
+            'env': tracer.inherited_attr(finished, 'env') or '',
+        })
+
+    add_span_listener(forward_span)
+    jobs = 0
+    while jobs < max_jobs:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        if not isinstance(job, dict):
+            continue  # 上一个作业结束后才到达的构建合并回复
+        jobs += 1
+        try:
+            send('done', asyncio.run(_run_job(job, conn, send)))
+        except BaseException as e:
+            send('error', f"{type(e).__name__}: {str(e)}")
+
+
+async def _run_job(job: Dict[str, Any], conn: Connection, send: MessageCallback) -> List[Dict[str, Any]]:
+    """在工作进程中执行一个作业,返回各任务的执行结果"""
+    # 在子进程中导入: 父进程只需要进程管理,不加载 Playwright
+    from task_scheduler import TaskScheduler, create_deploy_tasks, current_task
+
+    def log_callback(message: str, level: str = "INFO"):
+        task = current_task.get()
+        send('log', {
+            'message': message,
+            'level': level,
+            'task_id': task.task_id if task else None,
+            'project': task.project if task else None,
+        })
+
+    flights = _ParentFlights(conn, send)
+    flights.start()
+    try:
+        scheduler = TaskScheduler(log_callback=log_callback, run_id=job['run_id'], flights=flights)
+        for task in create_deploy_tasks(job['tasks']):
+            scheduler.add_task(task)
+        await scheduler.execute_all()
+    finally:
+        flights.stop()
+    return [task.summary() for task in scheduler.tasks]
+
+
+class _Worker:
+    """一个工作进程及其管道"""
+
+    def __init__(self, max_jobs: int):
+        parent_sock, child_sock = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child_sock.fileno()), str(max_jobs)],
+            pass_fds=(child_sock.fileno(),),
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        self.jobs = 0
+
+    @property
+    def exitcode(self) -> Optional[int]:
+        return self.process.poll()
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            pass
+        self.conn.close()
+
+    def retire(self):
+        """通知进程退出(已执行的作业数达到上限)"""
+        try:
+            self.conn.send(None)
+            self.process.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+
+class WorkerPool:
+    """部署工作进程池(在常驻事件循环中使用)"""
+
+    def __init__(self, size: int = None, timeout: float = None, max_jobs: int = None,
+                 flights: SingleFlight = None):
+        """
+        Args:
+            size: 同时执行的作业数上限 (默认 config.WORKER_PROCESSES)
+            timeout: 单个作业的最长执行时间(秒) (默认 config.WORKER_TIMEOUT)
+            max_jobs: 每个工作进程执行的作业数上限 (默认 config.WORKER_MAX_JOBS)
+            flights: 协调各工作进程构建的注册表 (默认使用进程内共享的 build_flights)
+        """
+        self.size = max(1, size or config.WORKER_PROCESSES)
+        self.timeout = timeout or config.WORKER_TIMEOUT
+        self.max_jobs = max(1, max_jobs or config.WORKER_MAX_JOBS)
+        self.flights = flights or build_flights
+        self._idle: List[_Worker] = []
+        self._busy: List[_Worker] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.started = 0
+
+    def _acquire_worker(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.alive():
+                return worker
+            worker.kill()
+        self.started += 1
+        return _Worker(self.max_jobs)
+
+    async def _release_worker(self, worker: _Worker, healthy: bool):
+        if worker in self._busy:
+            self._busy.remove(worker)
+        # 结束进程需要等待进程退出,在线程中执行,不阻塞事件循环
+        if not healthy:
+            await asyncio.to_thread(worker.kill)
+        elif worker.jobs >= self.max_jobs:
+            await asyncio.to_thread(worker.retire)
+        else:
+            self._idle.append(worker)
+
+    async def _join_flight(self, worker: _Worker, request: Dict[str, Any], leading: Dict[int, asyncio.Future]):
+        """代工作进程加入构建合并: 没有进行中的构建时由工作进程触发,否则把共享的结果发给它"""
+        loop = asyncio.get_running_loop()
+
+        async def lead():
+            # 等待工作进程发回 flight_done
+            waiter = loop.create_future()
+            leading[request['id']] = waiter
+            self._reply(worker, {'id': request['id'], 'lead': True})
+            return await waiter
+
+        try:
+            result, shared = await self.flights.do(request['key'], lead)
+        except Exception as e:
+            self._reply(worker, {'id': request['id'], 'error': str(e)})
+            return
+        if shared:
+            self._reply(worker, {'id': request['id'], 'lead': False, 'result': result})
+
+    @staticmethod
+    def _reply(worker: _Worker, data: Dict[str, Any]):
+        try:
+            worker.conn.send(('flight', data))
+        except OSError:
+            pass  # 工作进程已退出,作业随后按异常退出处理
+
+    @staticmethod
+    def _recv(conn, timeout: float):
+        """等待一条消息,超时返回 None; 进程退出时抛出 EOFError"""
+        if conn.poll(timeout):
+            return conn.recv()
+        return None
+
+    async def run(self, job: Dict[str, Any], on_message: MessageCallback) -> List[Dict[str, Any]]:
+        """
+        在工作进程中执行作业
+
+        Args:
+            job: {'tasks': [...], 'run_id': ...}
+            on_message: 收到日志(log)/步骤耗时(span)消息时的回调 on_message(类型, 数据)
+
+        Returns:
+            各任务的执行结果 (DeployTask.summary())
+
+        Raises:
+            TimeoutError: 超过 timeout 未结束(工作进程已被强制结束)
+            RuntimeError: 工作进程异常退出或作业执行出错
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            worker = await asyncio.to_thread(self._acquire_worker)
+            self._busy.append(worker)
+            healthy = False
+            # 构建合并: 请求 ID -> 等待工作进程发回结果的 Future(由该工作进程发起的构建)
+            leading: Dict[int, asyncio.Future] = {}
+            flight_tasks: Dict[int, asyncio.Task] = {}
+            try:
+                worker.conn.send({'tasks': job['tasks'], 'run_id': job['run_id']})
+                worker.jobs += 1
+                deadline = time.monotonic() + self.timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"部署超过 {self.timeout:g} 秒未结束,已结束工作进程")
+                    try:
+                        message = await asyncio.to_thread(self._recv, worker.conn, min(remaining, 1.0))
+                    except (EOFError, OSError):
+                        raise RuntimeError(f"工作进程异常退出 (exitcode={worker.exitcode})")
+                    if message is None:
+                        continue
+                    kind, data = message
+                    if kind == 'file_log':
+                        file_log.write(*data)
+                        continue
+                    if kind == 'flight_join':
+                        flight_tasks[data['id']] = asyncio.ensure_future(self._join_flight(worker, data, leading))
+                        continue
+                    if kind == 'flight_done':
+                        waiter = leading.pop(data['id'], None)
+                        if waiter and not waiter.done():
+                            if 'error' in data:
+                                waiter.set_exception(Exception(data['error']))
+                            else:
+                                waiter.set_result(data['result'])
+                        continue
+                    if kind == 'done':
+                        healthy = True
+                        return data
+                    if kind == 'error':
+                        # 作业出错但进程正常,进程仍可复用
+                        healthy = True
+                        raise RuntimeError(data)
+                    on_message(kind, data)
+            finally:
+                # 由该工作进程发起但没有结束的构建: 等待它的其他请求收到错误,不会一直等待
+                for waiter in leading.values():
+                    if not waiter.done():
+                        waiter.set_exception(RuntimeError("发起构建的部署已结束,构建结果未知"))
+                # 该工作进程仍在等待的其他构建: 只结束自己的等待
+                for request_id, task in flight_tasks.items():
+                    if request_id not in leading:
+                        task.cancel()
+                if flight_tasks:
+                    await asyncio.gather(*flight_tasks.values(), return_exceptions=True)
+                # 超时、取消或进程异常时结束工作进程
+                await self._release_worker(worker, healthy)
+
+    async def close(self):
+        """结束所有工作进程"""
+        for worker in self._idle + self._busy:
+            await asyncio.to_thread(worker.kill)
+        self._idle.clear()
+        self._busy.clear()
+
+
+if __name__ == '__main__':
+    # 工作进程: python process_pool.py <管道文件描述符> <作业数上限>
+    _worker_main(Connection(int(sys.argv[1])), int(sys.argv[2]))
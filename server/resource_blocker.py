@@ -0,0 +1,115 @@
+"""
+资源拦截: 在自动化浏览器上下文中中止与流程无关的请求
+
+云效和 Kuboard 页面加载时会下载图片、字体、统计埋点和帮助组件脚本,
+这些资源对自动化没有作用,还会推迟 wait_for_load_state('networkidle')。
+按资源类型和 URL 关键词拦截,白名单中的 URL 始终放行(如登录二维码)。
+
+被中止的请求不会产生响应,无法得知节省的流量,只统计各资源类型被拦截的请求数。
+"""
+from typing import Dict, Iterable, Optional
+from playwright.async_api import BrowserContext, Route
+import config
+
+# 页面和接口请求是 SPA 运行所必需的,不允许按类型拦截
+NEVER_BLOCKED_TYPES = {'document', 'xhr', 'fetch', 'websocket'}
+
+
+def _split(value: str) -> list:
+    return [item.strip().lower() for item in value.split(',') if item.strip()]
+
+
+class BlockStats:
+    """拦截统计: 请求数,以及按资源类型的分布"""
+
+    def __init__(self):
+        self.requests = 0
+        self.by_type: Dict[str, int] = {}
+
+    def record(self, resource_type: str):
+        self.requests += 1
+        self.by_type[resource_type] = self.by_type.get(resource_type, 0) + 1
+
+    def snapshot(self) -> 'BlockStats':
+        copy = BlockStats()
+        copy.merge(self)
+        return copy
+
+    def merge(self, other: 'BlockStats'):
+        """累加另一份统计"""
+        self.requests += other.requests
+        for resource_type, count in other.by_type.items():
+            self.by_type[resource_type] = self.by_type.get(resource_type, 0) + count
+
+    def since(self, earlier: 'BlockStats') -> 'BlockStats':
+        """返回从 earlier 快照到现在新增的部分"""
+        delta = BlockStats()
+        delta.requests = self.requests - earlier.requests
+        for resource_type, count in self.by_type.items():
+            diff = count - earlier.by_type.get(resource_type, 0)
+            if diff:
+                delta.by_type[resource_type] = diff
+        return delta
+
+
+class ResourceBlocker:
+    """按资源类型 / URL 关键词中止请求的路由规则"""
+
+    def __init__(
+        self,
+        resource_types: Iterable[str] = (),
+        url_patterns: Iterable[str] = (),
+        allowlist: Iterable[str] = (),
+    ):
+        """
+        Args:
+            resource_types: 拦截的资源类型 (Playwright resource_type,如 image、font、media)
+            url_patterns: 拦截的 URL 关键词(不区分资源类型,如统计埋点域名)
+            allowlist: 始终放行的 URL 关键词,优先级高于拦截规则
+        """
+        self.resource_types = set(resource_types) - NEVER_BLOCKED_TYPES
+        self.url_patterns = list(url_patterns)
+        self.allowlist = list(allowlist)
+        self.stats = BlockStats()
+
+    @classmethod
+    def from_config(cls) -> Optional['ResourceBlocker']:
+        """按 config 创建,未启用拦截时返回 None"""
+        if not config.BLOCK_RESOURCES:
+            return None
+        return cls(
+            _split(config.BLOCKED_RESOURCE_TYPES),
+            _split(config.BLOCKED_URL_PATTERNS),
+            _split(config.BLOCK_ALLOWLIST),
+        )
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        """判断请求是否应被中止"""
+        url = url.lower()
+        if any(pattern in url for pattern in self.allowlist):
+            return False
+        if resource_type in self.resource_types:
+            return True
+        return any(pattern in url for pattern in self.url_patterns)
+
+    async def install(self, context: BrowserContext):
+        """在浏览器上下文上注册路由"""
+        await context.route('**/*', self._handle)
+
+    async def _handle(self, route: Route):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            self.stats.record(request.resource_type)
+            await route.abort('blockedbyclient')
+        else:
+            await route.fallback()
+
+
+def format_stats(stats: BlockStats) -> str:
+    """格式化拦截统计,例如 "拦截 12 个请求: image 10, font 2" """
+    detail = ', '.join(
+        f"{resource_type} {count}"
+        for resource_type, count in sorted(stats.by_type.items(), key=lambda item: item[1], reverse=True)
+    )
+    text = f"拦截 {stats.requests} 个请求"
+    return f"{text}: {detail}" if detail else text
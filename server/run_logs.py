@@ -0,0 +1,123 @@
+"""
+按运行保存的日志: 每次部署一个固定容量的环形缓冲区,结束后的旧运行写入压缩文件
+
+WebLogger 原先把所有日志追加到一个永不清理的列表中,服务运行越久占用内存越多。
+RunLogStore 保证内存占用有上限:
+- 每次运行最多保留 capacity 行,超出时丢弃最旧的行(记录丢弃数量 truncated)
+- 内存中最多保留 keep_runs 次已结束的运行,更早的运行写入
+  LOG_DIR/run-<运行ID>.json.gz 后从内存中移除,仍可通过 get() 读取
+"""
+import gzip
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import config
+
+_SAFE_RUN_ID = re.compile(r'^[\w.-]+$')
+
+
+class RunLog:
+    """单次运行的日志(环形缓冲区)"""
+
+    def __init__(self, run_id: str, capacity: int):
+        self.run_id = run_id
+        self.entries = deque(maxlen=capacity)
+        self.total = 0
+        self.started = datetime.now().isoformat()
+        self.finished = None
+
+    def append(self, entry: Dict[str, Any]):
+        self.entries.append(entry)
+        self.total += 1
+
+    @property
+    def truncated(self) -> int:
+        """因超出容量被丢弃的行数"""
+        return self.total - len(self.entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'run_id': self.run_id,
+            'started': self.started,
+            'finished': self.finished,
+            'truncated': self.truncated,
+            'entries': list(self.entries),
+        }
+
+
+class RunLogStore:
+    """所有运行的日志(线程安全)"""
+
+    def __init__(self, capacity: int = None, keep_runs: int = None, spill_dir: str = None):
+        """
+        Args:
+            capacity: 每次运行保留的最大行数 (默认 config.LOG_RUN_BUFFER)
+            keep_runs: 内存中保留的已结束运行数 (默认 config.LOG_RUNS_IN_MEMORY)
+            spill_dir: 旧运行的写入目录 (默认 config.LOG_DIR)
+        """
+        self.capacity = max(1, capacity or config.LOG_RUN_BUFFER)
+        self.keep_runs = max(0, config.LOG_RUNS_IN_MEMORY if keep_runs is None else keep_runs)
+        self.spill_dir = spill_dir or config.LOG_DIR
+        self._active: Dict[str, RunLog] = {}
+        self._finished: 'OrderedDict[str, RunLog]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, run_id: str) -> RunLog:
+        """创建(或取得进行中的)运行日志"""
+        with self._lock:
+            run_log = self._active.get(run_id)
+            if run_log is None:
+                run_log = self._active[run_id] = RunLog(run_id, self.capacity)
+            return run_log
+
+    def finish(self, run_id: str):
+        """标记运行结束,超出保留数量的旧运行写入压缩文件"""
+        spilled: List[RunLog] = []
+        with self._lock:
+            run_log = self._active.pop(run_id, None)
+            if run_log is None:
+                return
+            run_log.finished = datetime.now().isoformat()
+            self._finished[run_id] = run_log
+            while len(self._finished) > self.keep_runs:
+                spilled.append(self._finished.popitem(last=False)[1])
+
+        for old in spilled:
+            try:
+                self._spill(old)
+            except Exception as e:
+                print(f"写入运行日志失败 ({old.run_id}): {str(e)}")
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """读取运行日志(内存中或已写入文件),不存在时返回 None"""
+        with self._lock:
+            run_log = self._active.get(run_id) or self._finished.get(run_id)
+            if run_log is not None:
+                return run_log.to_dict()
+        path = self.spill_path(run_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def runs(self) -> List[str]:
+        """内存中的运行ID(进行中的在前)"""
+        with self._lock:
+            return list(self._active) + list(reversed(self._finished))
+
+    def spill_path(self, run_id: str) -> Optional[str]:
+        if not _SAFE_RUN_ID.match(run_id):
+            return None
+        return os.path.join(self.spill_dir, f"run-{run_id}.json.gz")
+
+    def _spill(self, run_log: RunLog):
+        path = self.spill_path(run_log.run_id)
+        if path is None:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(run_log.to_dict(), f, ensure_ascii=False)
@@ -0,0 +1,95 @@
+"""
+Single-flight: 同一 key 同时只执行一次,并发调用方共享同一个结果
+
+用于云效构建去重: 以流水线地址为 key,进程内任意调度器(任意请求、任意事件循环)
+在构建进行中再次请求同一条流水线时,不会触发新的运行,而是等待进行中的构建,
+并拿到同一个版本号。
+
+基于 concurrent.futures.Future 和线程锁实现,因此可跨线程/事件循环共享。
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+
+class SingleFlight:
+    """按 key 合并并发执行的异步调用"""
+
+    def __init__(self):
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._started: Dict[str, float] = {}
+        self._waiters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 fn(),如果同一 key 已在执行中则等待其结果
+
+        Args:
+            key: 去重 key(如流水线地址)
+            fn: 无参数的协程函数,仅在当前没有进行中的调用时执行
+
+        Returns:
+            (结果, 是否复用了进行中的调用)
+
+        Raises:
+            进行中的调用失败时,所有等待方都会收到同一个异常
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            shared = future is not None
+            if shared:
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+            else:
+                future = concurrent.futures.Future()
+                self._inflight[key] = future
+                self._started[key] = time.time()
+                self._waiters[key] = 0
+
+        if shared:
+            # 取消等待方(如服务退出、调用超时)只结束它自己的等待,不能取消共享的 Future
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._settle(future, exception=Exception("共享的构建已被取消"))
+            raise
+        except BaseException as e:
+            self._settle(future, exception=e)
+            raise
+        else:
+            self._settle(future, result=result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._started.pop(key, None)
+                self._waiters.pop(key, None)
+
+    @staticmethod
+    def _settle(future: concurrent.futures.Future, result: Any = None, exception: BaseException = None):
+        """设置共享结果(Future 已结束时忽略)"""
+        if future.done():
+            return
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass  # 检查后被其他线程结束
+
+    def in_flight(self) -> List[Dict[str, Any]]:
+        """进行中的调用: [{'key', 'started_at', 'waiters'}]"""
+        with self._lock:
+            return [
+                {'key': key, 'started_at': self._started[key], 'waiters': self._waiters.get(key, 0)}
+                for key in self._inflight
+            ]
+
+
+# 进程内共享的云效构建注册表(key 为流水线地址)
+build_flights = SingleFlight()
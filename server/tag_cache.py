@@ -0,0 +1,166 @@
+"""
+持久化版本号缓存: 跨调度器会话复用已获取的镜像版本号
+
+TaskScheduler.tag_cache 只在一次运行内有效,每个新请求使用"最近构建"时
+都要重新打开云效读取日志。本缓存把 (项目, 环境, 运行 ID) -> tag 保存到磁盘:
+
+- 每条记录都对应一次运行: HTTP 模式由接口返回运行 ID,浏览器模式由页面的网络响应确认运行 ID,
+  无法确认运行 ID 的版本号不记录
+- latest() 返回已记录的最新一次运行(运行 ID 最大)的版本号,"最近构建"模式直接复用,不访问云效;
+  流水线在本工具之外运行过时,TTL 内仍会复用本工具记录的版本号
+- 超过 TTL 的记录视为过期,不再返回
+- 记录数超过上限时淘汰最久未使用的记录(最近使用时间只在内存中更新,随下一次写入保存)
+- 写入使用临时文件 + 原子替换; 文件被其他进程修改后自动重新加载
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import config
+
+
+class TagCache:
+    """磁盘缓存的版本号记录(线程安全)"""
+
+    def __init__(self, path: str = None, ttl_seconds: float = None, max_entries: int = None):
+        """
+        Args:
+            path: 缓存文件路径 (默认 config.TAG_CACHE_FILE)
+            ttl_seconds: 记录有效期(秒) (默认 config.TAG_CACHE_TTL)
+            max_entries: 最多保留的记录数 (默认 config.TAG_CACHE_MAX_ENTRIES)
+        """
+        self.path = path or config.TAG_CACHE_FILE
+        self.ttl_seconds = config.TAG_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        self.max_entries = max(1, max_entries or config.TAG_CACHE_MAX_ENTRIES)
+        self._entries: List[Dict[str, Any]] = []
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """文件有变化时重新读取(损坏的文件视为空缓存)"""
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime == self._mtime:
+            return
+        entries = []
+        if mtime is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f).get('entries', [])
+            except (OSError, ValueError, AttributeError):
+                entries = []
+        self._entries = entries
+        self._mtime = mtime
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tag_cache_', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self._entries}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._mtime = os.path.getmtime(self.path)
+
+    def _evict(self, now: float):
+        """删除过期记录,超出上限时按最近使用时间淘汰"""
+        self._entries = [e for e in self._entries if now - e['created_at'] < self.ttl_seconds]
+        if len(self._entries) > self.max_entries:
+            self._entries.sort(key=lambda e: e['last_used'], reverse=True)
+            del self._entries[self.max_entries:]
+
+    def _valid(self, project: str, env: str, now: float) -> List[Dict[str, Any]]:
+        return [
+            e for e in self._entries
+            if e['project'] == project and e['env'] == env and now - e['created_at'] < self.ttl_seconds
+        ]
+
+    def get(self, project: str, env: str, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询某次运行的版本号记录
+
+        Args:
+            project: 项目类型
+            env: 环境类型
+            run_id: 流水线运行 ID
+
+        Returns:
+            记录 {'project', 'env', 'run_id', 'tag', 'created_at', 'last_used'},未命中时返回 None
+        """
+        with self._lock:
+            self._load()
+            now = time.time()
+            candidates = [e for e in self._valid(project, env, now) if e['run_id'] == str(run_id)]
+            return self._use(max(candidates, key=lambda e: e['created_at']), now) if candidates else None
+
+    def latest(self, project: str, env: str) -> Optional[Dict[str, Any]]:
+        """
+        已记录的最新一次运行的版本号记录(不访问云效)
+
+        Returns:
+            运行 ID 最大的有效记录,没有时返回 None
+        """
+        with self._lock:
+            self._load()
+            now = time.time()
+            candidates = self._valid(project, env, now)
+            return self._use(max(candidates, key=_run_order), now) if candidates else None
+
+    @staticmethod
+    def _use(entry: Dict[str, Any], now: float) -> Dict[str, Any]:
+        # 命中时不重写文件,淘汰顺序以内存中的使用时间为准
+        entry['last_used'] = now
+        return dict(entry)
+
+    def put(self, project: str, env: str, tag: str, run_id: str):
+        """记录某次运行的版本号(同一运行或同一 tag 的旧记录会被替换)"""
+        with self._lock:
+            self._load()
+            now = time.time()
+            run_id = str(run_id)
+            replaced = [
+                e for e in self._entries
+                if e['project'] == project and e['env'] == env and (e['run_id'] == run_id or e['tag'] == tag)
+            ]
+            self._entries = [e for e in self._entries if e not in replaced]
+            self._entries.append({
+                'project': project,
+                'env': env,
+                'run_id': run_id,
+                'tag': tag,
+                'created_at': now,
+                'last_used': now,
+            })
+            self._evict(now)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._save()
+
+
+def _run_order(entry: Dict[str, Any]):
+    """记录的先后: 云效运行 ID 按时间递增,按数值比较; 相同时按记录时间"""
+    run_id = entry['run_id']
+    return (int(run_id) if run_id.isdigit() else -1, entry['created_at'])
+
+
+_cache: Optional[TagCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_tag_cache() -> Optional[TagCache]:
+    """获取进程内共享的缓存,未启用时返回 None"""
+    global _cache
+    if not config.TAG_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TagCache()
+    return _cache
@@ -3,19 +3,38 @@
 任务调度器 - 支持多任务并行/串行执行
 """
 import asyncio
-from typing import List, Dict, Callable, Any
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from contextvars import ContextVar
+from typing import List, Dict, Callable, Any, Optional
 from datetime import datetime
 from playwright.async_api import async_playwright
 import config
-from utils import log
+from browser_pool import BrowserPool, launch_browser, new_automation_context, save_auth_state
+from config import ExecutionContext
+from resource_blocker import ResourceBlocker, BlockStats, format_stats
+from singleflight import SingleFlight, build_flights
+from tag_cache import TagCache, get_tag_cache
+from tracing import Tracer, current_tracer, span
+from utils import log, SleepBudget, current_sleep_budget, record_fixed_wait
 from yunxiao import trigger_build_and_fetch_tag, trigger_backend_build_and_fetch_tag
-from k8s import update_deployment_image
+from k8s import update_deployment_image, update_deployment_targets
 
 
 class DeployTask:
     """部署任务定义"""
 
-    def __init__(self, task_id: str, name: str, project: str, env: str, run_build: bool = True):
+    def __init__(
+        self,
+        task_id: str,
+        name: str,
+        project: str,
+        env: str,
+        run_build: bool = True,
+        depends_on: List[str] = None,
+    ):
         """
         Args:
             task_id: 任务ID (如 'frontend-test')
@@ -25,17 +44,32 @@ class DeployTask:
             run_build: 是否触发云效构建 (默认 True)
                        - True: 触发新构建并获取版本号
                        - False: 跳过触发,从最近一次构建中获取版本号
+            depends_on: 依赖的任务ID列表。依赖全部成功后才执行,并使用依赖任务的版本号
+                        (如部署任务依赖同项目的构建任务); 任一依赖未成功时本任务被跳过
         """
         self.task_id = task_id
         self.name = name
         self.project = project
         self.env = env
         self.run_build = run_build
-        self.status = 'pending'  # pending, running, success, error
+        self.depends_on = list(depends_on or [])
+        self.input_tag = None  # 依赖任务传递的版本号
+        self.status = 'pending'  # pending, running, success, error, skipped
         self.error_message = None
         self.start_time = None
         self.end_time = None
         self.tag = None  # 镜像版本号
+        self.target_results = []  # 多个 K8s 目标时每个目标的更新结果 (k8s.TargetResult)
+
+    def summary(self) -> Dict[str, Any]:
+        """执行结果(可序列化,供 Web 服务更新状态或从工作进程传回)"""
+        return {
+            'task_id': self.task_id,
+            'status': self.status,
+            'tag': self.tag,
+            'targets': [asdict(result) for result in self.target_results],
+            'error': self.error_message,
+        }
 
     def get_config(self) -> Dict[str, str]:
         """获取任务对应的配置"""
@@ -46,21 +80,89 @@ class DeployTask:
         else:
             raise ValueError(f"未知的项目类型: {self.project}")
 
+    def get_context(self) -> ExecutionContext:
+        """获取任务的执行上下文(云效/K8s 地址、凭证等)"""
+        return ExecutionContext.from_config(self.get_config(), project=self.project, env=self.env)
+
+
+# Web 服务可部署的任务: task_id -> (名称, 项目, 环境)
+DEPLOY_TASKS = {
+    'frontend-build': ('前端云效构建', 'frontend', 'build'),
+    'frontend-test': ('前端测试环境', 'frontend', 'test'),
+    'backend-build': ('后端云效构建', 'backend', 'build'),
+    'backend-test': ('后端测试环境', 'backend', 'test'),
+}
+
+
+def create_deploy_tasks(selected_tasks: List[Dict[str, Any]]) -> List[DeployTask]:
+    """
+    按 Web 请求中选中的任务创建 DeployTask (未知的任务ID被忽略)
+
+    同时选择了同项目的构建任务时,部署任务依赖构建任务并使用其版本号
+
+    Args:
+        selected_tasks: [{'task_id': 'frontend-test', 'run_build': True}, ...]
+    """
+    selected_ids = {task_info['task_id'] for task_info in selected_tasks}
+    tasks = []
+    for task_info in selected_tasks:
+        task_id = task_info['task_id']
+        if task_id not in DEPLOY_TASKS:
+            continue
+        name, proj, env = DEPLOY_TASKS[task_id]
+        build_task_id = f"{proj}-build"
+        depends_on = [build_task_id] if env != 'build' and build_task_id in selected_ids else []
+        tasks.append(DeployTask(task_id, name, proj, env, run_build=task_info['run_build'], depends_on=depends_on))
+    return tasks
+
+
+# 当前正在执行的任务: 日志回调据此标记日志所属的任务 (并行执行时每个任务有独立的值)
+current_task: ContextVar[Optional[DeployTask]] = ContextVar('current_task', default=None)
+
 
 class TaskScheduler:
     """任务调度器"""
 
-    def __init__(self, log_callback: Callable[[str, str], None] = None):
+    def __init__(
+        self,
+        log_callback: Callable[[str, str], None] = None,
+        max_parallel: int = None,
+        browser_pool: BrowserPool = None,
+        tag_store: TagCache = None,
+        run_id: str = None,
+        flights: SingleFlight = None,
+    ):
         """
         Args:
             log_callback: 日志回调函数 (message, level)
+            max_parallel: 最大并行任务数 (默认读取 config.TASK_MAX_PARALLEL, 1 表示串行)
+            browser_pool: 常驻浏览器池,提供时每个任务从池中租用浏览器上下文,
+                          不再自行启动和关闭浏览器
+            tag_store: 持久化版本号缓存 (默认使用进程内共享的缓存,未启用时为 None)
+            run_id: 运行ID,用于耗时追踪文件名和日志文件中的运行标识 (默认按开始时间生成)
+            flights: 云效构建合并注册表 (默认使用进程内共享的 build_flights;
+                     工作进程中使用由 Web 服务进程协调的注册表)
         """
         self.log_callback = log_callback or log
+        self.max_parallel = max(1, max_parallel or config.TASK_MAX_PARALLEL)
+        # 本次运行实际使用的最大并行数(依赖调度时按依赖图推算)
+        self.parallelism = self.max_parallel
+        self.browser_pool = browser_pool
         self.tasks: List[DeployTask] = []
+        self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
         self.tag_cache: Dict[str, str] = {}
+        self.tag_store = tag_store if tag_store is not None else get_tag_cache()
+        self.flights = flights or build_flights
+        self.start_time = None
+        self.end_time = None
+        self.sleep_budget = SleepBudget()
+        self.run_id = run_id
+        self.tracer = None
+        self.blocker = None
+        self.block_stats = BlockStats()
 
     def add_task(self, task: DeployTask):
         """添加任务"""
@@ -80,28 +182,36 @@ class TaskScheduler:
         self._log(f"共有 {len(self.tasks)} 个任务待执行", "INFO")
         self._log("-" * 60, "INFO")
 
-        try:
-            # 初始化浏览器
-            self._log("正在初始化浏览器...", "INFO")
-            await self._init_browser()
-            self._log("浏览器初始化完成", "INFO")
-
-            # 按顺序执行每个任务
-            for i, task in enumerate(self.tasks, 1):
-                self._log(f"\n【任务 {i}/{len(self.tasks)}】{task.name}", "INFO")
-                self._log("=" * 60, "INFO")
-
-                await self._execute_task(task)
+        # 依赖关系有误(依赖不存在或存在环)时不执行任何任务
+        self._topological_order()
 
-                # 保存登录状态
-                await self.context.storage_state(path=config.AUTH_FILE)
+        # 统计本次运行中的无条件等待
+        self.sleep_budget = SleepBudget()
+        budget_token = current_sleep_budget.set(self.sleep_budget)
+        self.block_stats = BlockStats()
 
-                if task.status == 'success':
-                    self._log(f"✅ 【任务 {i}/{len(self.tasks)}】{task.name} 完成!", "SUCCESS")
-                else:
-                    self._log(f"❌ 【任务 {i}/{len(self.tasks)}】{task.name} 失败: {task.error_message}", "ERROR")
+        # 记录本次运行各步骤的耗时
+        self.tracer = Tracer(self.run_id or datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+        tracer_token = current_tracer.set(self.tracer)
 
-                self._log("=" * 60, "INFO")
+        try:
+            # 初始化浏览器(使用浏览器池时由池负责)
+            if self.browser_pool:
+                self._log("使用常驻浏览器池", "INFO")
+            else:
+                self._log("正在初始化浏览器...", "INFO")
+                await self._init_browser()
+                self._log("浏览器初始化完成", "INFO")
+
+            self.start_time = datetime.now()
+            if any(task.depends_on for task in self.tasks):
+                await self._execute_dag()
+            elif self.max_parallel > 1 and len(self.tasks) > 1:
+                await self._execute_concurrently()
+            else:
+                await self._execute_serially()
+            await self._pause_before_close()
+            self.end_time = datetime.now()
 
             # 输出总结
             self._print_summary()
@@ -112,75 +222,256 @@ class TaskScheduler:
             self._log(f"异常堆栈: {traceback.format_exc()}", "ERROR")
             raise
         finally:
+            current_sleep_budget.reset(budget_token)
+            current_tracer.reset(tracer_token)
+            self._export_trace()
             await self._cleanup()
 
+    @asynccontextmanager
+    async def _task_page(self, shared: bool):
+        """
+        为任务提供浏览器上下文和页面
+
+        Args:
+            shared: 是否复用调度器自身的页面(串行模式),否则为任务新建页面
+
+        Yields:
+            (context, page)
+        """
+        if self.browser_pool:
+            async with self.browser_pool.lease() as slot:
+                try:
+                    yield slot.context, slot.page
+                finally:
+                    # 租用期间上下文由本任务独占,拦截统计的增量即为本任务的节省
+                    if slot.blocker:
+                        self.block_stats.merge(slot.blocker.stats.since(slot.block_mark))
+        elif shared:
+            yield self.context, self.page
+        else:
+            page = await self.context.new_page()
+            try:
+                yield self.context, page
+            finally:
+                await page.close()
+
+    async def _execute_serially(self):
+        """按顺序执行每个任务,所有任务共用同一个页面"""
+        for i, task in enumerate(self.tasks, 1):
+            task_token = current_task.set(task)
+            try:
+                self._log(f"\n【任务 {i}/{len(self.tasks)}】{task.name}", "INFO")
+                self._log("=" * 60, "INFO")
+
+                async with self._task_page(shared=True) as (context, page):
+                    await self._execute_task(task, page)
+
+                    # 保存登录状态
+                    await save_auth_state(context)
+
+                self._log_task_result(i, task)
+            finally:
+                current_task.reset(task_token)
+
+    async def _execute_concurrently(self):
+        """
+        并行执行任务
+
+        - 每个任务使用独立页面(共享同一个浏览器上下文,即共享登录状态);
+          使用浏览器池时每个任务租用独立的浏览器上下文
+        - 同一项目的任务共用一条云效流水线,按添加顺序串行执行,
+          以便后续任务复用前一个任务触发的构建和版本号
+        - 不同项目的任务并行执行,最多同时运行 max_parallel 个
+        """
+        total = len(self.tasks)
+        self._log(f"并行模式: 最多同时执行 {self.max_parallel} 个任务", "INFO")
+
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        project_locks = {task.project: asyncio.Lock() for task in self.tasks}
+
+        async def run(i: int, task: DeployTask):
+            # gather 为每个协程创建独立的 asyncio 任务,设置的值只在本任务内可见
+            current_task.set(task)
+            async with project_locks[task.project]:
+                async with semaphore:
+                    self._log(f"\n【任务 {i}/{total}】{task.name} 开始", "INFO")
+                    async with self._task_page(shared=False) as (context, page):
+                        await self._execute_task(task, page)
+
+                        # 保存登录状态
+                        await save_auth_state(context)
+
+            self._log_task_result(i, task)
+
+        await asyncio.gather(*(run(i, task) for i, task in enumerate(self.tasks, 1)))
+
+    def _topological_order(self) -> List[DeployTask]:
+        """
+        按依赖关系排序任务(同一层级保持添加顺序)
+
+        Raises:
+            ValueError: 依赖的任务不存在或存在循环依赖
+        """
+        by_id = {task.task_id: task for task in self.tasks}
+        for task in self.tasks:
+            for dep_id in task.depends_on:
+                if dep_id not in by_id:
+                    raise ValueError(f"任务 {task.task_id} 依赖的任务不存在: {dep_id}")
+
+        ordered: List[DeployTask] = []
+        visited = set()
+        while len(ordered) < len(self.tasks):
+            ready = [
+                task for task in self.tasks
+                if task.task_id not in visited and all(dep in visited for dep in task.depends_on)
+            ]
+            if not ready:
+                remaining = ', '.join(t.task_id for t in self.tasks if t.task_id not in visited)
+                raise ValueError(f"任务存在循环依赖: {remaining}")
+            for task in ready:
+                visited.add(task.task_id)
+                ordered.append(task)
+        return ordered
+
+    def _dag_parallelism(self) -> int:
+        """
+        依赖调度的并行数
+
+        同一项目的任务共用一条云效流水线,按依赖顺序逐个执行,因此同时执行的任务数最多为项目数;
+        配置了 TASK_DAG_MAX_PARALLEL 时再以它为上限
+        """
+        limit = len({task.project for task in self.tasks})
+        if config.TASK_DAG_MAX_PARALLEL > 0:
+            limit = min(limit, config.TASK_DAG_MAX_PARALLEL)
+        return max(1, limit)
+
+    async def _execute_dag(self):
+        """
+        按依赖关系执行任务
+
+        - 每个任务在其依赖全部完成后立即开始,互不依赖的不同项目的任务并行执行
+          (并行数由依赖图推算,见 _dag_parallelism)
+        - 同一项目的任务与并行模式一样不会同时执行,按依赖顺序(同一层级按添加顺序)串行
+        - 依赖任务的版本号沿依赖边传递给下游任务,下游任务不再访问云效
+        - 依赖任务失败或被跳过时,只跳过依赖它的任务,其他任务照常执行
+        """
+        total = len(self.tasks)
+        index = {task.task_id: i for i, task in enumerate(self.tasks, 1)}
+        by_id = {task.task_id: task for task in self.tasks}
+        self.parallelism = self._dag_parallelism()
+        self._log(f"依赖调度模式: 最多同时执行 {self.parallelism} 个任务", "INFO")
+
+        semaphore = asyncio.Semaphore(self.parallelism)
+        project_locks = {task.project: asyncio.Lock() for task in self.tasks}
+        runners: Dict[str, asyncio.Task] = {}
+
+        async def run(task: DeployTask):
+            current_task.set(task)
+            i = index[task.task_id]
+            deps = [by_id[dep_id] for dep_id in task.depends_on]
+            if deps:
+                await asyncio.gather(*(runners[dep.task_id] for dep in deps))
+
+            failed = [dep for dep in deps if dep.status != 'success']
+            if failed:
+                task.status = 'skipped'
+                task.error_message = f"依赖任务未成功: {', '.join(dep.name for dep in failed)}"
+                self._log_task_result(i, task)
+                return
+
+            task.input_tag = self._upstream_tag(task, deps)
+            # 依赖已全部完成后才等待项目锁,持有锁期间不会等待其他任务,不会死锁
+            async with project_locks[task.project]:
+                async with semaphore:
+                    self._log(f"\n【任务 {i}/{total}】{task.name} 开始", "INFO")
+                    async with self._task_page(shared=False) as (context, page):
+                        await self._execute_task(task, page)
+
+                        # 保存登录状态
+                        await save_auth_state(context)
+
+            self._log_task_result(i, task)
+
+        for task in self._topological_order():
+            runners[task.task_id] = asyncio.create_task(run(task))
+        await asyncio.gather(*runners.values())
+
+    @staticmethod
+    def _upstream_tag(task: DeployTask, deps: List[DeployTask]):
+        """从依赖任务中选取传给本任务的版本号(优先同一项目的依赖)"""
+        tagged = [dep for dep in deps if dep.tag]
+        for dep in tagged:
+            if dep.project == task.project:
+                return dep.tag
+        return tagged[0].tag if tagged else None
+
+    def _log_task_result(self, index: int, task: DeployTask):
+        """输出单个任务的执行结果"""
+        if task.status == 'success':
+            self._log(f"✅ 【任务 {index}/{len(self.tasks)}】{task.name} 完成!", "SUCCESS")
+        elif task.status == 'skipped':
+            self._log(f"⏭️ 【任务 {index}/{len(self.tasks)}】{task.name} 已跳过: {task.error_message}", "WARNING")
+        else:
+            self._log(f"❌ 【任务 {index}/{len(self.tasks)}】{task.name} 失败: {task.error_message}", "ERROR")
+
+        self._log("=" * 60, "INFO")
+
     async def _init_browser(self):
         """初始化浏览器"""
-        import os
-
         self._log(f"启动浏览器 (无头模式: {config.HEADLESS})...", "INFO")
 
-        playwright = await async_playwright().start()
-        self.browser = await playwright.chromium.launch(
-            headless=config.HEADLESS,
-            args=['--headless=new'] if config.HEADLESS else []
-        )
+        self.playwright = await async_playwright().start()
+        self.browser = await launch_browser(self.playwright)
 
         # 创建浏览器上下文
-        context_options = {}
         if os.path.exists(config.AUTH_FILE):
             self._log(f"检测到登录状态文件: {config.AUTH_FILE}", "INFO")
-            context_options['storage_state'] = config.AUTH_FILE
         else:
             self._log("首次运行,需要手动登录云效和 K8s 控制台", "WARNING")
 
-        self.context = await self.browser.new_context(**context_options)
-        self.context.set_default_timeout(config.OPERATION_TIMEOUT)
+        self.blocker = ResourceBlocker.from_config()
+        if self.blocker:
+            # 上下文只属于本次运行,拦截统计直接作为本次运行的统计
+            self.block_stats = self.blocker.stats
+        self.context = await new_automation_context(self.browser, self.blocker)
 
         # 创建页面
         self.page = await self.context.new_page()
 
-    async def _execute_task(self, task: DeployTask):
-        """执行单个任务"""
-        task.status = 'running'
-        task.start_time = datetime.now()
+    async def _execute_task(self, task: DeployTask, page):
+        """
+        执行单个任务
 
-        try:
-            self._log(f"开始执行任务: {task.name} (task_id={task.task_id}, project={task.project}, env={task.env}, run_build={task.run_build})", "INFO")
+        Args:
+            task: 部署任务
+            page: 执行该任务使用的 Playwright Page 对象
+        """
+        with span('task', task_id=task.task_id, project=task.project, env=task.env) as task_span:
+            task.status = 'running'
+            task.start_time = datetime.now()
+
+            try:
+                self._log(f"开始执行任务: {task.name} (task_id={task.task_id}, project={task.project}, env={task.env}, run_build={task.run_build})", "INFO")
             
-            # 获取任务配置
-            self._log(f"获取任务配置 (project={task.project}, env={task.env})...", "INFO")
-            task_config = task.get_config()
-            self._log(f"配置获取成功: {list(task_config.keys())}", "INFO")
+                # 获取任务配置
+                self._log(f"获取任务配置 (project={task.project}, env={task.env})...", "INFO")
+                task_config = task.get_config()
+                self._log(f"配置获取成功: {list(task_config.keys())}", "INFO")
             
-            yunxiao_url = task_config['yunxiao_url']
-            k8s_url = task_config['k8s_url']
-            tag_pattern = task_config['tag_pattern']
-
-            self._log(f"配置信息: yunxiao_url={'已配置' if yunxiao_url else '未配置'}, k8s_url={'已配置' if k8s_url else '未配置'}", "INFO")
-
-            # 验证配置
-            # 如果 k8s_url 为空，表示只构建不部署（如 build 环境）
-            is_build_only = not k8s_url
-            self._log(f"任务模式: {'仅构建' if is_build_only else '构建+部署'}", "INFO")
+                ctx = task.get_context()
+                yunxiao_url = ctx.yunxiao_url
+                k8s_url = ctx.k8s_url
 
-            if task.run_build and not yunxiao_url:
-                raise Exception(f"云效 URL 配置不完整: yunxiao_url={yunxiao_url}")
+                self._log(f"配置信息: yunxiao_url={'已配置' if yunxiao_url else '未配置'}, k8s_url={'已配置' if k8s_url else '未配置'}", "INFO")
 
-            # 临时替换 config 中的全局变量(兼容现有代码)
-            original_yunxiao_url = config.YUNXIAO_URL
-            original_k8s_url = config.K8S_URL
-            original_tag_pattern = config.TAG_PATTERN
-            original_k8s_username = getattr(config, "K8S_USERNAME", "")
-            original_k8s_password = getattr(config, "K8S_PASSWORD", "")
+                # 验证配置
+                # 如果 k8s_url 为空，表示只构建不部署（如 build 环境）
+                is_build_only = not k8s_url
+                self._log(f"任务模式: {'仅构建' if is_build_only else '构建+部署'}", "INFO")
 
-            config.YUNXIAO_URL = yunxiao_url
-            config.K8S_URL = k8s_url
-            config.TAG_PATTERN = tag_pattern
-            config.K8S_USERNAME = task_config.get('k8s_username', '')
-            config.K8S_PASSWORD = task_config.get('k8s_password', '')
+                if task.run_build and not task.input_tag and not yunxiao_url:
+                    raise Exception(f"云效 URL 配置不完整: yunxiao_url={yunxiao_url}")
 
-            try:
                 # Step 1: 云效获取版本号 (始终执行,但可能跳过触发新构建)
                 # 缓存 key 包含项目和环境，避免不同环境共用同一个 tag
                 cache_key = f"{task.project}-{task.env}"  # 例如: 'backend-test', 'backend-prod'
@@ -188,110 +479,150 @@ class TaskScheduler:
                 cached_tag = self.tag_cache.get(cache_key)
                 tag = None
 
-                # 根据项目类型选择触发函数和参数
-                if task.project == 'backend':
-                    # 后端：从配置中获取日志任务关键词
-                    log_job_keyword = task_config.get('log_job_keyword')
-                    if log_job_keyword:
-                        self._log(f"日志任务关键词: {log_job_keyword}", "INFO")
-                else:
-                    log_job_keyword = None
+                # 后端：日志任务关键词来自任务配置(已包含在执行上下文中)
+                if task.project == 'backend' and ctx.log_job_keyword:
+                    self._log(f"日志任务关键词: {ctx.log_job_keyword}", "INFO")
 
                 # 根据是否仅构建决定步骤显示
                 step_prefix = "步骤 1/1" if is_build_only else "步骤 1/2"
 
-                if task.run_build:
-                    if cached_tag:
-                        self._log(f"{step_prefix}: 复用本次会话已获取的 {task.name} 版本号", "INFO")
-                        self._log(f"版本号: {cached_tag}", "INFO")
-                        tag = cached_tag
-                    else:
-                        # 检查是否已经触发过构建（针对同一个项目）
-                        already_triggered = self.tag_cache.get(build_trigger_key, False)
-
-                        self._log(f"{step_prefix}: 获取镜像版本号", "INFO")
-                        self._log(f"云效地址: {yunxiao_url}", "INFO")
-
-                        if task.project == 'backend':
-                            # 后端：第一次触发构建，后续跳过触发但仍然获取 tag
-                            tag = await trigger_backend_build_and_fetch_tag(
-                                self.page,
-                                skip_trigger=already_triggered,  # 如果已触发过，则跳过触发
-                                log_job_keyword=log_job_keyword
-                            )
-                        else:
-                            # 前端：同样的逻辑
-                            tag = await trigger_build_and_fetch_tag(
-                                self.page,
-                                skip_trigger=already_triggered
-                            )
-
-                        # 标记已触发构建
-                        if not already_triggered:
-                            self.tag_cache[build_trigger_key] = True
-                            self._log(f"✓ 已触发云效构建", "SUCCESS")
-
-                        # 缓存当前环境的 tag
+                with span('deploy.fetch_tag', run_build=task.run_build) as tag_span:
+                    if task.input_tag:
+                        # 依赖的构建任务已获取版本号,无需访问云效
+                        self._log(f"{step_prefix}: 使用依赖任务传递的版本号", "INFO")
+                        self._log(f"版本号: {task.input_tag}", "INFO")
+                        tag = task.input_tag
                         self.tag_cache[cache_key] = tag
-                        self._log(f"✅ 获取到版本号: {tag}", "SUCCESS")
-                else:
-                    if cached_tag:
-                        self._log(f"{step_prefix}: 复用本次会话缓存的 {task.project} 版本号", "INFO")
-                        self._log(f"版本号: {cached_tag}", "INFO")
-                        tag = cached_tag
+                    elif task.run_build:
+                        if cached_tag:
+                            self._log(f"{step_prefix}: 复用本次会话已获取的 {task.name} 版本号", "INFO")
+                            self._log(f"版本号: {cached_tag}", "INFO")
+                            tag = cached_tag
+                        else:
+                            # 检查是否已经触发过构建（针对同一个项目）
+                            already_triggered = self.tag_cache.get(build_trigger_key, False)
+
+                            self._log(f"{step_prefix}: 获取镜像版本号", "INFO")
+                            self._log(f"云效地址: {yunxiao_url}", "INFO")
+
+                            if already_triggered:
+                                # 本次会话已触发过该项目的构建: 跳过触发但仍然获取 tag
+                                tag = await self._fetch_tag(task, page, ctx, skip_trigger=True)
+                            else:
+                                # 同一流水线的构建在进程内只会进行一次,其他请求等待并复用同一个版本号
+                                tag, shared = await self.flights.do(
+                                    yunxiao_url,
+                                    lambda: self._fetch_tag(task, page, ctx, skip_trigger=False),
+                                )
+                                self.tag_cache[build_trigger_key] = True
+                                if shared:
+                                    self._log("✓ 该流水线的构建已由其他请求触发,已等待其完成并复用版本号", "SUCCESS")
+                                else:
+                                    self._log("✓ 已触发云效构建", "SUCCESS")
+
+                            # 缓存当前环境的 tag
+                            self.tag_cache[cache_key] = tag
+                            self._log(f"✅ 获取到版本号: {tag}", "SUCCESS")
                     else:
-                        self._log(f"{step_prefix}: 从最近一次云效构建中获取镜像版本号 (跳过触发)", "INFO")
-                        self._log(f"云效地址: {yunxiao_url}", "INFO")
-                        if task.project == 'backend':
-                            tag = await trigger_backend_build_and_fetch_tag(
-                                self.page, skip_trigger=True, log_job_keyword=log_job_keyword
+                        # 持久化缓存中已记录的最新一次运行(不访问云效)
+                        persisted = (
+                            self.tag_store.latest(task.project, task.env)
+                            if self.tag_store and not cached_tag else None
+                        )
+                        if cached_tag:
+                            self._log(f"{step_prefix}: 复用本次会话缓存的 {task.project} 版本号", "INFO")
+                            self._log(f"版本号: {cached_tag}", "INFO")
+                            tag = cached_tag
+                        elif persisted:
+                            # 有效期内已获取过流水线最近一次运行的版本号,跳过云效步骤
+                            age_minutes = (time.time() - persisted['created_at']) / 60
+                            self._log(
+                                f"{step_prefix}: 复用持久化缓存中的 {task.name} 版本号 "
+                                f"(运行 #{persisted['run_id']}, {age_minutes:.0f} 分钟前获取)", "INFO"
                             )
+                            self._log(f"版本号: {persisted['tag']}", "INFO")
+                            tag = persisted['tag']
+                            self.tag_cache[cache_key] = tag
                         else:
-                            tag = await trigger_build_and_fetch_tag(self.page, skip_trigger=True)
-                        self.tag_cache[cache_key] = tag
-                        self._log(f"✅ 获取到版本号: {tag}", "SUCCESS")
+                            self._log(f"{step_prefix}: 从最近一次云效构建中获取镜像版本号 (跳过触发)", "INFO")
+                            self._log(f"云效地址: {yunxiao_url}", "INFO")
+                            tag = await self._fetch_tag(task, page, ctx, skip_trigger=True)
+                            self.tag_cache[cache_key] = tag
+                            self._log(f"✅ 获取到版本号: {tag}", "SUCCESS")
 
-                task.tag = tag
+                    task.tag = tag
+                    tag_span.set(tag=tag)
 
                 # Step 2: K8s 更新镜像版本（如果配置了 K8s URL）
                 if is_build_only:
                     # 仅构建任务，不需要显示步骤 2
                     self._log(f"✅ 云效构建完成，版本号: {tag}", "SUCCESS")
                 else:
-                    self._log(f"\n步骤 2/2: 更新 K8s Deployment 镜像版本", "INFO")
-                    self._log(f"K8s 地址: {k8s_url}", "INFO")
-                    await update_deployment_image(self.page, tag)
-                    self._log(f"✅ 镜像版本更新成功!", "SUCCESS")
+                    with span('deploy.update_k8s', targets=len(ctx.k8s_targets) or 1):
+                        self._log("\n步骤 2/2: 更新 K8s Deployment 镜像版本", "INFO")
+                        if len(ctx.k8s_targets) > 1:
+                            # 同一镜像部署到多个 Deployment: 并发更新所有目标
+                            task.target_results = await update_deployment_targets(page, tag, ctx)
+                            failed = [r for r in task.target_results if r.status != 'success']
+                            if failed:
+                                raise Exception(
+                                    f"{len(failed)}/{len(task.target_results)} 个 K8s 目标更新失败: "
+                                    + ', '.join(r.deployment for r in failed)
+                                )
+                            self._log(f"✅ {len(task.target_results)} 个 K8s 目标镜像版本更新成功!", "SUCCESS")
+                        else:
+                            self._log(f"K8s 地址: {k8s_url}", "INFO")
+                            await update_deployment_image(page, tag, ctx=ctx)
+                            self._log("✅ 镜像版本更新成功!", "SUCCESS")
 
                 task.status = 'success'
 
+            except Exception as e:
+                task.status = 'error'
+                task.error_message = str(e)
+                self._log(f"任务执行失败: {str(e)}", "ERROR")
+                task_span.fail(str(e))
+
             finally:
-                # 恢复原始配置
-                config.YUNXIAO_URL = original_yunxiao_url
-                config.K8S_URL = original_k8s_url
-                config.TAG_PATTERN = original_tag_pattern
-                config.K8S_USERNAME = original_k8s_username
-                config.K8S_PASSWORD = original_k8s_password
+                task.end_time = datetime.now()
+
+    async def _fetch_tag(self, task: DeployTask, page, ctx: ExecutionContext, skip_trigger: bool) -> str:
+        """按项目类型调用云效入口,(触发构建并)获取版本号"""
+        if task.project == 'backend':
+            return await trigger_backend_build_and_fetch_tag(page, skip_trigger=skip_trigger, ctx=ctx)
+        return await trigger_build_and_fetch_tag(page, skip_trigger=skip_trigger, ctx=ctx)
 
+    def _export_trace(self):
+        """导出本次运行的步骤耗时(导出失败不影响部署)"""
+        if not config.TRACE_ENABLED or not self.tracer or not self.tracer.spans:
+            return
+        base = os.path.join(config.TRACE_DIR, f"trace-{self.tracer.run_id}")
+        try:
+            self.tracer.export_jsonl(base + '.jsonl')
+            self.tracer.export_chrome(base + '.json')
+            self._log(f"步骤耗时已导出: {base}.json (可在 https://ui.perfetto.dev 中打开)", "INFO")
         except Exception as e:
-            task.status = 'error'
-            task.error_message = str(e)
-            self._log(f"任务执行失败: {str(e)}", "ERROR")
+            self._log(f"导出步骤耗时失败(忽略): {str(e)}", "WARNING")
 
-        finally:
-            task.end_time = datetime.now()
+    async def _pause_before_close(self):
+        """有界面模式下保留浏览器窗口 3 秒再关闭,便于查看结果(计入无条件等待)"""
+        if self.page and not config.HEADLESS:
+            self._log("浏览器将在 3 秒后关闭...", "INFO")
+            record_fixed_wait("关闭浏览器前停留(有界面模式)", 3)
+            await self.page.wait_for_timeout(3000)
 
     async def _cleanup(self):
         """清理资源"""
-        if self.page:
-            # 等待一下再关闭
-            if not config.HEADLESS:
-                self._log("浏览器将在 3 秒后关闭...", "INFO")
-                await self.page.wait_for_timeout(3000)
+        if self.context:
+            # 先关闭上下文: HAR 录制在上下文关闭时写出
+            await self.context.close()
 
         if self.browser:
             await self.browser.close()
 
+        if self.playwright:
+            await self.playwright.stop()
+
     def _print_summary(self):
         """打印执行总结"""
         self._log("\n" + "=" * 60, "INFO")
@@ -300,21 +631,57 @@ class TaskScheduler:
 
         success_count = sum(1 for t in self.tasks if t.status == 'success')
         error_count = sum(1 for t in self.tasks if t.status == 'error')
+        skipped_count = sum(1 for t in self.tasks if t.status == 'skipped')
 
         for i, task in enumerate(self.tasks, 1):
-            status_icon = "✅" if task.status == 'success' else "❌"
+            status_icon = {'success': "✅", 'skipped': "⏭️"}.get(task.status, "❌")
             duration = (task.end_time - task.start_time).total_seconds() if task.end_time else 0
 
             self._log(f"{status_icon} {i}. {task.name}: {task.status.upper()} (耗时: {duration:.1f}秒)",
-                     "SUCCESS" if task.status == 'success' else "ERROR")
+                     {'success': "SUCCESS", 'skipped': "WARNING"}.get(task.status, "ERROR"))
 
             if task.tag:
                 self._log(f"   版本号: {task.tag}", "INFO")
 
-            if task.error_message:
+            for result in task.target_results:
+                icon = "✅" if result.status == 'success' else "❌"
+                detail = f" - {result.error}" if result.error else ""
+                self._log(f"   {icon} {result.deployment}: {result.seconds:.1f}秒{detail}",
+                         "INFO" if result.status == 'success' else "ERROR")
+
+            if task.status == 'skipped':
+                self._log(f"   原因: {task.error_message}", "WARNING")
+            elif task.error_message:
                 self._log(f"   错误: {task.error_message}", "ERROR")
 
         self._log("-" * 60, "INFO")
-        self._log(f"总计: {len(self.tasks)} 个任务, 成功 {success_count} 个, 失败 {error_count} 个",
-                 "SUCCESS" if error_count == 0 else "WARNING")
+        skipped_text = f", 跳过 {skipped_count} 个" if skipped_count else ""
+        self._log(f"总计: {len(self.tasks)} 个任务, 成功 {success_count} 个, 失败 {error_count} 个{skipped_text}",
+                 "SUCCESS" if error_count == 0 and skipped_count == 0 else "WARNING")
+
+        if self.start_time and self.end_time:
+            wall_time = (self.end_time - self.start_time).total_seconds()
+            task_time = sum(
+                (t.end_time - t.start_time).total_seconds() for t in self.tasks if t.start_time and t.end_time
+            )
+            self._log(f"总耗时: {wall_time:.1f}秒 (各任务累计: {task_time:.1f}秒, 最大并行数: {self.parallelism})", "INFO")
+
+        # Sleep 预算: 运行中仍在无条件等待的时间
+        budget = self.sleep_budget
+        self._log(f"无条件等待: {budget.total_seconds:.1f}秒 (共 {len(budget.entries)} 次)", "INFO")
+        for reason, (count, seconds) in budget.by_reason().items():
+            self._log(f"   {reason}: {count} 次, {seconds:.1f}秒", "INFO")
+
+        # 最慢的步骤
+        slowest = self.tracer.slowest(config.TRACE_SUMMARY_TOP) if self.tracer else []
+        if slowest:
+            self._log("最慢的步骤:", "INFO")
+            for s in slowest:
+                owner = self.tracer.inherited_attr(s, 'deployment') or self.tracer.inherited_attr(s, 'task_id')
+                owner_text = f" [{owner}]" if owner else ""
+                self._log(f"   {s.name}{owner_text}: {s.duration:.1f}秒", "INFO")
+
+        # 资源拦截节省的请求和流量
+        if self.block_stats.requests:
+            self._log(f"资源拦截: {format_stats(self.block_stats)}", "INFO")
         self._log("=" * 60, "INFO")
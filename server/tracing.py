@@ -0,0 +1,191 @@
+"""
+轻量级耗时追踪: 记录每个步骤的 span,导出为 JSON Lines 和 Chrome Trace 格式
+
+用法:
+    tracer = Tracer(run_id)
+    token = current_tracer.set(tracer)
+    with span('task', task_id='frontend-test'):
+        with span('yunxiao.page_load'):
+            ...
+    current_tracer.reset(token)
+    tracer.export_chrome('trace.json')   # 在 chrome://tracing 或 https://ui.perfetto.dev 中打开
+
+没有设置 Tracer 时 span() 不做任何记录,开销可以忽略。
+span 通过 ContextVar 维护父子关系,asyncio 并发任务和 to_thread 线程会继承创建时的父 span;
+每个顶层 span(如一个任务)在 Chrome Trace 中占一行,子 span 嵌套显示在同一行。
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """一个已开始的步骤"""
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'parent', 'track', 'start', 'duration', 'attrs', 'status', '_started')
+
+    def __init__(self, name: str, parent: Optional['Span'], track: int, attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.parent = parent
+        self.track = track
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attrs = attrs
+        self.status = 'ok'
+        self._started = time.perf_counter()
+
+    def set(self, **attrs):
+        """补充属性(如获取到的版本号)"""
+        self.attrs.update(attrs)
+
+    def fail(self, error: str):
+        """标记为失败(用于捕获了异常、不会向外抛出的步骤)"""
+        self.status = 'error'
+        self.attrs.setdefault('error', str(error)[:200])
+
+    def to_dict(self, run_id: str) -> Dict[str, Any]:
+        return {
+            'run_id': run_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'status': self.status,
+            'attrs': self.attrs,
+        }
+
+
+class Tracer:
+    """收集一次运行中的所有 span(线程安全)"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.spans: List[Span] = []
+        self._tracks = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_track(self) -> int:
+        return next(self._tracks)
+
+    def record(self, finished: Span):
+        with self._lock:
+            self.spans.append(finished)
+        for listener in list(_listeners):
+            try:
+                listener(finished, self)
+            except Exception:
+                pass
+
+    def slowest(self, limit: int = 5) -> List[Span]:
+        """耗时最长的叶子步骤(不含子步骤的 span,即真正耗时的位置)"""
+        with self._lock:
+            spans = list(self.spans)
+        parents = {s.parent_id for s in spans}
+        leaves = [s for s in spans if s.span_id not in parents and s.parent_id is not None]
+        return sorted(leaves, key=lambda s: s.duration or 0, reverse=True)[:limit]
+
+    @staticmethod
+    def inherited_attr(span: Span, key: str) -> Any:
+        """从 span 自身或最近的祖先 span 中读取属性(如叶子步骤所属的 task_id)"""
+        current = span
+        while current is not None:
+            if key in current.attrs:
+                return current.attrs[key]
+            current = current.parent
+        return None
+
+    def export_jsonl(self, path: str):
+        """每行一个 span 的 JSON"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for s in sorted(self.spans, key=lambda s: s.start):
+                f.write(json.dumps(s.to_dict(self.run_id), ensure_ascii=False, default=str) + '\n')
+
+    def export_chrome(self, path: str):
+        """Chrome Trace Event 格式(complete 事件,时间单位为微秒)"""
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': 1,
+            'args': {'name': f"deploy {self.run_id}"},
+        }]
+        for s in sorted(self.spans, key=lambda s: s.start):
+            events.append({
+                'name': s.name,
+                'cat': s.name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': int(s.start * 1_000_000),
+                'dur': int((s.duration or 0) * 1_000_000),
+                'pid': 1,
+                'tid': s.track,
+                'args': dict(s.attrs, status=s.status),
+            })
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False, default=str)
+
+
+# 当前运行的 Tracer 与当前所在的 span
+current_tracer: ContextVar[Optional[Tracer]] = ContextVar('current_tracer', default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+# span 结束时的回调(如 /metrics 统计)
+_listeners: List[Callable[[Span, 'Tracer'], None]] = []
+
+
+def add_span_listener(listener: Callable[[Span, 'Tracer'], None]):
+    """注册 span 结束回调 listener(span, tracer),回调在结束 span 的线程中同步执行,应尽量轻量"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def fail(self, error: str):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, detached: bool = False, **attrs):
+    """
+    记录一个步骤的耗时,可嵌套使用
+
+    Args:
+        name: 步骤名称,按 "模块.步骤" 命名 (如 yunxiao.build_wait)
+        detached: 在 Chrome Trace 中单独占一行(用于与兄弟 span 并发执行的步骤)
+        **attrs: 附加属性
+
+    Yields:
+        Span 对象(可调用 .set() 补充属性); 未启用追踪时为空操作对象
+    """
+    tracer = current_tracer.get()
+    if tracer is None:
+        yield _NOOP
+        return
+
+    parent = current_span.get()
+    track = parent.track if parent and not detached else tracer.new_track()
+    s = Span(name, parent, track, attrs)
+    token = current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.fail(str(e))
+        raise
+    finally:
+        s.duration = time.perf_counter() - s._started
+        current_span.reset(token)
+        tracer.record(s)
@@ -2,14 +2,28 @@
 工具模块: 日志、截图等辅助功能
 """
 import os
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
 from playwright.async_api import Page
 import config
+import file_log
+from tracing import current_tracer
+
+# 日志文件写入函数 writer(时间, 级别, 内容, 运行ID)
+# 默认写入本进程的日志文件; 部署工作进程中替换为通过管道交给 Web 服务写入
+_file_writer: Callable[[str, str, str, Optional[str]], None] = file_log.write
+
+
+def set_file_writer(writer: Optional[Callable[[str, str, str, Optional[str]], None]] = None):
+    """替换日志文件写入函数 (None 恢复为写入本进程的日志文件)"""
+    global _file_writer
+    _file_writer = writer or file_log.write
 
 
 def log(message: str, level: str = "INFO"):
     """
-    打印带时间戳的日志
+    打印带时间戳的日志,同时写入日志文件(后台线程写入,不阻塞)
 
     Args:
         message: 日志消息
@@ -30,6 +44,10 @@ def log(message: str, level: str = "INFO"):
     emoji = emoji_map.get(level, "📝")
     print(f"[{timestamp}] {emoji} {message}")
 
+    # 在部署任务中执行时记录所属运行ID
+    tracer = current_tracer.get()
+    _file_writer(timestamp, level, message, tracer.run_id if tracer else None)
+
 
 async def take_screenshot(page: Page, name: str = "error") -> str:
     """
@@ -57,6 +75,17 @@ async def take_screenshot(page: Page, name: str = "error") -> str:
     return filepath
 
 
+def image_tag_pattern() -> str:
+    """
+    统一的镜像 tag 正则（固定格式）
+
+    格式: {IMAGE_REGISTRY}/{IMAGE_NAMESPACE}/项目名:分支-时间戳
+    tag 部分匹配: 字母数字和连字符,遇到逗号、分号、空格、引号等停止
+    """
+    registry_escaped = config.IMAGE_REGISTRY.replace('.', r'\.')
+    return rf'{registry_escaped}/{config.IMAGE_NAMESPACE}/[^:]+:([a-zA-Z0-9\-]+)'
+
+
 def format_duration(seconds: float) -> str:
     """
     格式化时间长度
@@ -77,3 +106,43 @@ def format_duration(seconds: float) -> str:
         return f"{minutes}分钟"
 
     return f"{minutes}分{remaining_seconds}秒"
+
+
+class SleepBudget:
+    """
+    Sleep 预算: 统计一次运行中无条件等待(固定时长 sleep)占用的时间
+
+    页面等待应尽量基于 DOM/网络条件,无法避免的固定等待(如键盘逐字输入间隔)
+    通过 record_fixed_wait() 计入预算,运行结束后由 TaskScheduler 输出报告。
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[str, float]] = []
+
+    def record(self, reason: str, seconds: float):
+        """记录一次固定等待"""
+        self.entries.append((reason, seconds))
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.entries)
+
+    def by_reason(self) -> Dict[str, Tuple[int, float]]:
+        """按原因汇总: {原因: (次数, 总秒数)},按总耗时降序"""
+        summary: Dict[str, Tuple[int, float]] = {}
+        for reason, seconds in self.entries:
+            count, total = summary.get(reason, (0, 0.0))
+            summary[reason] = (count + 1, total + seconds)
+        return dict(sorted(summary.items(), key=lambda item: item[1][1], reverse=True))
+
+
+# 当前运行的 sleep 预算(asyncio 任务会继承创建时的上下文,并行任务共享同一个预算)
+current_sleep_budget: ContextVar[Optional[SleepBudget]] = ContextVar('current_sleep_budget', default=None)
+
+
+def record_fixed_wait(reason: str, seconds: float):
+    """将一段无条件等待计入当前运行的 sleep 预算(没有进行中的运行时忽略)"""
+    budget = current_sleep_budget.get()
+    if budget is not None:
+        budget.record(reason, seconds)
+
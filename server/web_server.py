@@ -5,25 +5,57 @@ Web 服务 - 提供界面触发云效到 K8s 自动部署
 启动方式:
     python web_server.py
 
+    WEB_SERVER=dev(默认)时使用 Werkzeug 开发服务器;
+    WEB_SERVER=production 时改由 gunicorn 启动(配置见 gunicorn.conf.py),
+    也可以直接执行: gunicorn -c gunicorn.conf.py web_server:app
+
 访问地址:
-    http://localhost:5000
-    或局域网内其他设备访问: http://<本机IP>:5000
+    http://localhost:5001
+    或局域网内其他设备访问: http://<本机IP>:5001
 """
 import os
 import sys
-import asyncio
-import json
+import atexit
+import threading
+import uuid
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, render_template, jsonify, request
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from threading import Lock
 
+import config
+import file_log
+import metrics
+from async_runtime import AsyncRuntime
+from browser_pool import BrowserPool
+from job_queue import JobQueue, ERROR as JOB_ERROR, INTERRUPTED as JOB_INTERRUPTED, RUNNING as JOB_RUNNING
+from log_stream import LogBatcher
+from process_pool import WorkerPool
+from run_logs import RunLogStore
+from singleflight import build_flights
+
 # 导入任务调度器
-from task_scheduler import TaskScheduler, DeployTask
+from task_scheduler import TaskScheduler, DEPLOY_TASKS, create_deploy_tasks, current_task
+
+if __name__ == '__main__' and config.WEB_SERVER == 'production':
+    # 生产模式: 换成 gunicorn 进程(gunicorn 工作进程会重新导入本模块并启动后台服务)
+    import importlib.util
+    if importlib.util.find_spec('gunicorn') is None:
+        sys.exit("WEB_SERVER=production 需要安装 gunicorn: pip install gunicorn")
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'web_server:app'])
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'yunxiao-k8s-deployer-secret'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# 固定使用线程模式: 部署在后台线程的事件循环中执行(Playwright),
+# 不能使用 eventlet/gevent 的猴子补丁; 高并发由 gunicorn 多线程工作进程提供
+socketio = SocketIO(
+    app,
+    async_mode='threading',
+    cors_allowed_origins=config.CORS_ALLOWED_ORIGINS,
+    ping_interval=config.SOCKETIO_PING_INTERVAL,
+    ping_timeout=config.SOCKETIO_PING_TIMEOUT,
+)
 
 # 任务状态管理 - 统一管理
 task_lock = Lock()
@@ -35,123 +67,293 @@ task_status = {
     'result': None,
     'start_time': None,
     'end_time': None,
-    'tasks': []
+    'tasks': [],
+    'run_ids': []
 }
 
+# 状态变更序号: 日志和状态字段的每次变更都分配一个递增序号,
+# /api/status?since=<序号> 只返回该序号之后的变更,序号同时作为 ETag
+status_seq_lock = threading.RLock()
+status_seq = 0
+# 各状态字段最后一次变更的序号(修改 task_status 后在 task_lock 内调用 touch_status)
+status_field_seq = {field: 0 for field in task_status}
+# 服务启动标识: 重启后序号从头开始,ETag 带上启动标识避免与重启前的 ETag 相同
+STATUS_BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def next_status_seq():
+    """分配下一个变更序号"""
+    global status_seq
+    with status_seq_lock:
+        status_seq += 1
+        return status_seq
+
+
+def touch_status(*fields):
+    """记录 task_status 字段已变更(调用方需持有 task_lock)"""
+    seq = next_status_seq()
+    for field in fields:
+        status_field_seq[field] = seq
+
+
+# 日志房间: 连接后默认加入 ALL_LOGS_ROOM 接收全部日志,
+# 通过 subscribe 事件改为只接收某次运行(run:<运行ID>)或某些项目(project:<项目>)的日志
+ALL_LOGS_ROOM = 'logs:all'
+LOG_ROOM_PREFIXES = (ALL_LOGS_ROOM, 'run:', 'project:')
+
+
+def log_rooms(entry):
+    """日志应发送到的房间"""
+    targets = [ALL_LOGS_ROOM]
+    if entry.get('run_id'):
+        targets.append(f"run:{entry['run_id']}")
+    if entry.get('project'):
+        targets.append(f"project:{entry['project']}")
+    return targets
+
+
+# 日志批量推送(后台线程合并发送 log_batch 事件并输出到控制台)
+log_batcher = LogBatcher(socketio.emit, route=log_rooms, clients=lambda: socketio_clients)
+log_batcher.start()
+atexit.register(log_batcher.close)
+
+# 按运行保存的日志(每次运行容量有上限,旧运行写入 LOG_DIR 下的压缩文件)
+run_log_store = RunLogStore()
+
+
+def new_run_id():
+    """部署运行ID(同时作为日志文件名)"""
+    return datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+
 
 class WebLogger:
     """Web 日志输出类,用于捕获日志并通过 WebSocket 发送"""
 
-    def __init__(self):
-        self.logs = []
-
-    def log(self, message, level="INFO"):
-        """记录日志并发送到前端"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
+    def __init__(self, run_id='server'):
+        """
+        Args:
+            run_id: 日志所属的运行ID,不属于任何部署的日志记入 'server'
+        """
+        self.run_id = run_id
+        self.logs = run_log_store.open(run_id)
+
+    def log(self, message, level="INFO", task_id=None, project=None):
+        """
+        记录日志并发送到前端
+
+        Args:
+            task_id / project: 日志所属的任务(工作进程传回的日志),
+                               未提供时使用调度器当前执行的任务
+        """
+        now = datetime.now()
+        timestamp = now.strftime("%H:%M:%S")
+        # 调度器在任务内输出的日志标记所属任务
+        task = current_task.get()
+        if task_id is None and task is not None:
+            task_id, project = task.task_id, task.project
         log_entry = {
             'timestamp': timestamp,
             'level': level,
-            'message': message
+            'message': message,
+            'run_id': None if self.run_id == 'server' else self.run_id,
+            'task_id': task_id,
+            'project': project
         }
-        self.logs.append(log_entry)
+        # 分配序号与写入在同一把锁内完成: /api/status 读到的序号之前的日志都已写入
+        with status_seq_lock:
+            log_entry['seq'] = next_status_seq()
+            self.logs.append(log_entry)
 
-        # 通过 WebSocket 实时发送日志
-        socketio.emit('log', log_entry)
+        # 放入推送缓冲区,由后台线程批量发送到前端并输出到控制台(不阻塞部署线程)
+        log_batcher.publish(log_entry)
 
-        # 同时输出到控制台
-        print(f"[{timestamp}] [{level}] {message}")
+        # 写入日志文件(后台线程写入)
+        file_log.write(now.strftime("%Y-%m-%d %H:%M:%S"), level, message, log_entry['run_id'])
 
 
 # 全局 logger 实例
 web_logger = WebLogger()
 
 
-async def run_deployment(selected_tasks):
+# 常驻部署运行时与浏览器池
+# Playwright 对象绑定创建它的事件循环,所以所有部署都提交到同一个常驻事件循环执行,
+# 浏览器池在服务生命周期内只创建一次,服务退出时由运行时关闭
+deploy_runtime = AsyncRuntime('deploy-loop')
+browser_pool = None
+# EXECUTION_MODE=process 时的部署工作进程池(每个作业在独立子进程中执行)
+worker_pool = None
+
+# 正在执行的部署请求数(多个用户可同时提交部署)
+active_runs = 0
+
+# 已连接的 Socket.IO 客户端数
+socketio_clients = 0
+# 服务正在退出(stop_services 之后拒绝新的 Socket.IO 连接)
+shutting_down = False
+
+
+def get_browser_pool():
+    """获取浏览器池,未启用时返回 None"""
+    global browser_pool
+    if config.BROWSER_POOL_ENABLED and browser_pool is None:
+        warm_urls = []
+        if config.BROWSER_POOL_WARM:
+            warm_urls = sorted({
+                config.FRONTEND_CONFIG['test']['yunxiao_url'],
+                config.BACKEND_CONFIG['test']['yunxiao_url'],
+            } - {''})
+        browser_pool = BrowserPool(warm_urls=warm_urls, log_callback=web_logger.log)
+        deploy_runtime.add_shutdown_hook(browser_pool.close)
+    return browser_pool
+
+
+def get_worker_pool():
+    """获取部署工作进程池(EXECUTION_MODE=process)"""
+    global worker_pool
+    if worker_pool is None:
+        worker_pool = WorkerPool()
+        deploy_runtime.add_shutdown_hook(worker_pool.close)
+    return worker_pool
+
+
+async def run_in_worker(selected_tasks, run_id, project_logger):
+    """在工作进程中执行部署,日志和步骤耗时实时转发,返回各任务的执行结果"""
+    def on_message(kind, data):
+        if kind == 'log':
+            project_logger.log(data['message'], data['level'], task_id=data['task_id'], project=data['project'])
+        elif kind == 'span' and config.METRICS_ENABLED:
+            metrics.observe_step(data['name'], data['duration'], data['ok'], project=data['project'], env=data['env'])
+
+    return await get_worker_pool().run({'tasks': selected_tasks, 'run_id': run_id}, on_message)
+
+
+# 退出时取消进行中的部署、关闭浏览器池并停止事件循环(在日志推送关闭之前执行)
+atexit.register(deploy_runtime.shutdown)
+
+
+# /metrics 中的即时值在抓取时读取
+metrics.install_span_metrics()
+metrics.ACTIVE_RUNS.set_function(lambda: active_runs)
+metrics.BROWSER_POOL_WAITING.set_function(lambda: browser_pool.waiting if browser_pool else 0)
+metrics.BUILDS_IN_FLIGHT.set_function(lambda: len(build_flights.in_flight()))
+metrics.SOCKETIO_CLIENTS.set_function(lambda: socketio_clients)
+metrics.JOBS_QUEUED.set_function(lambda: job_queue.queued_count())
+
+
+# 部署队列的道,按优先顺序: 作业进入其任务中最靠前的环境对应的道
+JOB_LANES = ('prod', 'test', 'build')
+
+
+def job_lane(selected_tasks):
+    """作业所在的道(包含生产部署的作业进入 prod 道)"""
+    envs = {DEPLOY_TASKS[t['task_id']][2] for t in selected_tasks if t.get('task_id') in DEPLOY_TASKS}
+    return next((lane for lane in JOB_LANES if lane in envs), JOB_LANES[-1])
+
+
+async def run_deployment(selected_tasks, run_id=None):
     """
     异步执行部署任务
 
     Args:
         selected_tasks: 选中的任务列表,每个任务是字典 {'task_id': 'frontend-test', 'run_build': True}
+        run_id: 运行ID (默认按开始时间生成)
+
+    Returns:
+        执行结果: success / partial / error
     """
+    global active_runs
+    run_id = run_id or new_run_id()
+    project_logger = WebLogger(run_id)
+    selected_ids = {task_info.get('task_id') for task_info in selected_tasks}
+    result = 'error'
     try:
         with task_lock:
+            # 已有部署在执行时(其他用户的请求),追加到当前状态而不是清空
+            if active_runs == 0:
+                task_status['logs'] = []
+                task_status['result'] = None
+                task_status['start_time'] = datetime.now().isoformat()
+                task_status['end_time'] = None
+                task_status['tasks'] = []
+                task_status['run_ids'] = []
+                touch_status('logs', 'result', 'start_time', 'end_time', 'tasks')
+            task_status['run_ids'].append(run_id)
+            active_runs += 1
             task_status['running'] = True
-            task_status['logs'] = []
-            task_status['result'] = None
-            task_status['start_time'] = datetime.now().isoformat()
-            task_status['end_time'] = None
             task_status['current_step'] = '初始化...'
-            task_status['tasks'] = []
+            touch_status('run_ids', 'running', 'current_step')
 
         socketio.emit('task_status', {'status': 'running'})
 
-        # 创建 logger
-        project_logger = WebLogger()
         project_logger.log(f"开始执行部署任务 (共 {len(selected_tasks)} 个)", "INFO")
 
-        # 创建任务调度器
-        scheduler = TaskScheduler(log_callback=project_logger.log)
-
         # 根据选中的任务创建 DeployTask
-        task_map = {
-            'frontend-build': ('前端云效构建', 'frontend', 'build'),
-            'frontend-test': ('前端测试环境', 'frontend', 'test'),
-            'backend-build': ('后端云效构建', 'backend', 'build'),
-            'backend-test': ('后端测试环境', 'backend', 'test'),
-        }
-
+        deploy_tasks = create_deploy_tasks(selected_tasks)
+        known_ids = {task.task_id for task in deploy_tasks}
         for task_info in selected_tasks:
-            task_id = task_info['task_id']
-            run_build = task_info['run_build']
+            if task_info['task_id'] not in known_ids:
+                project_logger.log(f"⚠️ 未知的任务ID: {task_info['task_id']}，已跳过", "WARNING")
 
-            if task_id in task_map:
-                name, proj, env = task_map[task_id]
-                mode = '触发构建' if run_build else '使用最近构建'
-                project_logger.log(f"添加任务: {name} [{mode}]", "INFO")
+        for task in deploy_tasks:
+            mode = '触发构建' if task.run_build else '使用最近构建'
+            project_logger.log(f"添加任务: {task.name} [{mode}]", "INFO")
 
-                task = DeployTask(task_id, name, proj, env, run_build=run_build)
-                scheduler.add_task(task)
-
-                # 更新任务状态
-                with task_lock:
-                    task_status['tasks'].append({
-                        'id': task_id,
-                        'name': name,
-                        'run_build': run_build,
-                        'status': 'pending'
-                    })
-            else:
-                project_logger.log(f"⚠️ 未知的任务ID: {task_id}，已跳过", "WARNING")
+            # 更新任务状态
+            with task_lock:
+                task_status['tasks'].append({
+                    'id': task.task_id,
+                    'name': task.name,
+                    'run_build': task.run_build,
+                    'status': 'pending'
+                })
+                touch_status('tasks')
 
         # 执行所有任务
-        await scheduler.execute_all()
+        if config.EXECUTION_MODE == 'process':
+            results = await run_in_worker(selected_tasks, run_id, project_logger)
+        else:
+            # 创建任务调度器(使用常驻浏览器池)
+            scheduler = TaskScheduler(log_callback=project_logger.log, browser_pool=get_browser_pool(), run_id=run_id)
+            for task in deploy_tasks:
+                scheduler.add_task(task)
+            await scheduler.execute_all()
+            results = [task.summary() for task in scheduler.tasks]
 
         # 检查执行结果
-        success_count = sum(1 for t in scheduler.tasks if t.status == 'success')
-        error_count = sum(1 for t in scheduler.tasks if t.status == 'error')
+        success_count = sum(1 for r in results if r['status'] == 'success')
+        # 因依赖失败而跳过的任务也计为失败
+        error_count = sum(1 for r in results if r['status'] in ('error', 'skipped'))
 
         # 更新任务状态
         with task_lock:
-            for task in scheduler.tasks:
+            for r in results:
                 # 查找对应的任务状态并更新
                 for ts in task_status['tasks']:
-                    if ts['id'] == task.task_id:
-                        ts['status'] = task.status
-                        ts['tag'] = task.tag
-                        if task.error_message:
-                            ts['error'] = task.error_message
+                    if ts['id'] == r['task_id']:
+                        ts['status'] = r['status']
+                        ts['tag'] = r['tag']
+                        if r['targets']:
+                            ts['targets'] = r['targets']
+                        if r['error']:
+                            ts['error'] = r['error']
                         break
+            touch_status('tasks')
 
         if error_count == 0:
             with task_lock:
-                task_status['result'] = 'success'
+                # 并发的其他部署已失败时保留失败结果
+                task_status['result'] = task_status['result'] or 'success'
                 task_status['current_step'] = '所有任务执行完成'
+                touch_status('result', 'current_step')
+            result = 'success'
             project_logger.log(f"✅ 所有任务执行成功! 成功 {success_count} 个", "SUCCESS")
             socketio.emit('task_status', {'status': 'success', 'summary': f'成功完成 {success_count} 个任务'})
         else:
             with task_lock:
                 task_status['result'] = 'partial'
                 task_status['current_step'] = f'部分任务失败: 成功 {success_count} 个, 失败 {error_count} 个'
+                touch_status('result', 'current_step')
+            result = 'partial'
             project_logger.log(f"⚠️ 部分任务失败: 成功 {success_count} 个, 失败 {error_count} 个", "WARNING")
             socketio.emit('task_status', {'status': 'partial', 'summary': f'成功 {success_count} 个, 失败 {error_count} 个'})
 
@@ -159,43 +361,76 @@ async def run_deployment(selected_tasks):
         with task_lock:
             task_status['result'] = 'error'
             task_status['current_step'] = f'部署失败: {str(e)}'
+            # 整个部署失败(如工作进程超时被结束)时,未完成的任务标记为失败
+            for ts in task_status['tasks']:
+                if ts['id'] in selected_ids and ts['status'] in ('pending', 'running'):
+                    ts['status'] = 'error'
+                    ts['error'] = str(e)
+            touch_status('result', 'current_step', 'tasks')
 
-        project_logger = WebLogger()
         project_logger.log(f"部署任务执行失败: {str(e)}", "ERROR")
         socketio.emit('task_status', {'status': 'error', 'error': str(e), 'summary': str(e)})
 
     finally:
+        run_log_store.finish(run_id)
         with task_lock:
-            task_status['running'] = False
-            task_status['end_time'] = datetime.now().isoformat()
+            active_runs -= 1
+            task_status['running'] = active_runs > 0
+            if not task_status['running']:
+                task_status['end_time'] = datetime.now().isoformat()
+            touch_status('running', 'end_time')
+            still_running = task_status['running']
+        if still_running:
+            socketio.emit('task_status', {'status': 'running'})
+
+    return result
+
+
+def dispatch_job(job):
+    """将队列中的作业提交到常驻事件循环执行(立即返回),结束后通知队列开始下一个作业"""
+    future = deploy_runtime.submit(run_deployment(job['tasks'], job['run_id']))
+    future.add_done_callback(_on_deployment_done)
+
+    def finish(done):
+        # 服务退出时被取消的部署可能已部分执行,与重启时的处理一致标记为 interrupted
+        if done.cancelled():
+            job_queue.finish(job['job_id'], JOB_INTERRUPTED)
+        else:
+            job_queue.finish(job['job_id'], JOB_ERROR if done.exception() is not None else done.result())
 
+    future.add_done_callback(finish)
 
-def start_deployment_task(selected_tasks):
-    """在新的事件循环中启动部署任务"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(run_deployment(selected_tasks))
-    except Exception as e:
+
+# 部署队列(按环境分道排队,排队中的相同请求合并)
+job_queue = JobQueue(dispatch_job)
+# 退出时先停止派发,排队中的作业留在队列文件中,重启后继续执行
+atexit.register(job_queue.close)
+
+
+def _on_deployment_done(future):
+    """部署协程结束回调: 处理 run_deployment 未捕获的异常"""
+    if future.cancelled():
+        return
+    e = future.exception()
+    if e is not None:
         # 创建 logger 来记录错误
         project_logger = WebLogger()
         project_logger.log(f"部署任务执行异常: {str(e)}", "ERROR")
         import traceback
-        project_logger.log(f"异常堆栈: {traceback.format_exc()}", "ERROR")
+        stack = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+        project_logger.log(f"异常堆栈: {stack}", "ERROR")
 
-        # 更新任务状态
+        # 更新任务状态(running 由 run_deployment 的 finally 维护)
         with task_lock:
-            task_status['running'] = False
             task_status['result'] = 'error'
             task_status['end_time'] = datetime.now().isoformat()
+            touch_status('result', 'end_time')
 
         # 发送错误状态
         socketio.emit('task_status', {
             'status': 'error',
             'summary': f'任务执行异常: {str(e)}'
         })
-    finally:
-        loop.close()
 
 
 @app.route('/')
@@ -204,13 +439,72 @@ def index():
     return render_template('index.html')
 
 
+def _current_logs(run_ids, since, until):
+    """当前部署各运行中序号在 (since, until] 之间的日志(按序号排序)"""
+    entries = []
+    for run_id in run_ids:
+        run_log = run_log_store.get(run_id)
+        if run_log:
+            entries.extend(entry for entry in run_log['entries'] if since < entry.get('seq', 0) <= until)
+    entries.sort(key=lambda entry: entry.get('seq', 0))
+    return entries
+
+
 @app.route('/api/status')
 def get_status():
-    """获取当前任务状态"""
-    with task_lock:
-        status_data = task_status.copy()
+    """
+    获取当前任务状态
 
-    return jsonify(status_data)
+    - 不带参数: 返回完整状态(含当前部署的全部日志)
+    - since=<cursor>: 只返回该序号之后变更的字段(changed)和新增日志(logs)
+    - 响应带 cursor(当前序号)和 ETag,请求带 If-None-Match 且状态未变化时返回 304
+    """
+    since = request.args.get('since', type=int)
+    with task_lock:
+        with status_seq_lock:
+            cursor = status_seq
+        etag = f'{STATUS_BOOT_ID}-{cursor}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        run_ids = list(task_status['run_ids'])
+        if since is None:
+            status_data = task_status.copy()
+            status_data['tasks'] = [dict(ts) for ts in task_status['tasks']]
+            status_data['run_ids'] = run_ids
+        else:
+            status_data = {
+                'changed': {
+                    field: task_status[field]
+                    for field, seq in status_field_seq.items() if seq > since and field != 'logs'
+                },
+            }
+            # 字段值在 jsonify 前复制,避免序列化时被部署线程修改
+            if 'tasks' in status_data['changed']:
+                status_data['changed']['tasks'] = [dict(ts) for ts in task_status['tasks']]
+            if 'run_ids' in status_data['changed']:
+                status_data['changed']['run_ids'] = run_ids
+            # 日志已被清空(开始了新一轮部署)时客户端需要丢弃已有日志
+            status_data['reset'] = status_field_seq['logs'] > since
+
+    # 只返回 cursor 之前的日志,之后的日志在下一次请求中返回
+    status_data['logs'] = _current_logs(run_ids, since or 0, cursor)
+    status_data['cursor'] = cursor
+
+    response = jsonify(status_data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/logs/<run_id>')
+def get_run_logs(run_id):
+    """获取某次运行的日志(包括已写入压缩文件的旧运行)"""
+    run_log = run_log_store.get(run_id)
+    if run_log is None:
+        return jsonify({'success': False, 'message': f'运行日志不存在: {run_id}'}), 404
+    return jsonify(run_log)
 
 
 @app.route('/api/deploy', methods=['POST'])
@@ -221,28 +515,16 @@ def trigger_deploy():
     selected_tasks = data.get('tasks', [])
     mode = data.get('mode', 'all')
 
-    # 检查是否正在运行
-    with task_lock:
-        if task_status['running']:
-            return jsonify({
-                'success': False,
-                'message': '任务正在执行中,请稍后再试'
-            }), 400
-
+    # 已有部署在执行时也允许提交: 按环境分道排队,同一道有空闲时立即执行;
+    # 同一流水线的构建由 singleflight 合并,后提交的请求会等待进行中的构建并复用其版本号
     if not selected_tasks:
         return jsonify({
             'success': False,
             'message': '请至少选择一个任务'
         }), 400
 
-    # 在新线程中启动异步任务
-    import threading
-    thread = threading.Thread(
-        target=start_deployment_task,
-        args=(selected_tasks,)
-    )
-    thread.daemon = True
-    thread.start()
+    # 加入部署队列(所在道有空闲时立即开始执行)
+    job = job_queue.enqueue(selected_tasks, job_lane(selected_tasks), new_run_id())
 
     # 根据模式返回消息
     mode_desc = {
@@ -251,15 +533,66 @@ def trigger_deploy():
         'all': '完整部署'
     }.get(mode, '部署')
 
+    if job['coalesced']:
+        message = f"{mode_desc}任务与排队中的相同任务合并 ({job['lane']} 队列第 {job['position']} 位)"
+    elif job['status'] == JOB_RUNNING:
+        message = f'{mode_desc}任务已启动 (共 {len(selected_tasks)} 个任务)'
+    else:
+        message = f"{mode_desc}任务已加入 {job['lane']} 队列 (第 {job['position']} 位)"
+
     return jsonify({
         'success': True,
-        'message': f'{mode_desc}任务已启动 (共 {len(selected_tasks)} 个任务)'
+        'message': message,
+        'job': job,
+        'run_id': job['run_id']
     })
 
 
+@app.route('/api/jobs')
+def list_jobs():
+    """部署队列中的作业(排队中、执行中和最近结束的)"""
+    return jsonify({'jobs': job_queue.jobs()})
+
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """作业状态及排队位置"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'作业不存在: {job_id}'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消排队中的作业"""
+    try:
+        job = job_queue.cancel(job_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    if job is None:
+        return jsonify({'success': False, 'message': f'作业不存在: {job_id}'}), 404
+    return jsonify({'success': True, 'message': '作业已取消', 'job': job})
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 格式的运行指标"""
+    if not config.METRICS_ENABLED:
+        return Response('metrics disabled\n', status=404, mimetype='text/plain')
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @socketio.on('connect')
 def handle_connect():
     """WebSocket 连接建立"""
+    global socketio_clients
+    if shutting_down:
+        # 服务正在退出: 拒绝连接,页面稍后自动重连到重启后的服务
+        return False
+    with task_lock:
+        socketio_clients += 1
+    join_room(ALL_LOGS_ROOM)
     emit('connected', {'data': '连接成功'})
 
     # 发送当前状态
@@ -268,9 +601,35 @@ def handle_connect():
             emit('task_status', {'status': 'running'})
 
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    订阅日志,替换当前的订阅
+
+    Args:
+        data: {'run_id': 运行ID} 或 {'projects': ['frontend', 'backend']};
+              都不指定时恢复接收全部日志。同时指定运行和项目时两个房间都会收到同一条日志
+    """
+    data = data or {}
+    targets = [f"project:{project}" for project in data.get('projects') or []]
+    if data.get('run_id'):
+        targets.append(f"run:{data['run_id']}")
+    targets = targets or [ALL_LOGS_ROOM]
+
+    for room in rooms():
+        if room.startswith(LOG_ROOM_PREFIXES) and room not in targets:
+            leave_room(room)
+    for room in targets:
+        join_room(room)
+    emit('subscribed', {'rooms': targets})
+
+
 @socketio.on('disconnect')
 def handle_disconnect():
     """WebSocket 连接断开"""
+    global socketio_clients
+    with task_lock:
+        socketio_clients = max(0, socketio_clients - 1)
     print('客户端断开连接')
 
 
@@ -286,17 +645,43 @@ def web_log(message, level="INFO"):
 utils.log = web_log
 
 
-if __name__ == '__main__':
-    # 使用端口 5001 (避免与 macOS AirPlay Receiver 冲突)
-    PORT = 5001
+def start_services():
+    """启动后台服务(服务进程开始处理请求前调用一次)"""
+    # 预先启动浏览器池,使首次部署无需等待浏览器启动
+    # (工作进程模式下各工作进程自行启动浏览器,不使用浏览器池)
+    pool = get_browser_pool() if config.EXECUTION_MODE != 'process' else None
+    if pool:
+        deploy_runtime.submit(pool.start())
+
+    # 继续执行重启前排队中的作业
+    job_queue.pump()
+
+
+def stop_services():
+    """
+    停止后台服务: 停止派发作业,取消进行中的部署并关闭浏览器池,发送剩余日志后断开所有页面
+
+    与 atexit 中注册的顺序相同,重复调用无副作用。gunicorn 工作进程收到退出信号时调用:
+    WebSocket 长连接各占一个线程,不主动断开时工作进程要等到超时被强制结束
+    """
+    global shutting_down
+    shutting_down = True
+    job_queue.close()
+    deploy_runtime.shutdown()
+    log_batcher.close()
+    socketio.server.eio.disconnect()
 
+
+if __name__ == '__main__':
     print("=" * 60)
     print("云效 K8s 自动部署 Web 服务")
     print("=" * 60)
-    print(f"本地访问: http://localhost:{PORT}")
-    print(f"局域网访问: http://<本机IP>:{PORT}")
+    print(f"本地访问: http://localhost:{config.WEB_PORT}")
+    print(f"局域网访问: http://<本机IP>:{config.WEB_PORT}")
+    print("开发服务器仅适合本机使用,多人使用请设置 WEB_SERVER=production")
     print("=" * 60)
 
+    start_services()
+
     # 启动 Flask 应用
-    # 使用 0.0.0.0 允许局域网访问
-    socketio.run(app, host='0.0.0.0', port=PORT, debug=False, allow_unsafe_werkzeug=True)
+    socketio.run(app, host=config.WEB_HOST, port=config.WEB_PORT, debug=False, allow_unsafe_werkzeug=True)
@@ -1,21 +1,181 @@
 """
 云效操作模块: 触发构建并获取镜像版本号
 """
+import asyncio
+import json
 import re
 from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 import config
-from utils import log, take_screenshot
+import yunxiao_http
+from config import ExecutionContext
+from tag_cache import get_tag_cache
+from tracing import span
+from utils import log, take_screenshot, image_tag_pattern
 
+# 日志弹窗中的日志内容面板
+LOG_PANEL_SELECTOR = '.log-container__body .log-panel__context.right'
 
-async def trigger_build_and_fetch_tag(page: Page, skip_trigger: bool = False) -> str:
+# 网络响应模式: 构建完成后等待网络响应中出现 tag 的最长时间(毫秒)
+NETWORK_TAG_WAIT_MS = 3000
+
+
+# 网络响应模式: 响应 JSON 中标识流水线运行的字段,以及请求地址中的运行 ID(如 /runs/123/log)
+RUN_ID_KEYS = ('pipelineRunId', 'runId', 'buildId')
+RUN_ID_URL_PATTERN = re.compile(r'(?:/runs?/|/builds?/|[?&]pipelineRunId=)(\d+)')
+
+
+def _run_number(value) -> int | None:
+    """运行 ID 转为可比较的整数(云效运行 ID 按时间递增),无法识别时返回 None"""
+    text = str(value)
+    return int(text) if text.isdigit() else None
+
+
+class TagSniffer:
+    """
+    监听页面的 XHR/fetch 响应,从 SPA 已下载的 JSON 或日志内容中提取镜像 tag
+
+    页面加载时的历史、状态响应中包含以前运行的 tag,因此每个 tag 都归属到一次运行:
+    JSON 中包含它的最近一层带运行 ID 字段(RUN_ID_KEYS)的对象,否则为请求地址中的运行 ID。
+    只采用最新一次运行的 tag,无法归属到运行的 tag 一律忽略;
+    触发新构建或等待运行中的构建时调用 reset(),只接受要等待的那次运行及之后的运行。
+    newest_run() 同时用于确认页面上最新一次运行的 ID(版本号缓存按运行 ID 记录)。
+    """
+
+    def __init__(self, page: Page, pattern: str):
+        """
+        Args:
+            page: 要监听的 Playwright Page 对象
+            pattern: tag 正则,有分组时取第一个分组,否则取整个匹配
+        """
+        self.page = page
+        self.pattern = re.compile(pattern)
+        # 运行 ID -> 该运行的响应中出现的 tag
+        self.runs: dict[int, set[str]] = {}
+        self._min_run: int | None = None
+        self._found = asyncio.Event()
+        self._pending: set[asyncio.Task] = set()
+
+    def attach(self):
+        self.page.on('response', self._on_response)
+
+    def detach(self):
+        self.page.remove_listener('response', self._on_response)
+        for task in self._pending:
+            task.cancel()
+
+    def newest_run(self) -> int | None:
+        """已知最新的运行 ID"""
+        return max(self.runs) if self.runs else None
+
+    def reset(self, min_run: int | None):
+        """
+        之后只接受运行 ID 不小于 min_run 的运行,丢弃更早运行的 tag
+
+        Args:
+            min_run: 要取 tag 的运行的最小 ID (None 表示不限制)
+        """
+        self._min_run = min_run
+        self.runs = {run: tags for run, tags in self.runs.items() if min_run is None or run >= min_run}
+        if self.latest():
+            self._found.set()
+        else:
+            self._found.clear()
+
+    def _on_response(self, response):
+        if response.request.resource_type not in ('xhr', 'fetch'):
+            return
+        task = asyncio.ensure_future(self._inspect(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _inspect(self, response):
+        content_type = response.headers.get('content-type', '')
+        if 'json' not in content_type and 'text' not in content_type:
+            return
+        try:
+            body = await response.text()
+        except Exception:
+            return  # 重定向或页面跳转后响应体不可用
+
+        url_match = RUN_ID_URL_PATTERN.search(response.url)
+        url_run = _run_number(url_match.group(1)) if url_match else None
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = body  # 纯文本日志
+        self._collect(data, url_run)
+
+        if self.latest():
+            self._found.set()
+        else:
+            self._found.clear()  # 出现了还没有 tag 的更新运行
+
+    def _collect(self, node, run: int | None):
+        """递归收集 tag,归属到最近一层的运行 ID"""
+        if isinstance(node, dict):
+            for key in RUN_ID_KEYS:
+                if key in node and _run_number(node[key]) is not None:
+                    run = _run_number(node[key])
+                    break
+            if run is not None and (self._min_run is None or run >= self._min_run):
+                self.runs.setdefault(run, set())
+            for value in node.values():
+                self._collect(value, run)
+        elif isinstance(node, list):
+            for item in node:
+                self._collect(item, run)
+        elif isinstance(node, str) and run is not None:
+            if self._min_run is not None and run < self._min_run:
+                return
+            matches = [m.group(1) if self.pattern.groups else m.group(0) for m in self.pattern.finditer(node)]
+            if matches:
+                self.runs.setdefault(run, set()).update(matches)
+
+    def latest(self) -> str | None:
+        """最新一次运行的 tag; 该运行还没有 tag 或有多个不同的 tag 时返回 None"""
+        if not self.runs:
+            return None
+        tags = self.runs[max(self.runs)]
+        return next(iter(tags)) if len(tags) == 1 else None
+
+    async def wait_for_tag(self, timeout: int) -> str | None:
+        """
+        等待响应中出现最新一次运行的 tag
+
+        Args:
+            timeout: 最长等待毫秒数
+
+        Returns:
+            最新一次运行的 tag,未找到时返回 None
+        """
+        if not self._found.is_set():
+            try:
+                await asyncio.wait_for(self._found.wait(), timeout / 1000)
+            except asyncio.TimeoutError:
+                pass
+        await self.settle()
+        return self.latest()
+
+    async def settle(self):
+        """等待正在解析的响应完成,避免漏掉同一批返回的更新运行"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+
+async def trigger_build_and_fetch_tag(
+    page: Page,
+    skip_trigger: bool = False,
+    ctx: ExecutionContext | None = None,
+) -> str:
     """前端专用: 触发构建并获取 tag"""
-    return await _trigger_build_and_fetch_tag(page, skip_trigger=skip_trigger)
+    return await _fetch_tag(page, ctx or config.default_context(), skip_trigger=skip_trigger)
 
 
 async def trigger_backend_build_and_fetch_tag(
     page: Page,
     skip_trigger: bool = False,
     log_job_keyword: str | None = None,
+    ctx: ExecutionContext | None = None,
 ) -> str:
     """
     后端专用: 触发构建并获取 tag
@@ -23,13 +183,57 @@ async def trigger_backend_build_and_fetch_tag(
     Args:
         page: Playwright Page 对象
         skip_trigger: 是否跳过触发构建
-        log_job_keyword: 日志任务关键词，用于定位特定任务的日志按钮（如 "Java生产环境构建"）
+        log_job_keyword: 日志任务关键词，用于定位特定任务的日志按钮（如 "Java生产环境构建"），
+                         未提供时使用 ctx.log_job_keyword
+        ctx: 任务执行上下文，未提供时使用 config 中的默认配置
+    """
+    ctx = ctx or config.default_context()
+    return await _fetch_tag(
+        page,
+        ctx,
+        skip_trigger=skip_trigger,
+        log_job_keyword=log_job_keyword or ctx.log_job_keyword,
+    )
+
+
+async def _fetch_tag(
+    page: Page,
+    ctx: ExecutionContext,
+    skip_trigger: bool = False,
+    log_job_keyword: str | None = None,
+) -> str:
     """
-    return await _trigger_build_and_fetch_tag(page, skip_trigger=skip_trigger, log_job_keyword=log_job_keyword)
+    按 config.YUNXIAO_MODE 选择执行方式获取 tag
+
+    http 模式直接调用流水线接口,登录状态失效或接口调用失败(接口路径不对、响应格式变化、
+    服务端错误等)时回退到浏览器自动化
+    """
+    if config.YUNXIAO_MODE == 'http':
+        try:
+            log("通过云效接口获取版本号 (http 模式)...", "PROGRESS")
+            with span('yunxiao.http'):
+                if log_job_keyword:
+                    return await yunxiao_http.trigger_backend_build_and_fetch_tag(
+                        ctx, skip_trigger=skip_trigger, log_job_keyword=log_job_keyword,
+                    )
+                return await yunxiao_http.trigger_build_and_fetch_tag(ctx, skip_trigger=skip_trigger)
+        except yunxiao_http.SessionExpiredError as e:
+            log(f"云效登录状态失效,回退到浏览器模式: {str(e)}", "WARNING")
+            skip_trigger = skip_trigger or e.run_id is not None
+        except yunxiao_http.YunxiaoApiError as e:
+            log(f"云效接口调用失败,回退到浏览器模式: {str(e)}", "WARNING")
+            # 接口已触发(或选定)运行时,在页面中等待该运行完成,不再重复触发
+            skip_trigger = skip_trigger or e.run_id is not None
+
+    with span('yunxiao.browser'):
+        return await _trigger_build_and_fetch_tag(
+            page, ctx, skip_trigger=skip_trigger, log_job_keyword=log_job_keyword,
+        )
 
 
 async def _trigger_build_and_fetch_tag(
     page: Page,
+    ctx: ExecutionContext,
     skip_trigger: bool = False,
     log_job_keyword: str | None = None,
 ) -> str:
@@ -41,10 +245,12 @@ async def _trigger_build_and_fetch_tag(
     2. 等待运行成功
     3. 根据 log_job_keyword 定位日志按钮（如果提供），否则使用第一个
     4. 点击日志，展开详细日志，提取 tag
+       (YUNXIAO_TAG_SOURCE=network 时优先从页面的 XHR/fetch 响应中提取,找不到再打开日志)
     5. tag 格式: {IMAGE_REGISTRY}/{IMAGE_NAMESPACE}/项目名:分支-时间戳
 
     Args:
         page: Playwright Page 对象
+        ctx: 任务执行上下文(云效地址、日志展开文本等)
         skip_trigger: 是否跳过触发构建,仅获取最近一次构建的版本号 (默认 False)
         log_job_keyword: 日志任务关键词，用于定位特定任务的日志按钮（如 "Java生产环境构建"）
 
@@ -54,196 +260,157 @@ async def _trigger_build_and_fetch_tag(
     Raises:
         Exception: 操作失败时抛出异常
     """
+    # 网络响应模式: 在打开页面前开始监听,收集 SPA 加载的构建数据中的 tag
+    # YUNXIAO_TAG_SOURCE=network 时从网络响应中提取 tag;
+    # 启用版本号缓存时还用网络响应确认 tag 所属的运行,供"最近构建"模式直接复用
+    use_network_tag = config.YUNXIAO_TAG_SOURCE == 'network'
+    cache = get_tag_cache() if ctx.project else None
+    sniffer = None
+    if use_network_tag or cache:
+        sniffer = TagSniffer(page, ctx.tag_pattern or image_tag_pattern())
+        sniffer.attach()
+
     try:
         # 1. 访问 Pipeline 页面
         log("访问云效 Pipeline 页面...", "PROGRESS")
-        await page.goto(config.YUNXIAO_URL, timeout=config.PAGE_LOAD_TIMEOUT)
-        await page.wait_for_load_state('networkidle')
+        with span('yunxiao.page_load'):
+            await page.goto(ctx.yunxiao_url, timeout=config.PAGE_LOAD_TIMEOUT)
+            await page.wait_for_load_state('networkidle')
 
         # 检查是否需要登录
         # 如果页面上有"登录"相关文字,说明需要手动登录
-        login_elements = await page.locator('text=登录').count()
-        if login_elements > 0:
-            log("⚠️  检测到需要登录,请在浏览器中手动登录后按回车继续...", "WARNING")
-            input("按回车继续...")
-            await page.wait_for_load_state('networkidle')
+        with span('yunxiao.login_check'):
+            login_elements = await page.locator('text=登录').count()
+            if login_elements > 0:
+                log("⚠️  检测到需要登录,请在浏览器中手动登录后按回车继续...", "WARNING")
+                input("按回车继续...")
+                await page.wait_for_load_state('networkidle')
 
         # 关闭可能的引导弹窗
-        try:
-            # 尝试关闭各种可能的弹窗
-            close_buttons = await page.locator('button:has-text("知道了"), button:has-text("关闭"), button:has-text("我知道了"), .next-dialog-close, [aria-label="Close"]').count()
-            if close_buttons > 0:
-                log("检测到引导弹窗,正在关闭...", "INFO")
-                await page.locator('button:has-text("知道了"), button:has-text("关闭"), button:has-text("我知道了"), .next-dialog-close, [aria-label="Close"]').first.click(timeout=3000)
-                await page.wait_for_timeout(1000)
-        except:
-            pass  # 如果没有弹窗或关闭失败,继续执行
+        with span('yunxiao.popups'):
+            try:
+                # 尝试关闭各种可能的弹窗
+                close_buttons = page.locator('button:has-text("知道了"), button:has-text("关闭"), button:has-text("我知道了"), .next-dialog-close, [aria-label="Close"]')
+                if await close_buttons.count() > 0:
+                    log("检测到引导弹窗,正在关闭...", "INFO")
+                    popup_close = close_buttons.first
+                    await popup_close.click(timeout=3000)
+                    # 等待弹窗关闭按钮消失(弹窗已关闭)
+                    await popup_close.wait_for(state='hidden', timeout=3000)
+            except:
+                pass  # 如果没有弹窗或关闭失败,继续执行
 
         # 2. 检测云效运行状态并决定是否触发新构建
-        should_trigger = not skip_trigger
-        already_running = False
-
-        if should_trigger:
-            log("检查云效运行状态...", "INFO")
-            try:
-                # 检测"运行中"状态
-                running_indicator = page.locator('text=运行中').first
-                if await running_indicator.count() > 0 and await running_indicator.is_visible():
-                    log("⚠️ 检测到云效已在运行中,跳过触发新构建", "WARNING")
+        with span('yunxiao.trigger', skip_trigger=skip_trigger) as trigger_span:
+            should_trigger = not skip_trigger
+            already_running = False
+
+            if should_trigger:
+                log("检查云效运行状态...", "INFO")
+                try:
+                    # 检测"运行中"状态
+                    running_indicator = page.locator('text=运行中').first
+                    if await running_indicator.count() > 0 and await running_indicator.is_visible():
+                        log("⚠️ 检测到云效已在运行中,跳过触发新构建", "WARNING")
+                        log("将等待当前运行中的构建完成", "INFO")
+                        already_running = True
+                        should_trigger = False
+                        # 只接受运行中的这次构建(已知最新的运行)的 tag
+                        if sniffer:
+                            sniffer.reset(sniffer.newest_run())
+                except Exception as e:
+                    log(f"检测运行状态时出错(继续执行): {str(e)}", "WARNING")
+
+            # 3. 如果需要触发构建，则点击运行按钮
+            if should_trigger:
+                log("点击【运行】按钮...", "PROGRESS")
+                run_button = page.locator('button:has-text("运行")').first
+
+                # 检查按钮是否可用
+                is_disabled = await run_button.is_disabled()
+                if is_disabled:
+                    log("⚠️ 运行按钮被禁用,可能已有构建在运行中", "WARNING")
                     log("将等待当前运行中的构建完成", "INFO")
                     already_running = True
-                    should_trigger = False
-            except Exception as e:
-                log(f"检测运行状态时出错(继续执行): {str(e)}", "WARNING")
-
-        # 3. 如果需要触发构建，则点击运行按钮
-        if should_trigger:
-            log("点击【运行】按钮...", "PROGRESS")
-            run_button = page.locator('button:has-text("运行")').first
-
-            # 检查按钮是否可用
-            is_disabled = await run_button.is_disabled()
-            if is_disabled:
-                log("⚠️ 运行按钮被禁用,可能已有构建在运行中", "WARNING")
-                log("将等待当前运行中的构建完成", "INFO")
-                already_running = True
-            else:
-                await run_button.click(timeout=config.OPERATION_TIMEOUT)
-
-                # 4. 等待"运行配置"弹窗出现
-                await page.wait_for_selector('text=运行配置', state='visible', timeout=config.OPERATION_TIMEOUT)
-
-                # 5. 在弹窗中点击【运行】按钮(确认)
-                log("确认运行配置...", "PROGRESS")
-                confirm_button = page.locator('.next-dialog >> button:has-text("运行")')
-                await confirm_button.click(timeout=config.OPERATION_TIMEOUT)
-
-                # 6. 等待弹窗关闭
-                await page.wait_for_selector('text=运行配置', state='hidden', timeout=config.OPERATION_TIMEOUT)
-                log("✓ 已触发新的构建", "SUCCESS")
-        elif skip_trigger and not already_running:
-            log("⏭️  跳过触发构建,将从最近一次构建中获取版本号", "INFO")
+                    if sniffer:
+                        sniffer.reset(sniffer.newest_run())
+                else:
+                    # 触发前已知的运行都是以前的构建
+                    known_run = sniffer.newest_run() if sniffer else None
+                    await run_button.click(timeout=config.OPERATION_TIMEOUT)
+
+                    # 4. 等待"运行配置"弹窗出现
+                    await page.wait_for_selector('text=运行配置', state='visible', timeout=config.OPERATION_TIMEOUT)
+
+                    # 5. 在弹窗中点击【运行】按钮(确认)
+                    log("确认运行配置...", "PROGRESS")
+                    confirm_button = page.locator('.next-dialog >> button:has-text("运行")')
+                    await confirm_button.click(timeout=config.OPERATION_TIMEOUT)
+
+                    # 6. 等待弹窗关闭
+                    await page.wait_for_selector('text=运行配置', state='hidden', timeout=config.OPERATION_TIMEOUT)
+                    log("✓ 已触发新的构建", "SUCCESS")
+
+                    # 只接受新构建的 tag
+                    if sniffer and known_run is not None:
+                        sniffer.reset(known_run + 1)
+                    elif sniffer:
+                        # 触发前没有看到任何运行 ID,无法区分新构建和以前构建的响应
+                        if use_network_tag:
+                            log("未能确定触发前的运行,改为从日志弹窗读取版本号", "INFO")
+                        sniffer.detach()
+                        sniffer = None
+            elif skip_trigger and not already_running:
+                log("⏭️  跳过触发构建,将从最近一次构建中获取版本号", "INFO")
+            trigger_span.set(triggered=should_trigger and not already_running, already_running=already_running)
 
         # 6. 等待构建完成
-        log("等待构建完成(最长5分钟)...", "WAITING")
-        try:
-            # 策略1: 等待"运行成功"标志出现
-            await page.wait_for_selector('text=运行成功', timeout=config.BUILD_TIMEOUT)
-
-            # 策略2: 循环检查,确保没有loading状态
-            # log("等待所有阶段完成...", "WAITING")
-            # max_wait_seconds = 60
-            # for i in range(max_wait_seconds):
-            #     # 检查页面上是否还有 loading/spinning 类的元素
-            #     loading_count = await page.locator('[class*="loading"], [class*="spinning"], [class*="running"]').count()
+        with span('yunxiao.build_wait'):
+            log("等待构建完成(最长5分钟)...", "WAITING")
+            try:
+                # 策略1: 等待"运行成功"标志出现
+                await page.wait_for_selector('text=运行成功', timeout=config.BUILD_TIMEOUT)
 
-            #     if loading_count == 0:
-            #         log(f"所有阶段已完成(等待了{i+1}秒)", "SUCCESS")
-            #         break
+                # 策略2: 循环检查,确保没有loading状态
+                # log("等待所有阶段完成...", "WAITING")
+                # max_wait_seconds = 60
+                # for i in range(max_wait_seconds):
+                #     # 检查页面上是否还有 loading/spinning 类的元素
+                #     loading_count = await page.locator('[class*="loading"], [class*="spinning"], [class*="running"]').count()
 
-            #     # 每秒检查一次
-            #     await page.wait_for_timeout(1000)
+                #     if loading_count == 0:
+                #         log(f"所有阶段已完成(等待了{i+1}秒)", "SUCCESS")
+                #         break
 
-            #     if i % 5 == 0 and i > 0:
-            #         log(f"仍在等待阶段完成... ({i}秒)", "INFO")
-            # else:
-            #     # 超过60秒仍未完成,继续执行(可能只是动画未消失)
-            #     log("等待超时,但继续尝试获取日志", "WARNING")
+                #     # 每秒检查一次
+                #     await page.wait_for_timeout(1000)
 
-            log("构建已完成", "SUCCESS")
+                #     if i % 5 == 0 and i > 0:
+                #         log(f"仍在等待阶段完成... ({i}秒)", "INFO")
+                # else:
+                #     # 超过60秒仍未完成,继续执行(可能只是动画未消失)
+                #     log("等待超时,但继续尝试获取日志", "WARNING")
 
-        except PlaywrightTimeoutError:
-            log("等待构建超时,可能构建失败或时间过长", "ERROR")
-            await take_screenshot(page, "build_timeout")
-            raise Exception("构建超时")
+                log("构建已完成", "SUCCESS")
 
-        # 7. 定位日志按钮
-        log("查找日志按钮...", "PROGRESS")
-        log_button = None
-
-        # 如果提供了任务关键词，则定位包含该关键词的任务卡片中的日志按钮
-        if log_job_keyword:
-            log(f"根据关键词定位日志按钮: {log_job_keyword}", "INFO")
-            try:
-                # 定位包含关键词的任务卡片
-                # DOM: <div class="flow-job-new--hoverableWrapper--p4fKlSv"> 包含任务名称和日志按钮
-                job_card = page.locator('div.flow-job-new--hoverableWrapper--p4fKlSv').filter(has_text=log_job_keyword).first
-                if await job_card.count() > 0:
-                    # 在该任务卡片中查找日志按钮
-                    btn = job_card.locator('button:has-text("日志")').first
-                    if await btn.count() > 0:
-                        log_button = btn
-                        log(f"✓ 找到包含 '{log_job_keyword}' 的日志按钮", "SUCCESS")
-            except Exception as e:
-                log(f"通过关键词定位失败: {str(e)}", "WARNING")
-
-        # 如果没有提供关键词或定位失败，使用第一个日志按钮
-        if not log_button:
-            log_buttons = page.locator('button:has-text("日志")')
-            button_count = await log_buttons.count()
-            if button_count == 0:
-                log("未找到任何日志按钮", "ERROR")
-                await take_screenshot(page, "no_log_buttons")
-                raise Exception("未找到日志按钮")
-            log_button = log_buttons.first
-            log(f"使用第一个日志按钮 (共找到 {button_count} 个)", "INFO")
-
-        # 8. 点击日志按钮
-        await log_button.click(timeout=5000)
-        await page.wait_for_timeout(2000)
-
-        # 9. 尝试展开详细日志
-        try:
-            log_elements = page.get_by_text(config.YUNXIAO_LOG_EXPAND_TEXT, exact=False)
-            if await log_elements.count() > 0:
-                await log_elements.first.click(timeout=5000)
-                await page.wait_for_timeout(2000)
-                log("已展开镜像构建日志", "INFO")
-        except Exception as e:
-            log(f"展开详细日志失败(继续尝试): {str(e)}", "WARNING")
+            except PlaywrightTimeoutError:
+                log("等待构建超时,可能构建失败或时间过长", "ERROR")
+                await take_screenshot(page, "build_timeout")
+                raise Exception("构建超时")
 
-        # 10. 从日志弹窗获取 tag
-        log("尝试提取版本号...", "PROGRESS")
+        # 7. 获取 tag: 优先使用页面已下载的网络响应,否则打开日志弹窗读取
         tag = None
+        if sniffer and use_network_tag:
+            with span('yunxiao.tag_network'):
+                tag = await sniffer.wait_for_tag(timeout=NETWORK_TAG_WAIT_MS)
+                if tag:
+                    log(f"✓ 从云效网络响应获取到版本号: {tag}", "SUCCESS")
+                else:
+                    log("网络响应中未找到版本号,改为从日志弹窗读取", "INFO")
 
-        # 定义统一的 tag 正则（固定格式）
-        # 格式: {IMAGE_REGISTRY}/{IMAGE_NAMESPACE}/项目名:分支-时间戳
-        # tag 部分匹配: 字母数字和连字符,遇到逗号、分号、空格、引号等停止
-        registry_escaped = config.IMAGE_REGISTRY.replace('.', r'\.')
-        unified_tag_pattern = rf'{registry_escaped}/{config.IMAGE_NAMESPACE}/[^:]+:([a-zA-Z0-9\-]+)'
-
-        try:
-            await page.wait_for_selector('.log-container__body .log-panel__context.right', state='visible', timeout=10000)
-            log_container = page.locator('.log-container__body .log-panel__context.right').first
-
-            # 滚动到日志底部
-            log("滚动日志到底部...", "INFO")
-            await log_container.evaluate('el => { el.scrollTop = el.scrollHeight }')
-            await page.wait_for_timeout(600)
-            await log_container.evaluate('el => { el.scrollTop = el.scrollHeight }')
-            await page.wait_for_timeout(300)
-
-            # 获取日志文本
-            log_text = await log_container.inner_text()
-
-            # 使用统一的 tag 正则提取
-            match = re.search(unified_tag_pattern, log_text)
-            if match:
-                tag = match.group(1)
-                log(f"✓ 从日志获取到版本号: {tag}", "SUCCESS")
-            else:
-                log("日志中未找到 tag", "WARNING")
-
-        except Exception as e:
-            log(f"从日志获取 tag 失败: {str(e)}", "WARNING")
-
-        # 11. 关闭日志弹窗
-        try:
-            close_button = page.locator('.next-dialog >> button.next-dialog-close')
-            await close_button.click(timeout=3000)
-            await page.wait_for_timeout(500)
-        except:
-            pass
+        if not tag:
+            with span('yunxiao.log_dialog'):
+                tag = await _read_tag_from_log_dialog(page, ctx, log_job_keyword)
 
         # 12. 验证结果
         if not tag:
@@ -251,6 +418,16 @@ async def _trigger_build_and_fetch_tag(
             await take_screenshot(page, "tag_not_found")
             raise Exception("无法获取镜像版本号")
 
+        # 记录 tag 所属的运行(无法确认运行时不记录)
+        if cache and sniffer:
+            await sniffer.settle()
+            run_id = sniffer.newest_run()
+            if run_id is not None:
+                try:
+                    await asyncio.to_thread(cache.put, ctx.project, ctx.env, tag, str(run_id))
+                except OSError as e:
+                    log(f"写入版本号缓存失败(忽略): {str(e)}", "WARNING")
+
         return tag
 
     except PlaywrightTimeoutError as e:
@@ -262,3 +439,125 @@ async def _trigger_build_and_fetch_tag(
         log(f"云效操作失败: {str(e)}", "ERROR")
         await take_screenshot(page, "yunxiao_error")
         raise
+
+    finally:
+        if sniffer:
+            sniffer.detach()
+
+
+async def _read_tag_from_log_dialog(
+    page: Page,
+    ctx: ExecutionContext,
+    log_job_keyword: str | None = None,
+) -> str | None:
+    """
+    打开构建日志弹窗,展开镜像构建日志并从日志文本中提取 tag
+
+    Args:
+        page: 已完成构建的云效 Pipeline 页面
+        ctx: 任务执行上下文
+        log_job_keyword: 日志任务关键词，用于定位特定任务的日志按钮
+
+    Returns:
+        镜像版本号,日志中未找到时返回 None
+
+    Raises:
+        Exception: 找不到日志按钮时抛出异常
+    """
+    # 7. 定位日志按钮
+    log("查找日志按钮...", "PROGRESS")
+    log_button = None
+
+    # 如果提供了任务关键词，则定位包含该关键词的任务卡片中的日志按钮
+    if log_job_keyword:
+        log(f"根据关键词定位日志按钮: {log_job_keyword}", "INFO")
+        try:
+            # 定位包含关键词的任务卡片
+            # DOM: <div class="flow-job-new--hoverableWrapper--p4fKlSv"> 包含任务名称和日志按钮
+            job_card = page.locator('div.flow-job-new--hoverableWrapper--p4fKlSv').filter(has_text=log_job_keyword).first
+            if await job_card.count() > 0:
+                # 在该任务卡片中查找日志按钮
+                btn = job_card.locator('button:has-text("日志")').first
+                if await btn.count() > 0:
+                    log_button = btn
+                    log(f"✓ 找到包含 '{log_job_keyword}' 的日志按钮", "SUCCESS")
+        except Exception as e:
+            log(f"通过关键词定位失败: {str(e)}", "WARNING")
+
+    # 如果没有提供关键词或定位失败，使用第一个日志按钮
+    if not log_button:
+        log_buttons = page.locator('button:has-text("日志")')
+        button_count = await log_buttons.count()
+        if button_count == 0:
+            log("未找到任何日志按钮", "ERROR")
+            await take_screenshot(page, "no_log_buttons")
+            raise Exception("未找到日志按钮")
+        log_button = log_buttons.first
+        log(f"使用第一个日志按钮 (共找到 {button_count} 个)", "INFO")
+
+    # 8. 点击日志按钮,等待日志弹窗渲染出任务列表或日志面板
+    await log_button.click(timeout=5000)
+    log_elements = page.get_by_text(ctx.log_expand_text, exact=False)
+    try:
+        await log_elements.or_(page.locator(LOG_PANEL_SELECTOR)).first.wait_for(state='visible', timeout=10000)
+    except PlaywrightTimeoutError:
+        log("日志弹窗未在 10 秒内出现(继续尝试)", "WARNING")
+
+    # 9. 尝试展开详细日志(日志面板的出现由下一步等待)
+    try:
+        if await log_elements.count() > 0:
+            await log_elements.first.click(timeout=5000)
+            log("已展开镜像构建日志", "INFO")
+    except Exception as e:
+        log(f"展开详细日志失败(继续尝试): {str(e)}", "WARNING")
+
+    # 10. 从日志弹窗获取 tag
+    log("尝试提取版本号...", "PROGRESS")
+    tag = None
+
+    unified_tag_pattern = image_tag_pattern()
+
+    try:
+        await page.wait_for_selector(LOG_PANEL_SELECTOR, state='visible', timeout=10000)
+        log_container = page.locator(LOG_PANEL_SELECTOR).first
+
+        # 滚动到日志底部,直到日志文本中出现镜像 tag(日志按需加载,滚动后才会渲染尾部内容)
+        log("滚动日志到底部...", "INFO")
+        try:
+            await page.wait_for_function(
+                """([selector, pattern]) => {
+                    const el = document.querySelector(selector);
+                    if (!el) return false;
+                    el.scrollTop = el.scrollHeight;
+                    return new RegExp(pattern).test(el.innerText);
+                }""",
+                arg=[LOG_PANEL_SELECTOR, unified_tag_pattern],
+                polling=200,
+                timeout=10000,
+            )
+        except PlaywrightTimeoutError:
+            log("等待日志中出现版本号超时,使用当前日志内容", "WARNING")
+
+        # 获取日志文本
+        log_text = await log_container.inner_text()
+
+        # 使用统一的 tag 正则提取
+        match = re.search(unified_tag_pattern, log_text)
+        if match:
+            tag = match.group(1)
+            log(f"✓ 从日志获取到版本号: {tag}", "SUCCESS")
+        else:
+            log("日志中未找到 tag", "WARNING")
+
+    except Exception as e:
+        log(f"从日志获取 tag 失败: {str(e)}", "WARNING")
+
+    # 11. 关闭日志弹窗
+    try:
+        close_button = page.locator('.next-dialog >> button.next-dialog-close')
+        await close_button.click(timeout=3000)
+        await close_button.first.wait_for(state='hidden', timeout=3000)
+    except:
+        pass
+
+    return tag
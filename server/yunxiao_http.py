@@ -0,0 +1,357 @@
+"""
+云效 HTTP 客户端: 复用 auth.json 中保存的登录 Cookie,直接调用流水线接口获取镜像版本号
+
+不启动浏览器,通过保持长连接的连接池调用以下接口(路径可在 .env 中配置):
+- 运行流水线:   POST {YUNXIAO_API_RUN_PATH}
+- 最近一次运行: GET  {YUNXIAO_API_LATEST_PATH}
+- 运行状态:     GET  {YUNXIAO_API_STATUS_PATH}
+- 构建日志:     GET  {YUNXIAO_API_LOG_PATH}
+
+登录状态失效、接口出错或响应格式不符时抛出 YunxiaoApiError(登录失效为其子类 SessionExpiredError),
+由 yunxiao.py 回退到浏览器模式。
+本地可使用 mock_yunxiao.py 启动模拟服务进行离线测试。
+"""
+import asyncio
+import http.client
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote, urlsplit
+import config
+from config import ExecutionContext
+from tag_cache import get_tag_cache
+from tracing import span
+from utils import log, image_tag_pattern, record_fixed_wait
+
+# 运行状态
+STATUS_RUNNING = 'RUNNING'
+STATUS_SUCCESS = 'SUCCESS'
+FINISHED_FAILED_STATUSES = ('FAIL', 'FAILED', 'CANCELED', 'CANCELLED')
+
+
+class YunxiaoApiError(Exception):
+    """云效接口调用失败(接口返回错误、连接失败或响应格式不符)"""
+
+    # 出错前已触发或选定的运行 ID: 回退到浏览器模式时等待该运行,不再重复触发
+    run_id: Optional[str] = None
+
+
+class SessionExpiredError(YunxiaoApiError):
+    """云效登录状态失效(需要重新在浏览器中登录)"""
+
+
+class _ConnectionPool:
+    """按 (scheme, host, port) 复用 HTTP 长连接的简单连接池(线程安全)"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._idle: Dict[tuple, List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str, port: Optional[int]) -> http.client.HTTPConnection:
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def release(self, scheme: str, host: str, port: Optional[int], conn: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.setdefault((scheme, host, port), []).append(conn)
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+def load_cookie_header(auth_file: str, host: str) -> str:
+    """
+    从 Playwright storage state 文件中读取指定域名可用的 Cookie
+
+    Args:
+        auth_file: storage state 文件路径 (config.AUTH_FILE)
+        host: 请求的主机名
+
+    Returns:
+        Cookie 请求头内容,没有可用 Cookie 时返回空字符串
+    """
+    if not os.path.exists(auth_file):
+        return ''
+
+    with open(auth_file, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+
+    now = time.time()
+    pairs = []
+    for cookie in state.get('cookies', []):
+        domain = cookie.get('domain', '').lstrip('.')
+        if host != domain and not host.endswith('.' + domain):
+            continue
+        expires = cookie.get('expires', -1)
+        if expires not in (-1, None) and expires < now:
+            continue
+        pairs.append(f"{cookie['name']}={cookie['value']}")
+    return '; '.join(pairs)
+
+
+class YunxiaoHttpClient:
+    """云效流水线接口客户端"""
+
+    def __init__(self, base_url: str = None, auth_file: str = None, timeout: float = 30):
+        """
+        Args:
+            base_url: 接口地址 (默认 config.YUNXIAO_API_BASE)
+            auth_file: 登录状态文件 (默认 config.AUTH_FILE)
+            timeout: 单次请求超时秒数
+        """
+        self.base_url = (base_url or config.YUNXIAO_API_BASE).rstrip('/')
+        self.auth_file = auth_file or config.AUTH_FILE
+        parts = urlsplit(self.base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path
+        self._pool = _ConnectionPool(timeout)
+        self._cookie_header = ''
+        self._cookie_mtime = None
+
+    def _cookies(self) -> str:
+        """读取 Cookie(auth.json 被浏览器模式更新后自动重新加载)"""
+        mtime = os.path.getmtime(self.auth_file) if os.path.exists(self.auth_file) else None
+        if mtime != self._cookie_mtime:
+            self._cookie_header = load_cookie_header(self.auth_file, self.host)
+            self._cookie_mtime = mtime
+        return self._cookie_header
+
+    def request(self, method: str, path: str, body: Dict[str, Any] = None) -> Any:
+        """
+        发送请求并解析 JSON 响应
+
+        Raises:
+            SessionExpiredError: 未登录或登录已失效
+            YunxiaoApiError: 接口返回其他错误、连接失败或响应不是合法的 JSON
+        """
+        cookie = self._cookies()
+        if not cookie:
+            raise SessionExpiredError(f"{self.auth_file} 中没有 {self.host} 的登录 Cookie")
+
+        headers = {
+            'Cookie': cookie,
+            'Accept': 'application/json',
+            'Connection': 'keep-alive',
+        }
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        # 长连接可能已被服务端关闭,失败时使用新连接重试一次
+        for attempt in range(2):
+            conn = self._pool.acquire(self.scheme, self.host, self.port)
+            try:
+                conn.request(method, self.base_path + path, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                if attempt == 0:
+                    continue
+                raise YunxiaoApiError(f"{method} {path} 失败: {str(e)}") from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise YunxiaoApiError(f"{method} {path} 失败: {str(e)}") from e
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._pool.release(self.scheme, self.host, self.port, conn)
+            break
+
+        location = response.getheader('Location', '')
+        content_type = response.getheader('Content-Type', '')
+        if response.status in (401, 403) or (response.status in (301, 302, 303) and 'login' in location.lower()):
+            raise SessionExpiredError(f"接口返回 {response.status},登录状态已失效")
+        if response.status >= 400:
+            raise YunxiaoApiError(f"{method} {path} 失败: HTTP {response.status} {data[:200]!r}")
+        if 'json' not in content_type:
+            # 登录失效时部分网关会直接返回登录页 HTML
+            raise SessionExpiredError(f"接口返回了非 JSON 内容 ({content_type}),可能需要重新登录")
+
+        try:
+            return json.loads(data.decode('utf-8')) if data else None
+        except ValueError as e:
+            raise YunxiaoApiError(f"{method} {path} 返回的 JSON 无法解析: {str(e)}") from e
+
+    def run_pipeline(self, pipeline_id: str) -> str:
+        """运行流水线,返回运行 ID"""
+        result = self.request('POST', config.YUNXIAO_API_RUN_PATH.format(pipeline_id=pipeline_id), body={})
+        return str(_field(_unwrap(result), 'runId'))
+
+    def latest_run(self, pipeline_id: str) -> Optional[Dict[str, Any]]:
+        """最近一次运行 {'runId': ..., 'status': ...},没有运行记录时返回 None"""
+        result = _unwrap(self.request('GET', config.YUNXIAO_API_LATEST_PATH.format(pipeline_id=pipeline_id)))
+        if result:
+            _field(result, 'runId')
+        return result or None
+
+    def run_status(self, pipeline_id: str, run_id: str) -> str:
+        """运行状态 (RUNNING / SUCCESS / FAIL / CANCELED)"""
+        path = config.YUNXIAO_API_STATUS_PATH.format(pipeline_id=pipeline_id, run_id=run_id)
+        return str(_field(_unwrap(self.request('GET', path)), 'status')).upper()
+
+    def run_log(self, pipeline_id: str, run_id: str, job_keyword: str = '') -> str:
+        """构建日志文本"""
+        path = config.YUNXIAO_API_LOG_PATH.format(
+            pipeline_id=pipeline_id, run_id=run_id, job=quote(job_keyword or ''),
+        )
+        result = _unwrap(self.request('GET', path))
+        if isinstance(result, dict):
+            return result.get('content', '')
+        return str(result or '')
+
+    def close(self):
+        self._pool.close()
+
+
+def _unwrap(result: Any) -> Any:
+    """兼容 {"success": true, "data": {...}} 形式的响应包装"""
+    if isinstance(result, dict):
+        if result.get('success') is False:
+            raise YunxiaoApiError(result.get('errorMessage') or result.get('message') or str(result))
+        if 'data' in result:
+            return result['data']
+    return result
+
+
+def _field(result: Any, key: str) -> Any:
+    """读取响应中的字段,响应格式不符(接口路径配置错误或接口变化)时抛出 YunxiaoApiError"""
+    if not isinstance(result, dict) or key not in result:
+        raise YunxiaoApiError(f"接口响应中没有 {key} 字段: {str(result)[:200]}")
+    return result[key]
+
+
+def parse_pipeline_id(yunxiao_url: str) -> str:
+    """从流水线页面地址提取流水线 ID,例如 .../pipelines/12345/current -> 12345"""
+    match = re.search(r'/pipelines?/([^/?#]+)', yunxiao_url)
+    if not match:
+        raise ValueError(f"无法从云效地址中解析流水线 ID: {yunxiao_url}")
+    return match.group(1)
+
+
+_client: Optional[YunxiaoHttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> YunxiaoHttpClient:
+    """获取进程内共享的客户端(共享连接池)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = YunxiaoHttpClient()
+    return _client
+
+
+async def _fetch_tag(ctx: ExecutionContext, skip_trigger: bool, log_job_keyword: Optional[str]) -> str:
+    """
+    触发(或复用)运行,轮询状态直到完成,从日志中提取 tag
+
+    轮询在协程中进行,只有单个请求在线程中执行: 取消任务时立即停止轮询
+    """
+    client = get_client()
+    pipeline_id = parse_pipeline_id(ctx.yunxiao_url)
+
+    with span('yunxiao_http.latest_run'):
+        run = await asyncio.to_thread(client.latest_run, pipeline_id)
+    if skip_trigger:
+        if not run:
+            raise Exception("流水线没有运行记录,无法获取版本号")
+        run_id = str(run['runId'])
+        log(f"⏭️  跳过触发构建,使用最近一次运行 #{run_id}", "INFO")
+    elif run and str(run.get('status', '')).upper() == STATUS_RUNNING:
+        run_id = str(run['runId'])
+        log(f"⚠️ 检测到云效已在运行中(#{run_id}),跳过触发新构建", "WARNING")
+    else:
+        with span('yunxiao_http.trigger'):
+            run_id = await asyncio.to_thread(client.run_pipeline, pipeline_id)
+        log(f"✓ 已触发新的构建 #{run_id}", "SUCCESS")
+
+    try:
+        return await _wait_run_tag(client, ctx, pipeline_id, run_id, log_job_keyword)
+    except YunxiaoApiError as e:
+        e.run_id = run_id
+        raise
+
+
+async def _wait_run_tag(client: YunxiaoHttpClient, ctx: ExecutionContext, pipeline_id: str, run_id: str,
+                        log_job_keyword: Optional[str]) -> str:
+    """等待运行完成,从日志中提取 tag"""
+    # 同一次运行的版本号不会变化,已缓存时无需轮询状态和读取日志
+    cache = get_tag_cache() if ctx.project else None
+    cached = cache.get(ctx.project, ctx.env, run_id) if cache else None
+    if cached:
+        log(f"✓ 运行 #{run_id} 的版本号已缓存: {cached['tag']}", "SUCCESS")
+        return cached['tag']
+
+    log("等待构建完成(最长5分钟)...", "WAITING")
+    deadline = time.monotonic() + config.BUILD_TIMEOUT / 1000
+    with span('yunxiao_http.build_wait', run_id=run_id) as wait_span:
+        polls = 0
+        while True:
+            polls += 1
+            status = await asyncio.to_thread(client.run_status, pipeline_id, run_id)
+            if status == STATUS_SUCCESS:
+                log("构建已完成", "SUCCESS")
+                break
+            if status in FINISHED_FAILED_STATUSES:
+                raise Exception(f"构建失败: 运行 #{run_id} 状态为 {status}")
+            if time.monotonic() >= deadline:
+                raise Exception("构建超时")
+            record_fixed_wait("云效接口轮询间隔", config.YUNXIAO_API_POLL_INTERVAL)
+            await asyncio.sleep(config.YUNXIAO_API_POLL_INTERVAL)
+        wait_span.set(polls=polls)
+
+    with span('yunxiao_http.log'):
+        log_text = await asyncio.to_thread(client.run_log, pipeline_id, run_id, log_job_keyword or '')
+    match = re.search(ctx.tag_pattern or image_tag_pattern(), log_text)
+    if not match:
+        # 日志接口的返回格式可能与预期不同,由浏览器模式从日志弹窗读取
+        raise YunxiaoApiError(f"运行 #{run_id} 的日志中未找到版本号")
+
+    tag = match.group(1) if match.groups() else match.group(0)
+    log(f"✓ 从日志获取到版本号: {tag}", "SUCCESS")
+    if cache:
+        try:
+            await asyncio.to_thread(cache.put, ctx.project, ctx.env, tag, run_id)
+        except OSError as e:
+            log(f"写入版本号缓存失败(忽略): {str(e)}", "WARNING")
+    return tag
+
+
+async def trigger_build_and_fetch_tag(ctx: ExecutionContext, skip_trigger: bool = False) -> str:
+    """前端专用: 通过 HTTP 接口触发构建并获取 tag"""
+    return await _fetch_tag(ctx, skip_trigger, None)
+
+
+async def trigger_backend_build_and_fetch_tag(
+    ctx: ExecutionContext,
+    skip_trigger: bool = False,
+    log_job_keyword: str | None = None,
+) -> str:
+    """
+    后端专用: 通过 HTTP 接口触发构建并获取 tag
+
+    Args:
+        ctx: 任务执行上下文
+        skip_trigger: 是否跳过触发构建
+        log_job_keyword: 日志任务关键词(传给日志接口的 job 参数),未提供时使用 ctx.log_job_keyword
+    """
+    return await _fetch_tag(ctx, skip_trigger, log_job_keyword or ctx.log_job_keyword)
@@ -30,11 +30,13 @@ function App() {
   const projectMap: { [key: string]: any } = {
     'spms-web': {
       name: 'spms-web (前端)',
+      project: 'frontend',
       buildTask: 'frontend-build',
       deployTask: 'frontend-test'
     },
     'spms-server': {
       name: 'spms-server (后端)',
+      project: 'backend',
       buildTask: 'backend-build',
       deployTask: 'backend-test'
     }
@@ -44,8 +46,16 @@ function App() {
     const newSocket = io('http://localhost:5001');
     setSocket(newSocket);
 
+    // 服务端日志中的项目类型 -> 页面上的项目
+    const projectIdByType: { [key: string]: string } = {};
+    Object.entries(projectMap).forEach(([projectId, project]) => {
+      projectIdByType[project.project] = projectId;
+    });
+
     newSocket.on('connected', (data: any) => {
       console.log('WebSocket 已连接:', data);
+      // 只订阅页面上展示的项目的日志
+      newSocket.emit('subscribe', { projects: Object.keys(projectIdByType) });
       setNotification({ message: 'WebSocket 连接成功', type: 'success' });
     });
 
@@ -66,22 +76,31 @@ function App() {
       }
     });
 
-    newSocket.on('log', (data: any) => {
-      const message = data.message;
+    // 日志按批推送: 一批日志只更新一次状态,避免逐行重新渲染
+    newSocket.on('log_batch', (batch: { entries: any[]; dropped: number }) => {
+      const additions: Record<string, string[]> = {};
 
-      // 根据任务类型分配日志到对应项目
-      let projectId = '';
-      if (message.includes('frontend') || message.includes('前端')) {
-        projectId = 'spms-web';
-      } else if (message.includes('backend') || message.includes('后端')) {
-        projectId = 'spms-server';
-      }
+      batch.entries.forEach((data: any) => {
+        const message = data.message;
+
+        // 日志带有所属任务的项目类型
+        const projectId = data.project ? projectIdByType[data.project] : '';
 
-      if (projectId) {
-        setProjectLogs(prev => ({
-          ...prev,
-          [projectId]: [...prev[projectId], message]
-        }));
+        if (projectId) {
+          // 相邻重复的日志在服务端合并,repeat 为重复次数
+          const text = data.repeat > 1 ? `${message} (x${data.repeat})` : message;
+          additions[projectId] = [...(additions[projectId] || []), text];
+        }
+      });
+
+      if (Object.keys(additions).length > 0) {
+        setProjectLogs(prev => {
+          const next = { ...prev };
+          Object.entries(additions).forEach(([projectId, lines]) => {
+            next[projectId] = [...(prev[projectId] || []), ...lines];
+          });
+          return next;
+        });
       }
     });
 